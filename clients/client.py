@@ -0,0 +1,239 @@
+"""
+Shared HTTP client of DAF scripts.
+
+One keep-alive session with a connection pool is shared by all requests and threads of a script,
+so parallel uploads do not open a new connection per file. Idempotent requests are retried
+by urllib3, uploads are retried after 429/503 responses (throttling and the upload queue)
+and connection errors. Upload bodies are streamed from files by chunks, so large episodes
+are not loaded to memory.
+
+Settings are taken from the environment if they are not set:
+DAF_URL, DAF_USER, DAF_PASSWORD, HTTP_PROXY and HTTPS_PROXY.
+
+Requirements:
+    requests==2.28.1
+"""
+import mimetypes
+import os
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_URL = 'http://127.0.0.1:8002'
+USER_AGENT = 'daf-client/1.0'
+CHUNK_SIZE = 256 * 1024
+# known audio file extensions of the server, see MIME_TYPES setting
+AUDIO_EXTENSIONS = {'3gp', 'aac', 'm4a', 'm4b', 'mp3', 'oga', 'ogg', 'wav', 'weba'}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class ClientError(RuntimeError):
+
+    def __init__(self, message: str, status: int = 0, response: Union[Dict[str, Any], str, None] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.response = response
+
+
+class MultipartStream:
+    """
+    Body of multipart/form-data request which reads files by chunks.
+    Its length is known, so it is sent with Content-Length header instead of chunked encoding.
+    """
+
+    def __init__(self, fields: Dict[str, Any], files: Dict[str, Tuple[str, BinaryIO]]) -> None:
+        self.boundary = uuid.uuid4().hex
+        self._parts: List[Union[bytes, BinaryIO]] = []
+        self._length = 0
+
+        for name, value in fields.items():
+            if value is None:
+                continue
+            self._add(self._header(name) + b'\r\n\r\n' + str(value).encode() + b'\r\n')
+        for name, (filename, f) in files.items():
+            content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            header = self._header(name) + f'; filename="{self._quote(filename)}"\r\n'.encode()
+            self._add(header + f'Content-Type: {content_type}\r\n\r\n'.encode())
+            self._length += self._size(f)
+            self._parts.append(f)
+            self._add(b'\r\n')
+        self._add(f'--{self.boundary}--\r\n'.encode())
+        self._current = 0
+
+    @staticmethod
+    def _quote(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"')
+
+    @staticmethod
+    def _size(f: BinaryIO) -> int:
+        """Returns the size of the file rest."""
+        position = f.tell()
+        size = f.seek(0, os.SEEK_END) - position
+        f.seek(position)
+        return size
+
+    def _header(self, name: str) -> bytes:
+        return f'--{self.boundary}\r\nContent-Disposition: form-data; name="{self._quote(name)}"'.encode()
+
+    def _add(self, data: bytes) -> None:
+        self._parts.append(data)
+        self._length += len(data)
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        size = CHUNK_SIZE if size is None or size < 0 else size
+        while self._current < len(self._parts):
+            part = self._parts[self._current]
+            if isinstance(part, bytes):
+                self._parts[self._current] = part[size:]
+                if part:
+                    return part[:size]
+            elif chunk := part.read(size):
+                return chunk
+            self._current += 1
+        return b''
+
+
+class Client:
+    """DAF API and upload client, it is safe to share it by threads."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        pool_size: int = 4,
+        retries: int = 3,
+        timeout: float = 60,
+    ) -> None:
+        self.base_url = (base_url or os.getenv('DAF_URL') or DEFAULT_URL).rstrip('/')
+        self.retries = retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        user = user or os.getenv('DAF_USER')
+        if user:
+            self.session.auth = (user, password or os.getenv('DAF_PASSWORD') or '')
+        # HTTP_PROXY and HTTPS_PROXY are also used by the session itself, they are set explicitly for clarity
+        self.session.proxies.update({
+            scheme: proxy for scheme, proxy in (('http', os.getenv('HTTP_PROXY')), ('https', os.getenv('HTTPS_PROXY')))
+            if proxy
+        })
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods={'GET', 'HEAD'},
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    @staticmethod
+    def _result(resp: requests.Response) -> Dict[str, Any]:
+        """Returns JSON data of the response, ClientError is raised if the request failed."""
+        try:
+            data = resp.json()
+        except ValueError:
+            data = resp.text
+        if resp.status_code != 200:
+            message = data.get('message', '') if isinstance(data, dict) else data.strip()[:200]
+            raise ClientError(f'status={resp.status_code} {message}', resp.status_code, data)
+        if not isinstance(data, dict):
+            raise ClientError(f'unexpected response {data[:200]}', resp.status_code, data)
+        return data
+
+    def get(self, path_or_url: str, **params: Any) -> Dict[str, Any]:
+        url = path_or_url if '://' in path_or_url else f'{self.base_url}{path_or_url}'
+        try:
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ClientError(f'request {url} failed: {e}') from e
+        return self._result(resp)
+
+    def episodes(self, slug: str, limit: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yields all published episodes of the podcast from the newest one, pages are followed by "next" URLs."""
+        data = self.get(f'/podcast/api/{slug}/episodes', limit=limit)
+        yield from data['episodes']
+        while data.get('next'):
+            data = self.get(data['next'])
+            yield from data['episodes']
+
+    @staticmethod
+    def _delay(resp: Optional[requests.Response], attempt: int) -> float:
+        """Seconds to wait before the next upload attempt."""
+        if resp is not None and (value := resp.headers.get('Retry-After', '')).isdigit():
+            return float(value)
+        return 0.5 * 2 ** attempt
+
+    def upload(
+        self,
+        slug: str,
+        audio: BinaryIO,
+        title: str,
+        name: str = '',
+        author: str = '',
+        description: str = '',
+        public_image: str = '',
+        image: Optional[BinaryIO] = None,
+        publish: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Uploads the episode, files are streamed from their current positions.
+        They are read again by retries, so they have to be seekable.
+        """
+        url = f'{self.base_url}/podcast/{slug}/upload'
+        fields = {
+            'title': title,
+            'author': author,
+            'description': description,
+            'public_image': public_image,
+            'publish': publish,
+        }
+        files = {'audio': (name or os.path.basename(audio.name), audio)}
+        if image is not None:
+            files['image'] = (os.path.basename(image.name), image)
+        positions = {key: f.tell() for key, (_, f) in files.items()}
+
+        attempt = 0
+        while True:
+            for key, (_, f) in files.items():
+                f.seek(positions[key])
+            body = MultipartStream(fields, files)
+            resp = None
+            try:
+                resp = self.session.post(
+                    url, data=body, headers={'Content-Type': body.content_type}, timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries:
+                    raise ClientError(f'upload to {url} failed: {e}') from e
+            except requests.RequestException as e:
+                raise ClientError(f'upload to {url} failed: {e}') from e
+            else:
+                if resp.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return self._result(resp)
+            time.sleep(self._delay(resp, attempt))
+            attempt += 1
@@ -12,7 +12,8 @@ from dataclasses import dataclass
 
 import argparse
 import markdown
-import requests
+
+from client import Client, ClientError
 
 
 @dataclass(frozen=True)
@@ -38,36 +39,26 @@ class Uploader:
 
     def upload(self) -> None:
         """Uploads the episode to DAF."""
-        upload_url = f'{self.params.base_url}/podcast/{self.params.slug}/upload'
         description = markdown.markdown(self.params.description.read())
-
-        data = {
-            'title': self.params.title,
-            'public_image': self.params.public_image,
-            'author': self.params.author,
-            'description': description,
-            'publish': self.params.publish,
-        }
         name = self.params.name or os.path.basename(self.params.episode.name)
-        files = {'audio': (name, self.params.episode)}
-        if self.params.image:
-            files['image'] = (self.params.image.name, self.params.image)
-
-        auth = (self.params.user, self.params.password) if self.params.user else None
-        proxies = {
-            'http': os.getenv('HTTP_PROXY'),
-            'https': os.getenv('HTTPS_PROXY'),
-        }
-
-        print(f'start uploading {name} to {upload_url}')
-        resp = requests.post(upload_url, data=data, files=files, auth=auth, proxies=proxies)
-
-        json_statuses = {200, 400}
-        response = resp.json() if resp.status_code in json_statuses else resp.text
 
-        if resp.status_code != 200:
-            print(f'status={resp.status_code}\n{response}', file=sys.stderr)
-            sys.exit(1)
+        print(f'start uploading {name} to {self.params.base_url}/podcast/{self.params.slug}/upload')
+        with Client(self.params.base_url, self.params.user, self.params.password) as client:
+            try:
+                response = client.upload(
+                    self.params.slug,
+                    self.params.episode,
+                    title=self.params.title,
+                    name=name,
+                    author=self.params.author,
+                    description=description,
+                    public_image=self.params.public_image or '',
+                    image=self.params.image,
+                    publish=self.params.publish,
+                )
+            except ClientError as e:
+                print(f'{e}\n{e.response or ""}', file=sys.stderr)
+                sys.exit(1)
 
         print(response)
 
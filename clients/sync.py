@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Directory sync for DAF.
+
+Mirrors a local folder of audio files to a podcast: published episodes are listed by the JSON API,
+local files are compared with them by sizes and content hashes, and only new files are uploaded
+by parallel requests of one pooled session. A file is hashed only if an episode of the same size exists.
+Episode titles are file names without extensions, uploaded episodes are published unless -E is set.
+Unpublished episodes are not listed by the API, so their files are uploaded again.
+
+Requirements:
+    requests==2.28.1
+"""
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+from urllib.parse import unquote, urlsplit
+
+import argparse
+
+from client import AUDIO_EXTENSIONS, CHUNK_SIZE, Client, ClientError
+
+# length of content hashes of the server, see podcast.media.HASH_LENGTH
+HASH_LENGTH = 16
+
+
+@dataclass(frozen=True)
+class SyncParams:
+    base_url: Optional[str]
+    directory: str
+    slug: str
+    author: str
+    publish: bool
+    workers: int
+    dry_run: bool
+    user: Optional[str]
+    password: Optional[str]
+
+
+@dataclass(frozen=True)
+class Remote:
+    # None if sizes of some episodes are unknown, so every file is hashed
+    sizes: Optional[Set[int]]
+    hashes: Set[str]
+    # file names of episodes without content hashes, files of the same names are not uploaded
+    names: Set[str]
+
+
+def file_hash(path: str) -> str:
+    """Returns the content hash of the file as the server computes it."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+class DirectorySync:
+
+    def __init__(self, p: SyncParams) -> None:
+        self.params = p
+        self.client = Client(p.base_url, p.user, p.password, pool_size=max(p.workers, 1))
+
+    def local_files(self) -> List[str]:
+        """Audio files of the directory and its sub-directories in the name order."""
+        paths = []
+        for root, _, names in os.walk(self.params.directory):
+            for name in names:
+                if name.rsplit('.', 1)[-1].lower() in AUDIO_EXTENSIONS and not name.startswith('.'):
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    def remote(self) -> Remote:
+        sizes: Optional[Set[int]] = set()
+        hashes, names = set(), set()
+        for episode in self.client.episodes(self.params.slug):
+            if not episode['size']:
+                sizes = None
+            elif sizes is not None:
+                sizes.add(episode['size'])
+            if episode['hash']:
+                hashes.add(episode['hash'])
+            else:
+                names.add(os.path.basename(unquote(urlsplit(episode['audio']).path)))
+        return Remote(sizes, hashes, names)
+
+    @staticmethod
+    def is_new(path: str, remote: Remote) -> bool:
+        if os.path.basename(path) in remote.names:
+            return False
+        if remote.sizes is not None and os.path.getsize(path) not in remote.sizes:
+            return True  # the file is not hashed
+        return file_hash(path) not in remote.hashes
+
+    def upload(self, path: str) -> Optional[str]:
+        """Uploads the file, returns an error message if it failed."""
+        title = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, 'rb') as f:
+                self.client.upload(
+                    self.params.slug, f, title=title, author=self.params.author, publish=self.params.publish,
+                )
+        except (ClientError, OSError) as e:
+            return str(e)
+        print(f'uploaded {path}')
+        return None
+
+    def run(self) -> int:
+        """Main method, returns the number of failed uploads."""
+        with self.client:
+            paths = self.local_files()
+            remote = self.remote()
+            with ThreadPoolExecutor(max_workers=max(self.params.workers, 1)) as pool:
+                new = [path for path, is_new in zip(paths, pool.map(lambda p: self.is_new(p, remote), paths)) if is_new]
+                print(f'{len(paths)} local files, {len(new)} new ones')
+                if self.params.dry_run:
+                    for path in new:
+                        print(path)
+                    return 0
+                errors: Dict[str, str] = {
+                    path: error for path, error in zip(new, pool.map(self.upload, new)) if error is not None
+                }
+
+        for path, error in errors.items():
+            print(f'{path}: {error}', file=sys.stderr)
+        print(f'uploaded {len(new) - len(errors)} files, {len(errors)} failed')
+        return len(errors)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='DAF directory sync')
+    parser.add_argument('-b', dest='base_url', type=str, help='DAF base URL (default env DAF_URL)')
+    parser.add_argument('-s', dest='slug', type=str, required=True, help='podcast slug')
+    parser.add_argument('-a', dest='author', type=str, default='', help='episodes author')
+    parser.add_argument('-E', dest='unpublished', action='store_true', help='do not publish uploaded episodes')
+    parser.add_argument('-w', dest='workers', type=int, default=4, help='number of parallel uploads (default 4)')
+    parser.add_argument('-n', dest='dry_run', action='store_true', help='only print new files')
+    parser.add_argument('-u', dest='user', type=str, help='basic auth user (default env DAF_USER)')
+    parser.add_argument('-p', dest='password', type=str, help='basic auth password (default env DAF_PASSWORD)')
+
+    parser.add_argument('directory', type=str, help='local directory of audio files')
+    namespace = parser.parse_args()
+
+    params = SyncParams(
+        base_url=namespace.base_url,
+        directory=namespace.directory,
+        slug=namespace.slug,
+        author=namespace.author,
+        publish=not namespace.unpublished,
+        workers=namespace.workers,
+        dry_run=namespace.dry_run,
+        user=namespace.user,
+        password=namespace.password,
+    )
+
+    try:
+        failed = DirectorySync(params).run()
+    except ClientError as e:
+        print(f'sync error\n{e}', file=sys.stderr)
+        sys.exit(2)
+    sys.exit(1 if failed else 0)
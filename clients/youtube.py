@@ -26,7 +26,8 @@ from typing import Optional
 
 import argparse
 import markdown
-import requests
+
+from client import Client, ClientError
 
 
 @dataclass(frozen=True)
@@ -118,30 +119,23 @@ class YouTubeEpisodeHandler:
 
     def upload(self, filename: str) -> None:
         """Uploads the episode to DAF."""
-        upload_url = f'{self.base_url}/podcast/{self.slug}/upload'
-        data = {
-            'title': self.title,
-            'public_image': self.public_image,
-            'author': self.author,
-            'description': self.description,
-            'publish': self.publish,
-        }
-        auth = (self.user, self.password) if self.user else None
-        name = self.name or filename
-
-        print(f'start uploading to {upload_url}')
-        with open(filename, 'rb') as f:
-            files = {'audio': (name, f)}
-            if self.image:
-                files['image'] = (self.image.name, self.image)
-            resp = requests.post(upload_url, data=data, files=files, auth=auth)
-
-        json_statuses = {200, 400}
-        response = resp.json() if resp.status_code in json_statuses else resp.text
-
-        if resp.status_code != 200:
-            print(f'status={resp.status_code}\n{response}', file=sys.stderr)
-            sys.exit(1)
+        print(f'start uploading to {self.base_url}/podcast/{self.slug}/upload')
+        with Client(self.base_url, self.user, self.password) as client, open(filename, 'rb') as f:
+            try:
+                response = client.upload(
+                    self.slug,
+                    f,
+                    title=self.title,
+                    name=self.name or os.path.basename(filename),
+                    author=self.author or '',
+                    description=self.description,
+                    public_image=self.public_image or '',
+                    image=self.image,
+                    publish=self.publish,
+                )
+            except ClientError as e:
+                print(f'{e}\n{e.response or ""}', file=sys.stderr)
+                sys.exit(1)
 
         pprint(response, width=120)
 
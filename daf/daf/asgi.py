@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'daf.settings')
+# use native async feed and upload views
+os.environ.setdefault('DAF_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
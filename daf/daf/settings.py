@@ -9,6 +9,8 @@ https://docs.djangoproject.com/en/4.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
+import hashlib
+import os
 import sys
 from pathlib import Path
 
@@ -48,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'podcast.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'daf.urls'
@@ -113,8 +116,119 @@ USE_I18N = True
 
 USE_TZ = True
 
-# podcast TTL
+# podcast minimal TTL (minutes), every podcast TTL is calculated by its publish cadence
 PODCAST_TTL = '60'
+PODCAST_TTL_MAX = 24 * 60
+# TTL is this part of the median interval between the latest episodes
+PODCAST_TTL_CADENCE_RATIO = 0.25
+PODCAST_CADENCE_EPISODES = 20
+
+# rendered feeds cache timeout (seconds), feeds are also invalidated by podcast updates
+PODCAST_FEED_CACHE_TIMEOUT = 24 * 3600
+
+# feeds smaller than this size (bytes) are not compressed
+PODCAST_FEED_COMPRESS_MIN_SIZE = 512
+
+# interval (seconds) of adding every process metrics and analytics to the shared database counters
+PODCAST_FLUSH_INTERVAL = 10
+PODCAST_FLUSH_BATCH_SIZE = 500
+
+# share of all requests (0.0-1.0) to profile, reports are available in the admin
+PODCAST_PROFILE_SAMPLE_RATE = 0.0
+
+# lifetime (seconds) of signed profiling headers, see "manage.py profile_token"
+PODCAST_PROFILE_TOKEN_MAX_AGE = 24 * 3600
+
+# number of functions in the text profiling report
+PODCAST_PROFILE_STATS_LINES = 50
+
+# episodes audio files are read by chunks of this size (bytes)
+PODCAST_MEDIA_CHUNK_SIZE = 256 * 1024
+
+# levels of hashed sub-directories of new audio files and images, for example
+# episodes/<slug>/ab/cd/audio.mp3 with 2, 0 is a flat directory;
+# existing files are moved by "shard_media" command after it is changed
+PODCAST_MEDIA_SHARD_DEPTH = 0
+
+# audio files and images are sent by nginx using X-Accel-Redirect with this location prefix,
+# its "internal" nginx location is aliased to MEDIA_ROOT (see README);
+# files are streamed by the application only with DEBUG or an empty value, without nginx
+PODCAST_MEDIA_ACCEL_REDIRECT = '/protected-media/'
+
+# S3 compatible object storage of media files, it is used with
+# STORAGES = {'default': {'BACKEND': 'podcast.storage.S3Storage'}, ...} and boto3 installed,
+# existing files are copied by "move_media" command; empty keys are taken from the environment
+PODCAST_S3_BUCKET = ''
+PODCAST_S3_ENDPOINT_URL = ''  # MinIO or another service, AWS if empty
+PODCAST_S3_REGION = ''
+PODCAST_S3_ACCESS_KEY = ''
+PODCAST_S3_SECRET_KEY = ''
+PODCAST_S3_PREFIX = ''  # prefix of object keys
+# public bucket or CDN URL of objects, presigned URLs are used if it is empty
+PODCAST_S3_PUBLIC_URL = ''
+# lifetime of presigned URLs (seconds), they are cached for a half of it
+PODCAST_S3_URL_EXPIRES = 6 * 3600
+# part size of multipart uploads (bytes, 5 MiB at least) and parallel parts of a file
+PODCAST_S3_CHUNK_SIZE = 8 * 1024 * 1024
+PODCAST_S3_WORKERS = 4
+
+# feeds refer to optimized local copies of public images of podcasts and episodes,
+# they are fetched by "cache_artwork" command and fetched again after PODCAST_ARTWORK_REFRESH seconds
+PODCAST_ARTWORK_CACHE = False
+PODCAST_ARTWORK_REFRESH = 7 * 24 * 3600
+# delay (seconds) of the first retry of a failed image, it is doubled by every next failure
+PODCAST_ARTWORK_RETRY = 3600
+PODCAST_ARTWORK_TIMEOUT = 10
+# larger remote images are not stored (bytes), larger sides are scaled down (pixels)
+PODCAST_ARTWORK_MAX_SIZE = 10 * 1024 * 1024
+PODCAST_ARTWORK_MAX_DIMENSION = 3000
+
+# episodes beyond retention policies of podcasts are archived by "apply_retention" command,
+# the podcast feed links pages of this number of archived episodes
+PODCAST_ARCHIVE_PAGE_SIZE = 100
+# media sub-directory of audio files of archived episodes, see "apply_retention --move"
+PODCAST_ARCHIVE_DIRECTORY = 'archive'
+# if set, moved audio files are re-encoded by ffmpeg with this bitrate, for example '64k',
+# a smaller file is kept only
+PODCAST_ARCHIVE_BITRATE = ''
+
+# requests limits of every client (IP and user agent) per scope: (requests, seconds),
+# a scope is not limited if it is absent, "feed" limits are counted per feed URL; for example
+# {'feed': (30, 3600), 'audio': (600, 600), 'api': (600, 600)}
+PODCAST_THROTTLE_RATES = {}
+# shared buckets file of all processes of this instance, it is better to keep it in tmpfs
+PODCAST_THROTTLE_FILE = os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp',
+    f'daf-throttle-{hashlib.sha256(str(BASE_DIR).encode()).hexdigest()[:12]}',
+)
+PODCAST_THROTTLE_SLOTS = 65536
+# request header with the client IP set by a proxy, for example 'X-Real-IP'
+PODCAST_THROTTLE_IP_HEADER = ''
+
+# limit of concurrent uploads of all processes, an upload waits for a free slot
+# up to the timeout (seconds, it occupies a sync worker), then 503 response is returned
+PODCAST_UPLOAD_CONCURRENCY = 1
+PODCAST_UPLOAD_QUEUE_TIMEOUT = 3
+PODCAST_UPLOAD_RETRY_AFTER = 30
+PODCAST_UPLOAD_SLOTS_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else '/tmp'
+
+# max number of episodes of a batch upload request
+PODCAST_BATCH_MAX_ITEMS = 100
+
+# JSON API page size: default and max values of "limit" parameter
+PODCAST_API_PAGE_SIZE = 100
+PODCAST_API_MAX_PAGE_SIZE = 1000
+# deleted podcasts and episodes are kept for sync clients this number of days,
+# clients with older "since" values have to fetch all episodes again
+PODCAST_API_TOMBSTONE_DAYS = 90
+
+# waveform previews of the admin: ffmpeg executable decoding audio files
+# and number of min/max pairs of every episode, numpy is required to compute them
+PODCAST_FFMPEG = 'ffmpeg'
+PODCAST_WAVEFORM_PEAKS = 200
+
+# native async feed and upload views, enabled by daf.asgi
+PODCAST_ASYNC_VIEWS = os.environ.get('DAF_ASYNC_VIEWS') == '1'
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.0/howto/static-files/
@@ -4,6 +4,10 @@ from django.contrib import admin
 from django.http import HttpResponse
 from django.urls import include, path
 
+from podcast.metrics import instrument
+from podcast.throttling import throttle
+from podcast.views import audio, metrics_export, versioned_media
+
 
 def index(_) -> HttpResponse:
     return HttpResponse(b'Django Audio Feed')
@@ -12,6 +16,24 @@ def index(_) -> HttpResponse:
 urlpatterns = [
     path('', index, name='index'),
     path('podcast/', include('podcast.urls')),
+    path('metrics', metrics_export, name='metrics'),
+    # served before static media to count downloads
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}episodes/<path:name>',
+        instrument('audio')(throttle('audio')(audio)),
+        name='audio',
+    ),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}{settings.PODCAST_ARCHIVE_DIRECTORY}/<path:name>',
+        instrument('audio')(throttle('audio')(audio)),
+        {'directory': settings.PODCAST_ARCHIVE_DIRECTORY},
+        name='archive_audio',
+    ),
+    path(
+        f'{settings.MEDIA_URL.lstrip("/")}h/<str:digest>/<path:name>',
+        instrument('versioned_media')(throttle('audio')(versioned_media)),
+        name='versioned_media',
+    ),
     path('admin/', admin.site.urls),
 ]
 
@@ -1,31 +1,286 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.db.models import Sum
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html
+from django.views.decorators.http import require_POST
 
-from .models import CustomFeed, Episode, Podcast
+from . import backup, bulk, search
+from .forms import MoveEpisodesForm
+from .middleware import PROFILE_SESSION_KEY
+from .models import (
+    AggregateFeed, CustomFeed, Episode, EpisodeDownload, FeedPoll, Podcast, ProfileReport, RemoteImage,
+    ThrottledClient,
+)
+from .pagination import KeysetChangeList
 
 
-class PodcastAdmin(admin.ModelAdmin):
-    list_display = ['title', 'link', 'feed', 'image', 'description', 'created']
+class FullTextSearchMixin:
+    """Searches by the full-text index instead of LIKE scans of every row."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        return search.search(queryset, search_term), False
+
+
+class KeysetPaginationMixin:
+    """Change list pages without COUNT queries for large tables."""
+    change_list_template = 'admin/podcast/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class PodcastAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    list_display = [
+        'title', 'link', 'feed', 'episode_count', 'total_size_display', 'latest_published', 'archive', 'created',
+    ]
     prepopulated_fields = {'slug': ('title',)}
     search_fields = ('title', 'description')
     list_filter = ['created']
+    readonly_fields = [
+        'ttl', 'update_period', 'update_frequency', 'episode_count', 'total_size_display', 'latest_published',
+        'archived_count',
+    ]
 
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/export/',
+                self.admin_site.admin_view(self.export_view),
+                name='podcast_podcast_export',
+            ),
+        ]
+        return urls + super().get_urls()
 
-class EpisodeAdmin(admin.ModelAdmin):
+    @admin.display(description='archive')
+    def archive(self, obj: Podcast) -> str:
+        url = reverse('admin:podcast_podcast_export', args=[obj.pk])
+        return format_html('<a href="{}">tar</a>', url)
+
+    def export_view(self, request, pk: int) -> HttpResponse:
+        """Streams the podcast archive, it is not staged in memory or on disk."""
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        podcast = get_object_or_404(Podcast, pk=pk)
+        response = StreamingHttpResponse(backup.stream(podcast), content_type='application/x-tar')
+        response.headers['Content-Disposition'] = f'attachment; filename="{podcast.slug}.tar"'
+        return response
+
+
+class EpisodeAdmin(FullTextSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
     list_display = ['title', 'audio', 'size', 'play', 'published', 'created']
     search_fields = ('title', 'description')
     list_select_related = ['podcast']
-    list_filter = ['created', 'podcast', 'published']
+    list_filter = ['created', 'podcast', 'published', 'archived']
     list_per_page = 20
-    list_max_show_all = 200
+    readonly_fields = ['audio_size']
+    actions = ['publish', 'unpublish', 'archive', 'unarchive', 'move']
+
+    class Media:
+        js = ['podcast/player.js']
+
+    def delete_model(self, request, obj: Episode) -> None:
+        bulk.delete(Episode.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset) -> None:
+        """Used by "delete selected" action, files are removed after the commit."""
+        bulk.delete(queryset)
+
+    @admin.action(description='Publish selected episodes now', permissions=['change'])
+    def publish(self, request, queryset) -> None:
+        count = bulk.publish(queryset)
+        self.message_user(request, f'{count} episodes were published', messages.SUCCESS)
+
+    @admin.action(description='Unpublish selected episodes', permissions=['change'])
+    def unpublish(self, request, queryset) -> None:
+        count = bulk.unpublish(queryset)
+        self.message_user(request, f'{count} episodes were unpublished', messages.SUCCESS)
+
+    @admin.action(description='Move selected episodes to the archive feed', permissions=['change'])
+    def archive(self, request, queryset) -> None:
+        count = bulk.archive(queryset)
+        self.message_user(request, f'{count} episodes were archived', messages.SUCCESS)
+
+    @admin.action(description='Return selected episodes to the podcast feed', permissions=['change'])
+    def unarchive(self, request, queryset) -> None:
+        count = bulk.unarchive(queryset)
+        self.message_user(request, f'{count} episodes were returned from the archive', messages.SUCCESS)
+
+    @admin.action(description='Move selected episodes to another podcast', permissions=['change'])
+    def move(self, request, queryset):
+        form = MoveEpisodesForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            podcast = form.cleaned_data['podcast']
+            count = bulk.move(queryset, podcast)
+            self.message_user(request, f'{count} episodes were moved to "{podcast}"', messages.SUCCESS)
+            return None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Move episodes',
+            'opts': self.opts,
+            'form': form,
+            'queryset': queryset,
+            'action_checkbox_name': ACTION_CHECKBOX_NAME,
+        }
+        return TemplateResponse(request, 'admin/podcast/episode/move.html', context)
 
 
 class CustomFeedAdmin(admin.ModelAdmin):
-    list_display = ['podcast', 'title', 'feed', 'created']
+    list_display = ['podcast', 'title', 'feed', 'keywords', 'max_items', 'created']
     search_fields = ('title',)
     list_select_related = ['podcast']
     list_filter = ['podcast', 'created']
+    raw_id_fields = ['include', 'exclude']
+
+
+class AggregateFeedAdmin(admin.ModelAdmin):
+    list_display = ['title', 'feed', 'max_items', 'created']
+    prepopulated_fields = {'slug': ('title',)}
+    search_fields = ('title', 'description')
+    filter_horizontal = ['podcasts']
+
+
+class RemoteImageAdmin(admin.ModelAdmin):
+    """Local copies of public images, they are managed by "cache_artwork" command."""
+    list_display = ['url', 'image', 'size', 'fetched', 'expires', 'failures', 'error']
+    list_filter = ['fetched', 'failures']
+    search_fields = ('url',)
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+    def has_delete_permission(self, request, obj=None) -> bool:
+        return False
+
+
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ['path', 'method', 'status', 'reason', 'duration', 'queries', 'sql_duration', 'download', 'created']
+    list_filter = ['reason', 'status', 'created']
+    search_fields = ('path',)
+    exclude = ['profile']
+    readonly_fields = [
+        'method', 'path', 'status', 'reason', 'duration', 'queries', 'sql_duration', 'sql', 'stats', 'download',
+    ]
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='podcast_profilereport_download',
+            ),
+            path(
+                'toggle/',
+                self.admin_site.admin_view(self.toggle_view),
+                name='podcast_profilereport_toggle',
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk: int) -> HttpResponse:
+        """Raw cProfile stats of the report."""
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        report = get_object_or_404(ProfileReport, pk=pk)
+        response = HttpResponse(bytes(report.profile), content_type='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{report.pk}.prof"'
+        return response
+
+    @method_decorator(require_POST)
+    def toggle_view(self, request) -> HttpResponse:
+        """Enables or disables profiling of all requests of the current admin session."""
+        enabled = not request.session.get(PROFILE_SESSION_KEY, False)
+        request.session[PROFILE_SESSION_KEY] = enabled
+        self.message_user(
+            request,
+            'requests profiling is enabled for this session' if enabled else 'requests profiling is disabled',
+            messages.SUCCESS,
+        )
+        return HttpResponseRedirect(reverse('admin:podcast_profilereport_changelist'))
+
+
+class StatsAdmin(admin.ModelAdmin):
+    """Read-only daily counters with totals of the filtered rows."""
+    change_list_template = 'admin/podcast/stats_change_list.html'
+    date_hierarchy = 'day'
+    # lookups and their column names
+    summary_group: dict[str, str] = {}
+    summary_values: dict[str, str] = {}
+    summary_limit = 20
+
+    def has_add_permission(self, request) -> bool:
+        return False
+
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        try:
+            queryset = response.context_data['cl'].queryset
+        except (AttributeError, KeyError):
+            return response
+
+        first_value = next(iter(self.summary_values))
+        rows = queryset.order_by().values(*self.summary_group).annotate(
+            **{f'total_{name}': Sum(name) for name in self.summary_values},
+        ).order_by(f'-total_{first_value}')[:self.summary_limit]
+
+        response.context_data['summary_columns'] = [*self.summary_group.values(), *self.summary_values.values()]
+        response.context_data['summary_rows'] = [
+            [row[c] for c in self.summary_group] + [row[f'total_{c}'] for c in self.summary_values]
+            for row in rows
+        ]
+        return response
+
+
+class FeedPollAdmin(StatsAdmin):
+    list_display = ['day', 'podcast', 'custom_feed', 'user_agent', 'count']
+    list_select_related = ['podcast', 'custom_feed']
+    list_filter = ['podcast', 'day']
+    search_fields = ('user_agent',)
+    summary_group = {'podcast__title': 'podcast', 'custom_feed__title': 'custom feed'}
+    summary_values = {'count': 'polls'}
+
+
+class EpisodeDownloadAdmin(StatsAdmin):
+    list_display = ['day', 'episode', 'count', 'bytes']
+    list_select_related = ['episode__podcast']
+    list_filter = ['episode__podcast', 'day']
+    summary_group = {'episode__podcast__title': 'podcast', 'episode__title': 'episode'}
+    summary_values = {'count': 'requests', 'bytes': 'bytes'}
+
+
+class ThrottledClientAdmin(StatsAdmin):
+    list_display = ['day', 'scope', 'client', 'user_agent', 'count']
+    list_filter = ['scope', 'day']
+    search_fields = ('client', 'user_agent')
+    summary_group = {'scope': 'scope', 'client': 'client', 'user_agent': 'user agent'}
+    summary_values = {'count': 'rejected requests'}
 
 
 admin.site.register(Podcast, PodcastAdmin)
 admin.site.register(Episode, EpisodeAdmin)
 admin.site.register(CustomFeed, CustomFeedAdmin)
+admin.site.register(AggregateFeed, AggregateFeedAdmin)
+admin.site.register(RemoteImage, RemoteImageAdmin)
+admin.site.register(ProfileReport, ProfileReportAdmin)
+admin.site.register(FeedPoll, FeedPollAdmin)
+admin.site.register(EpisodeDownload, EpisodeDownloadAdmin)
+admin.site.register(ThrottledClient, ThrottledClientAdmin)
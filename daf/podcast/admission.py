@@ -0,0 +1,93 @@
+"""
+Uploads admission control.
+
+Concurrent uploads of all processes are limited by a set of lock files,
+so long uploads cannot occupy every worker and block feed requests.
+A request waits for a free slot and gets 503 response after a timeout.
+"""
+import asyncio
+import fcntl
+import functools
+import os
+import time
+from typing import Callable, Optional
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+POLL_INTERVAL = 0.05  # seconds
+
+
+def _slot_path(i: int) -> str:
+    return os.path.join(settings.PODCAST_UPLOAD_SLOTS_DIR, f'daf-upload-{i}.lock')
+
+
+def try_acquire() -> Optional[int]:
+    """Returns a locked file descriptor of a free upload slot, or None if all slots are busy."""
+    for i in range(settings.PODCAST_UPLOAD_CONCURRENCY):
+        fd = os.open(_slot_path(i), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+    return None
+
+
+def release(fd: int) -> None:
+    fcntl.flock(fd, fcntl.LOCK_UN)
+    os.close(fd)
+
+
+def acquire(timeout: float) -> Optional[int]:
+    deadline = time.monotonic() + timeout
+    while (fd := try_acquire()) is None and time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+    return fd
+
+
+async def aacquire(timeout: float) -> Optional[int]:
+    deadline = time.monotonic() + timeout
+    while (fd := try_acquire()) is None and time.monotonic() < deadline:
+        await asyncio.sleep(POLL_INTERVAL)
+    return fd
+
+
+def _unavailable() -> HttpResponse:
+    response = JsonResponse(
+        {
+            'status': 'error',
+            'message': 'too many concurrent uploads',
+            'code': 'unavailable',
+        },
+        status=503,
+    )
+    response.headers['Retry-After'] = str(settings.PODCAST_UPLOAD_RETRY_AFTER)
+    return response
+
+
+def admit(view: Callable) -> Callable:
+    """Decorator for sync and async upload views which limits their concurrency."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if (fd := await aacquire(settings.PODCAST_UPLOAD_QUEUE_TIMEOUT)) is None:
+                return _unavailable()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                release(fd)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (fd := acquire(settings.PODCAST_UPLOAD_QUEUE_TIMEOUT)) is None:
+            return _unavailable()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            release(fd)
+
+    return wrapper
@@ -0,0 +1,28 @@
+"""Feed polls and audio downloads statistics, counters are written in batches."""
+from django.utils import timezone
+
+from .buffers import CounterBuffer
+from .models import EpisodeDownload, FeedPoll, Podcast
+
+_polls = CounterBuffer(FeedPoll, ('day', 'podcast_id', 'custom_feed_id', 'user_agent'), ('count',))
+_downloads = CounterBuffer(EpisodeDownload, ('day', 'episode_id'), ('count', 'bytes'))
+
+USER_AGENT_MAX_LENGTH = FeedPoll._meta.get_field('user_agent').max_length
+
+
+def feed_poll(request, podcast: Podcast) -> None:
+    """Counts a poll of the podcast feed or its custom feed."""
+    custom_feed = getattr(podcast, 'custom_feed', None)
+    user_agent = request.headers.get('User-Agent', '')[:USER_AGENT_MAX_LENGTH]
+    key = (timezone.localdate(), podcast.id, custom_feed.id if custom_feed else None, user_agent)
+    _polls.add(key, 1)
+
+
+def download(episode_id: int, sent: int) -> None:
+    """Counts an episode audio request and its sent bytes."""
+    _downloads.add((timezone.localdate(), episode_id), 1, sent)
+
+
+def flush() -> None:
+    _polls.flush()
+    _downloads.flush()
@@ -0,0 +1,260 @@
+"""
+JSON API for sync clients.
+
+Lists are paginated by keysets, so every page is an index range scan
+regardless of its position. A "since" request returns only podcasts or episodes
+changed after the previous sync and slugs or IDs of deleted ones. The last page of a list
+contains a new "since" value for the next sync.
+Search results are ranked by relevance, so they are paginated by offsets.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from django.views.decorators.http import require_safe
+
+from . import metrics, search as fulltext
+from .models import Episode, EpisodeTombstone, Podcast, PodcastTombstone
+
+Position = Tuple[datetime, Optional[int]]
+
+
+class InvalidParameter(ValueError):
+    pass
+
+
+class SinceExpired(InvalidParameter):
+    """Tombstones of the requested period are already removed."""
+
+
+def _error(message: str, code: str = 'invalid_data', status: int = 400) -> JsonResponse:
+    return JsonResponse({'status': 'error', 'message': message, 'code': code}, status=status)
+
+
+def _expired() -> JsonResponse:
+    return _error('"since" is too old, all items have to be fetched again', 'expired', 410)
+
+
+def _datetime(value: str) -> datetime:
+    result = parse_datetime(value)
+    if result is None:
+        raise InvalidParameter(f'invalid datetime "{value}"')
+    return timezone.make_aware(result) if timezone.is_naive(result) else result
+
+
+def _encode_cursor(position: Position, since: datetime) -> str:
+    data = json.dumps([position[0].isoformat(), position[1], since.isoformat()])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(value: str) -> Tuple[Position, datetime]:
+    try:
+        data = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+        moment, pk, since = json.loads(data)
+        return (_datetime(moment), int(pk)), _datetime(since)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise InvalidParameter('invalid cursor') from e
+
+
+def _limit(request) -> int:
+    try:
+        limit = int(request.GET.get('limit', settings.PODCAST_API_PAGE_SIZE))
+    except ValueError:
+        raise InvalidParameter('invalid limit')
+    return min(max(limit, 1), settings.PODCAST_API_MAX_PAGE_SIZE)
+
+
+def _start(request) -> Tuple[Optional[Position], datetime, bool]:
+    """Returns a position to start the page after, the sync start time and the delta mode flag."""
+    if cursor := request.GET.get('cursor'):
+        position, sync_start = _decode_cursor(cursor)
+        return position, sync_start, 'since' in request.GET
+    if since := request.GET.get('since'):
+        since = _datetime(since)
+        if since < timezone.now() - timedelta(days=settings.PODCAST_API_TOMBSTONE_DAYS):
+            raise SinceExpired(since)
+        return (since, None), timezone.now(), True
+    return None, timezone.now(), False
+
+
+def _keyset(queryset: QuerySet, ordering: Tuple[str, str], position: Optional[Position]) -> QuerySet:
+    """Orders the queryset by two fields ("-" prefix is descending order) and filters rows after the position."""
+    (first, first_op), (second, second_op) = ((f.lstrip('-'), 'lt' if f.startswith('-') else 'gt') for f in ordering)
+    if position:
+        moment, pk = position
+        condition = Q(**{f'{first}__{first_op}': moment})
+        if pk is not None:
+            condition |= Q(**{first: moment, f'{second}__{second_op}': pk})
+        queryset = queryset.filter(condition)
+    return queryset.order_by(*ordering)
+
+
+def _page(request, queryset: QuerySet, ordering: Tuple[str, str]) -> Dict[str, Any]:
+    """Returns the page rows and pagination fields of the response."""
+    position, sync_start, delta = _start(request)
+    limit = _limit(request)
+    rows = list(_keyset(queryset, ordering, position)[:limit + 1])
+
+    result: Dict[str, Any] = {'rows': rows[:limit], 'position': position, 'end': None, 'next': None, 'since': None}
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        result['end'] = getattr(last, ordering[0].lstrip('-'))
+        params = {'cursor': _encode_cursor((result['end'], last.pk), sync_start), 'limit': limit}
+        if delta:
+            params['since'] = '1'
+        result['next'] = request.build_absolute_uri(f'{request.path}?{urlencode(params)}')
+    else:
+        result['since'] = sync_start.isoformat()
+    return result
+
+
+def _podcast(obj: Podcast) -> Dict[str, Any]:
+    return {
+        'slug': obj.slug,
+        'title': obj.title,
+        'subtitle': obj.subtitle,
+        'author': obj.author,
+        'description': obj.description,
+        'link': obj.link,
+        'image': obj.image_url,
+        'feed': obj.abs_url(obj.get_absolute_url()),
+        'ttl': obj.ttl,
+        'updated': obj.updated.isoformat(),
+    }
+
+
+def _episode(podcast: Podcast, obj: Episode) -> Dict[str, Any]:
+    return {
+        'id': obj.pk,
+        'title': obj.title,
+        'author': obj.author or podcast.author,
+        'description': obj.description,
+        'image': podcast.abs_url(obj.versioned_image_url) if obj.image else obj.public_image,
+        'audio': podcast.abs_url(obj.versioned_audio_url),
+        'mime_type': obj.mime_type,
+        'size': obj.audio_size,
+        'hash': obj.audio_hash,
+        'published': obj.published.isoformat() if obj.published else None,
+        'archived': obj.archived.isoformat() if obj.archived else None,
+        'updated': obj.updated.isoformat(),
+    }
+
+
+def _response(page: Dict[str, Any], **data: Any) -> JsonResponse:
+    return JsonResponse({**data, 'next': page['next'], 'since': page['since']})
+
+
+@require_safe
+def podcasts(request) -> HttpResponse:
+    """
+    Podcasts ordered by their update time. Every episode change updates its podcast,
+    so "since" requests return podcasts to be synced and slugs of podcasts deleted after that time.
+    A slug can be deleted and created again within one sync, so deletions are applied first.
+    """
+    try:
+        page = _page(request, Podcast.objects.all(), ('updated', 'id'))
+    except SinceExpired:
+        return _expired()
+    except InvalidParameter as e:
+        return _error(str(e))
+
+    items = []
+    for obj in page['rows']:
+        obj.set_request(request)
+        items.append(_podcast(obj))
+    data: Dict[str, Any] = {'podcasts': items}
+    if 'since' in request.GET:
+        data['deleted'] = _deleted(PodcastTombstone.objects.all(), 'slug', page)
+    return _response(page, **data)
+
+
+@require_safe
+def episodes(request, podcast: str) -> HttpResponse:
+    """
+    Published episodes from the newest to the oldest one, as in the feed.
+    A "since" request returns all episodes changed after that time ordered by their update time,
+    unpublished ones only as their IDs with null "published" value, and IDs of episodes deleted after that time.
+    """
+    try:
+        obj = Podcast.objects.get(slug=podcast)
+    except Podcast.DoesNotExist:
+        if PodcastTombstone.objects.filter(slug=podcast).exists():
+            return _error('podcast is deleted', 'deleted', 410)
+        return _error('podcast does not exist', 'not_found', 404)
+
+    metrics.set_podcast(obj.slug)
+    obj.set_request(request)
+    queryset = Episode.objects.filter(podcast=obj)
+    delta = 'since' in request.GET
+    try:
+        if delta:
+            page = _page(request, queryset, ('updated', 'id'))
+        else:
+            # the same order as the feed
+            page = _page(request, queryset.filter(published__isnull=False), ('-published', 'id'))
+    except SinceExpired:
+        return _expired()
+    except InvalidParameter as e:
+        return _error(str(e))
+
+    items = [
+        # the endpoint is public, so unpublished drafts are only withdrawn by their IDs
+        _episode(obj, e) if e.published else {'id': e.pk, 'published': None}
+        for e in page['rows']
+    ]
+    data: Dict[str, Any] = {'podcast': obj.slug, 'episodes': items}
+    if delta:
+        data['deleted'] = _deleted(EpisodeTombstone.objects.filter(podcast=obj), 'episode_id', page)
+    return _response(page, **data)
+
+
+def _deleted(tombstones: QuerySet, field: str, page: Dict[str, Any]) -> List[Any]:
+    """Slugs or IDs of tombstones deleted within the time window of the page."""
+    tombstones = tombstones.filter(deleted__gt=page['position'][0])
+    if page['end'] is not None:
+        tombstones = tombstones.filter(deleted__lte=page['end'])
+    return list(tombstones.order_by('deleted', field).values_list(field, flat=True))
+
+
+@require_safe
+def search(request) -> HttpResponse:
+    """Podcasts or published episodes found by the "q" text, the best matches are first."""
+    text = request.GET.get('q', '').strip()
+    kind = request.GET.get('type', 'episode')
+    if not text:
+        return _error('"q" is required')
+    if kind not in ('episode', 'podcast'):
+        return _error('"type" must be "episode" or "podcast"')
+    try:
+        limit = _limit(request)
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except InvalidParameter as e:
+        return _error(str(e))
+    except ValueError:
+        return _error('invalid offset')
+
+    if kind == 'podcast':
+        queryset = Podcast.objects.all()
+    else:
+        queryset = Episode.objects.filter(published__isnull=False).select_related('podcast')
+    rows = fulltext.ranked(queryset, text, limit + 1, offset)
+
+    items = []
+    for obj in rows[:limit]:
+        podcast = obj if kind == 'podcast' else obj.podcast
+        podcast.set_request(request)
+        items.append(_podcast(obj) if kind == 'podcast' else {**_episode(podcast, obj), 'podcast': podcast.slug})
+
+    next_url = None
+    if len(rows) > limit:
+        params = {'q': text, 'type': kind, 'limit': limit, 'offset': offset + limit}
+        next_url = request.build_absolute_uri(f'{request.path}?{urlencode(params)}')
+    return JsonResponse({'results': items, 'next': next_url})
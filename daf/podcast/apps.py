@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class PodcastConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'podcast'
+
+    def ready(self) -> None:
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import search, signals  # noqa F401
+        from .metrics import install_queries_counter
+        from .middleware import install_queries_capture
+
+        connection_created.connect(install_queries_counter)
+        connection_created.connect(install_queries_capture)
+        # a migration can rebuild a table and drop its search triggers
+        post_migrate.connect(search.install, sender=self)
@@ -0,0 +1,98 @@
+"""
+Local copies of remote public images.
+
+Public images of podcasts and episodes are fetched once by "cache_artwork" command,
+they are scaled down to PODCAST_ARTWORK_MAX_DIMENSION and optimized, so clients
+get them from the application media instead of slow or rate-limited origins.
+Copies are refreshed by conditional requests, a failed fetch keeps the previous copy.
+"""
+import io
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import requests
+from PIL import Image
+
+# formats supported by podcast clients and their file extensions
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png'}
+JPEG_QUALITY = 85
+READ_SIZE = 64 * 1024
+USER_AGENT = 'daf-artwork/1.0'
+
+
+class ArtworkError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Fetched:
+    content: bytes
+    extension: str
+    etag: str
+    last_modified: str
+
+
+def optimize(content: bytes, max_dimension: int) -> Tuple[bytes, str]:
+    """Returns the scaled down and optimized JPEG or PNG image with its extension."""
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image.load()
+            source = image.format
+            if source in FORMATS:
+                target = source
+            else:
+                target = 'PNG' if 'A' in image.getbands() or 'transparency' in image.info else 'JPEG'
+            resized = max(image.size) > max_dimension
+            if resized:
+                image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+            if target == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            out = io.BytesIO()
+            options = {'quality': JPEG_QUALITY} if target == 'JPEG' else {}
+            image.save(out, target, optimize=True, **options)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ArtworkError(f'invalid image: {e}') from e
+
+    result = out.getvalue()
+    if not resized and target == source and len(content) <= len(result):
+        result = content  # the original is already optimized
+    return result, FORMATS[target]
+
+
+def fetch(
+    url: str,
+    etag: str = '',
+    last_modified: str = '',
+    timeout: float = 10,
+    max_size: int = 10 * 1024 * 1024,
+    max_dimension: int = 3000,
+) -> Optional[Fetched]:
+    """Downloads and optimizes the image, None is returned if it is not modified."""
+    headers = {'User-Agent': USER_AGENT}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    chunks, size = [], 0
+    try:
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                return None
+            if response.status_code != 200:
+                raise ArtworkError(f'HTTP status {response.status_code}')
+            if int(response.headers.get('Content-Length') or 0) > max_size:
+                raise ArtworkError(f'image is larger than {max_size} bytes')
+            # the length header can be absent or wrong
+            for chunk in response.iter_content(READ_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise ArtworkError(f'image is larger than {max_size} bytes')
+                chunks.append(chunk)
+            etag, last_modified = response.headers.get('ETag', ''), response.headers.get('Last-Modified', '')
+    except requests.RequestException as e:
+        raise ArtworkError(f'failed to fetch: {e}') from e
+
+    content, extension = optimize(b''.join(chunks), max_dimension)
+    return Fetched(content, extension, etag[:255], last_modified[:64])
@@ -0,0 +1,303 @@
+"""
+Podcast backup archives.
+
+An archive is an uncompressed tar stream with members:
+podcast.json, episodes.jsonl, custom_feeds.jsonl and media/<storage name> files.
+It is written block by block, so large podcasts are exported in constant memory
+and the stream can be sent as a response without staging it on disk.
+"""
+import hashlib
+import json
+import os
+import tarfile
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, models, transaction
+
+from . import selection
+from .media import HASH_LENGTH, file_chunks, is_local
+from .models import CustomFeed, Episode, Podcast
+
+PODCAST_MEMBER = 'podcast.json'
+EPISODES_MEMBER = 'episodes.jsonl'
+CUSTOM_FEEDS_MEMBER = 'custom_feeds.jsonl'
+MEDIA_PREFIX = 'media/'
+SPOOL_SIZE = 1024 * 1024
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def _fields(model: Type[models.Model]) -> List[models.Field]:
+    """Fields of archived rows, primary and foreign keys are set by the import."""
+    return [f for f in model._meta.concrete_fields if not f.primary_key and not f.is_relation]
+
+
+def _dump(obj: models.Model) -> bytes:
+    row = {
+        f.name: None if f.value_from_object(obj) is None else f.value_to_string(obj)
+        for f in _fields(type(obj))
+    }
+    return json.dumps(row, ensure_ascii=False).encode() + b'\n'
+
+
+def _load(model: Type[models.Model], row: Dict[str, Any], **kwargs: Any) -> models.Model:
+    fields = {f.name: f for f in _fields(model)}
+    values = {
+        name: None if value is None else fields[name].to_python(value)
+        for name, value in row.items() if name in fields
+    }
+    return model(**values, **kwargs)
+
+
+def _files(obj: models.Model) -> Iterator[str]:
+    for field in _fields(type(obj)):
+        if isinstance(field, models.FileField) and (file := getattr(obj, field.name)):
+            yield file.name
+
+
+# ----------- export -----------
+
+def _header(name: str, size: int, mtime: float) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size, info.mtime, info.mode = size, int(mtime), 0o644
+    return info.tobuf(tarfile.PAX_FORMAT)
+
+
+def _padding(size: int) -> bytes:
+    return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+
+def _spooled_member(name: str, rows: Iterable[models.Model]) -> Iterator[bytes]:
+    """JSON lines member, rows are spooled to a temporary file to know the member size."""
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as f:
+        for obj in rows:
+            f.write(_dump(obj))
+        size = f.tell()
+        f.seek(0)
+
+        yield _header(name, size, time.time())
+        while chunk := f.read(settings.PODCAST_MEDIA_CHUNK_SIZE):
+            yield chunk
+        yield _padding(size)
+
+
+def _storage_member(name: str) -> Iterator[bytes]:
+    """Yields a member of an object storage file."""
+    try:
+        size, modified = default_storage.size(name), default_storage.get_modified_time(name)
+    except FileNotFoundError:
+        return
+    yield _header(MEDIA_PREFIX + name, size, modified.timestamp())
+    with default_storage.open(name) as f:
+        sent = 0
+        for chunk in f.chunks(settings.PODCAST_MEDIA_CHUNK_SIZE):
+            sent += len(chunk)
+            yield chunk
+    if sent != size:
+        raise ArchiveError(f'{name} was changed during the export')
+    yield _padding(size)
+
+
+def _file_member(name: str) -> Iterator[bytes]:
+    if not is_local(default_storage):
+        yield from _storage_member(name)
+        return
+    path = default_storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return  # the row is restored without its file
+
+    yield _header(MEDIA_PREFIX + name, stat.st_size, stat.st_mtime)
+    sent = 0
+    for chunk in file_chunks(path, 0, stat.st_size):
+        sent += len(chunk)
+        yield chunk
+    if sent != stat.st_size:
+        # a padded member would be a corrupted file in the archive
+        raise ArchiveError(f'{name} was changed during the export')
+    yield _padding(stat.st_size)
+
+
+def stream(podcast: Podcast) -> Iterator[bytes]:
+    """Yields chunks of the podcast archive."""
+    yield from _spooled_member(PODCAST_MEMBER, [podcast])
+    episodes = podcast.episode_set.order_by('pk')
+    yield from _spooled_member(EPISODES_MEMBER, episodes.iterator())
+    yield from _spooled_member(CUSTOM_FEEDS_MEMBER, podcast.customfeed_set.order_by('pk').iterator())
+
+    seen = set()
+    for obj in chain([podcast], episodes.iterator()):
+        for name in _files(obj):
+            if name not in seen:
+                seen.add(name)
+                yield from _file_member(name)
+
+    # end of archive marker
+    yield b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+def export(podcast: Podcast, f: IO[bytes]) -> int:
+    """Writes the podcast archive to a file and returns its size."""
+    size = 0
+    for chunk in stream(podcast):
+        f.write(chunk)
+        size += len(chunk)
+    return size
+
+
+# ----------- import -----------
+
+def _read_rows(archive: tarfile.TarFile, name: str) -> List[Dict[str, Any]]:
+    try:
+        f = archive.extractfile(name)
+    except KeyError:
+        raise ArchiveError(f'archive does not have {name}')
+    return [json.loads(line) for line in f if line.strip()]
+
+
+def _extract(path: str, offset: int, size: int, destination: str) -> int:
+    """Copies a member data to the destination file, returns the number of copied bytes."""
+    chunk_size = settings.PODCAST_MEDIA_CHUNK_SIZE
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+
+    tmp = f'{destination}.part'
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with open(tmp, 'wb') as dst:
+            copied = 0
+            while copied < size:
+                chunk = os.pread(fd, min(chunk_size, size - copied), offset + copied)
+                if not chunk:
+                    raise ArchiveError(f'archive is truncated: {destination}')
+                dst.write(chunk)
+                copied += len(chunk)
+    finally:
+        os.close(fd)
+    os.replace(tmp, destination)
+    return copied
+
+
+def _digest(name: str) -> str:
+    h = hashlib.sha256()
+    with default_storage.open(name) as f:
+        for chunk in f.chunks(settings.PODCAST_MEDIA_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+def _hashes(objects: Iterable[models.Model]) -> Dict[str, str]:
+    """Content hashes of the archived files from their rows, files of previous versions archives do not have them."""
+    hashes = {}
+    for obj in objects:
+        for field, hash_field in obj.HASHED_FILES:
+            if (file := getattr(obj, field)) and (digest := getattr(obj, hash_field)):
+                hashes[file.name] = digest
+    return hashes
+
+
+def _destination(name: str, digest: str) -> Tuple[str, bool]:
+    """Returns a storage name for the file and a flag if it must be extracted."""
+    if os.path.isabs(name) or '..' in name.split('/'):
+        raise ArchiveError(f'invalid file name {name}')
+    if not default_storage.exists(name):
+        return name, True
+    if digest and _digest(name) == digest:
+        return name, False  # restored before
+    return default_storage.get_available_name(name), True
+
+
+def _remove(paths: Iterable[str]) -> None:
+    for path in paths:
+        for name in (path, f'{path}.part'):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def restore(path: str, workers: Optional[int] = None, batch_size: int = 500) -> Tuple[Podcast, int]:
+    """
+    Restores a podcast from the archive file and returns it with the number of restored bytes.
+    Files are extracted by parallel workers before the rows are saved in one transaction.
+    """
+    if not is_local(default_storage):
+        raise ArchiveError('podcasts are restored to the local storage, then files are copied by "move_media" command')
+    with tarfile.open(path, 'r:') as archive:
+        podcast_rows = _read_rows(archive, PODCAST_MEMBER)
+        episode_rows = _read_rows(archive, EPISODES_MEMBER)
+        custom_feed_rows = _read_rows(archive, CUSTOM_FEEDS_MEMBER)
+        members = {
+            m.name[len(MEDIA_PREFIX):]: m for m in archive.getmembers()
+            if m.isfile() and m.name.startswith(MEDIA_PREFIX)
+        }
+
+    if len(podcast_rows) != 1:
+        raise ArchiveError(f'{PODCAST_MEMBER} must contain one podcast')
+    podcast = _load(Podcast, podcast_rows[0])
+    if Podcast.objects.filter(models.Q(slug=podcast.slug) | models.Q(title=podcast.title)).exists():
+        raise ArchiveError(f'podcast "{podcast.slug}" already exists')
+    episodes = [_load(Episode, row) for row in episode_rows]
+    custom_feeds = [_load(CustomFeed, row) for row in custom_feed_rows]
+
+    for episode in episodes:
+        # archives of previous versions do not have sizes
+        if not episode.audio_size and (member := members.get(episode.audio.name)):
+            episode.audio_size = member.size
+
+    # only files referenced by the rows are extracted
+    renamed, jobs, hashes = {}, [], _hashes(chain([podcast], episodes))
+    for obj in chain([podcast], episodes):
+        for name in _files(obj):
+            if name in renamed or name not in members:
+                continue
+            member = members[name]
+            renamed[name], extract = _destination(name, hashes.get(name, ''))
+            if extract:
+                jobs.append((path, member.offset_data, member.size, default_storage.path(renamed[name])))
+    extracted = [job[-1] for job in jobs]
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            restored = sum(pool.map(lambda job: _extract(*job), jobs))
+    except Exception:
+        _remove(extracted)
+        raise
+
+    for obj in chain([podcast], episodes):
+        for field in _fields(type(obj)):
+            if isinstance(field, models.FileField) and (file := getattr(obj, field.name)):
+                file.name = renamed.get(file.name, file.name)
+    for episode in episodes:
+        # archives of previous versions do not have hashes
+        episode.set_file_hashes()
+
+    try:
+        with transaction.atomic():
+            podcast.save()
+            for obj in (*episodes, *custom_feeds):
+                obj.podcast = podcast
+            for i in range(0, len(episodes), batch_size):
+                Episode.objects.bulk_create(episodes[i:i + batch_size])
+            CustomFeed.objects.bulk_create(custom_feeds)
+            # post_save signals are not sent by bulk_create,
+            # explicitly included and excluded episodes of custom feeds are not restored
+            for custom_feed in custom_feeds:
+                selection.rebuild(custom_feed)
+            Podcast.objects.filter(pk=podcast.pk).touch()
+    except IntegrityError as e:
+        # for example, episode titles are unique for all podcasts
+        _remove(extracted)
+        raise ArchiveError(f'rows conflict with existing data: {e}') from e
+    except Exception:
+        _remove(extracted)
+        raise
+
+    podcast.refresh_from_db()
+    return podcast, restored
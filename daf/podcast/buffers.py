@@ -0,0 +1,79 @@
+"""
+In-memory counters which are periodically added to database rows.
+
+Every process accumulates values and adds them to the shared rows
+in one transaction, so a request does not write to the database.
+Buffers are flushed by requests, uWSGI workers may have no threads.
+"""
+import logging
+import threading
+import time
+from typing import ClassVar, Dict, List, Tuple, Type
+
+from django.conf import settings
+from django.db import DatabaseError, models, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    """Counters of model rows identified by key fields."""
+    registry: ClassVar[List['CounterBuffer']] = []
+
+    def __init__(self, model: Type[models.Model], keys: Tuple[str, ...], values: Tuple[str, ...]) -> None:
+        self.model = model
+        self.keys = keys
+        self.values = values
+        self._lock = threading.Lock()
+        self._pending: Dict[tuple, List[float]] = {}
+        self.registry.append(self)
+
+    def add(self, key: tuple, *values: float) -> None:
+        with self._lock:
+            if (current := self._pending.get(key)) is None:
+                self._pending[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    current[i] += value
+
+    def _restore(self, pending: Dict[tuple, List[float]]) -> None:
+        for key, values in pending.items():
+            self.add(key, *values)
+
+    def flush(self) -> None:
+        """Adds accumulated values to the database rows, missing rows are created."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(
+                    [self.model(**dict(zip(self.keys, key))) for key in pending],
+                    ignore_conflicts=True,
+                    batch_size=settings.PODCAST_FLUSH_BATCH_SIZE,
+                )
+                for key, values in pending.items():
+                    self.model.objects.filter(**dict(zip(self.keys, key))).update(
+                        **{name: F(name) + value for name, value in zip(self.values, values)},
+                    )
+        except DatabaseError:
+            logger.exception('%s counters flush failed', self.model.__name__)
+            self._restore(pending)
+
+
+_last_flush = time.monotonic()
+
+
+def flush_due() -> bool:
+    return time.monotonic() - _last_flush >= settings.PODCAST_FLUSH_INTERVAL
+
+
+def flush_all() -> None:
+    global _last_flush
+
+    _last_flush = time.monotonic()
+    for buffer in CounterBuffer.registry:
+        buffer.flush()
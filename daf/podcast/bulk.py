@@ -0,0 +1,143 @@
+"""
+Bulk changes of episodes.
+
+Every operation is one transaction which touches every affected podcast once,
+so their feeds are rendered again once. Files of deleted and moved episodes
+are removed after the commit by a background thread.
+"""
+import logging
+import os
+import shutil
+import threading
+from typing import Iterable, List, Set
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+from . import media, selection, signals
+from .models import Episode, EpisodeTombstone, Podcast, podcast_directory_path
+
+logger = logging.getLogger(__name__)
+
+SELECTION_FIELDS = ('id', 'podcast_id', 'title', 'description', 'published', 'archived')
+
+
+def _remove_files(names: List[str]) -> None:
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.exception('failed to remove file %s', name)
+
+
+def remove_files_on_commit(names: Iterable[str]) -> None:
+    """Removes storage files by a background thread after the current transaction is committed."""
+    names = sorted(set(names))
+    if names:
+        transaction.on_commit(
+            lambda: threading.Thread(target=_remove_files, args=(names,), name='daf-remove-files', daemon=True).start()
+        )
+
+
+def unreferenced(names: Set[str]) -> Set[str]:
+    """Returns file names which are not used by any podcast or episode."""
+    used = set(Episode.objects.filter(Q(audio__in=names) | Q(image__in=names)).values_list('audio', 'image'))
+    used = {name for pair in used for name in pair}
+    used.update(Podcast.objects.filter(image__in=names).values_list('image', flat=True))
+    return names - used
+
+
+def _update(queryset: QuerySet, **values) -> int:
+    """Updates episodes and their custom feeds selections, touches their podcasts once."""
+    with transaction.atomic():
+        ids = list(queryset.values_list('pk', flat=True))
+        count = Episode.objects.filter(pk__in=ids).update(updated=timezone.now(), **values)
+        episodes = list(Episode.objects.filter(pk__in=ids).only(*SELECTION_FIELDS))
+        # post_save signals are not sent by update()
+        selection.update_episodes(episodes)
+        Podcast.objects.filter(pk__in={e.podcast_id for e in episodes}).touch()
+    return count
+
+
+def publish(queryset: QuerySet) -> int:
+    """Publishes unpublished episodes now, published ones keep their time."""
+    return _update(queryset.filter(published__isnull=True), published=timezone.now())
+
+
+def unpublish(queryset: QuerySet) -> int:
+    return _update(queryset.filter(published__isnull=False), published=None)
+
+
+def archive(queryset: QuerySet) -> int:
+    """Moves published episodes from the podcast feed to its archive pages."""
+    return _update(queryset.filter(published__isnull=False, archived__isnull=True), archived=timezone.now())
+
+
+def unarchive(queryset: QuerySet) -> int:
+    return _update(queryset.filter(archived__isnull=False), archived=None)
+
+
+def delete(queryset: QuerySet) -> int:
+    """Deletes episodes and removes their files which are not used by other rows."""
+    with transaction.atomic():
+        names = set()
+        for audio, image in queryset.values_list('audio', 'image'):
+            names.update(name for name in (audio, image) if name)
+        with signals.batch():
+            _, deleted = queryset.delete()
+        remove_files_on_commit(unreferenced(names))
+    return deleted.get(Episode._meta.label, 0)
+
+
+def link_file(source: str, destination: str) -> None:
+    """Hard-links the file to the destination path, it is copied if links are not possible."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)  # another file system
+
+
+def move(queryset: QuerySet, podcast: Podcast) -> int:
+    """
+    Moves episodes to another podcast, audio files are relocated to its directory.
+    New file names are linked before the transaction, old ones are removed after the commit.
+    """
+    episodes = list(queryset.exclude(podcast=podcast))
+    if not episodes:
+        return 0
+
+    now = timezone.now()
+    # sync clients of old podcasts remove moved episodes
+    tombstones = [EpisodeTombstone(podcast_id=e.podcast_id, episode_id=e.pk, deleted=now) for e in episodes]
+    old_podcasts = {e.podcast_id for e in episodes}
+    old_names, new_names = [], []
+    try:
+        for episode in episodes:
+            episode.podcast = podcast
+            if episode.audio:
+                name = default_storage.get_available_name(
+                    podcast_directory_path(episode, os.path.basename(episode.audio.name)),
+                )
+                if media.is_local(default_storage):
+                    link_file(default_storage.path(episode.audio.name), default_storage.path(name))
+                else:
+                    default_storage.copy(episode.audio.name, name)
+                new_names.append(name)
+                old_names.append(episode.audio.name)
+                episode.audio.name = name
+            episode.updated = now
+
+        with transaction.atomic():
+            Episode.objects.bulk_update(episodes, ['podcast', 'audio', 'updated'], batch_size=500)
+            EpisodeTombstone.objects.bulk_create(tombstones)
+            selection.update_episodes(episodes)
+            Podcast.objects.filter(pk__in={podcast.pk, *old_podcasts}).touch()
+            remove_files_on_commit(unreferenced(set(old_names)))
+    except Exception:
+        for name in new_names:
+            default_storage.delete(name)
+        raise
+    return len(episodes)
@@ -0,0 +1,46 @@
+"""Feed polling hints calculated from a podcast publish cadence."""
+from dataclasses import dataclass
+from datetime import datetime
+from statistics import median
+from typing import Sequence
+
+from django.conf import settings
+
+# syndication module update periods and their durations in minutes
+PERIODS = (
+    ('hourly', 60),
+    ('daily', 24 * 60),
+    ('weekly', 7 * 24 * 60),
+    ('monthly', 30 * 24 * 60),
+    ('yearly', 365 * 24 * 60),
+)
+
+
+@dataclass(frozen=True)
+class PollingHints:
+    ttl: int  # minutes
+    update_period: str
+    update_frequency: int
+
+    @property
+    def max_age(self) -> int:
+        return self.ttl * 60
+
+
+def polling_hints(published: Sequence[datetime]) -> PollingHints:
+    """
+    Returns polling hints for episodes publish dates.
+    TTL is a part of the median interval between the latest episodes,
+    it is limited by PODCAST_TTL and PODCAST_TTL_MAX.
+    """
+    min_ttl = int(settings.PODCAST_TTL)
+    ttl = min_ttl
+
+    dates = sorted(published)[-settings.PODCAST_CADENCE_EPISODES:]
+    if len(dates) > 1:
+        interval = median((b - a).total_seconds() for a, b in zip(dates, dates[1:])) / 60
+        ttl = int(interval * settings.PODCAST_TTL_CADENCE_RATIO)
+    ttl = min(max(ttl, min_ttl), max(settings.PODCAST_TTL_MAX, min_ttl))
+
+    period, minutes = next(((p, m) for p, m in PERIODS if ttl <= m), PERIODS[-1])
+    return PollingHints(ttl, period, max(minutes // ttl, 1))
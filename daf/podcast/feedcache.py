@@ -0,0 +1,133 @@
+"""Rendered feeds cache with precompressed response variants."""
+import gzip
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# server side preference, the best compression first
+ENCODINGS: Tuple[str, ...] = ('br', 'gzip') if brotli else ('gzip',)
+
+
+def compress(content: bytes) -> Dict[str, bytes]:
+    """Returns compressed variants of the content, only ones smaller than the original."""
+    if len(content) < settings.PODCAST_FEED_COMPRESS_MIN_SIZE:
+        return {}
+
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(content, mode=brotli.MODE_TEXT)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(content)}
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Parses Accept-Encoding header value and returns codings with non-zero quality."""
+    result = set()
+    for part in header.split(','):
+        coding, *params = (p.strip() for p in part.split(';'))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            result.add(coding.lower())
+    return result
+
+
+@dataclass(frozen=True)
+class RenderedFeed:
+    """Feed XML rendered once and stored in the cache with its compressed variants."""
+    content: bytes
+    content_type: str
+    etag: str
+    last_modified: str = ''
+    max_age: int = 0
+    variants: Dict[str, bytes] = field(default_factory=dict)
+    # rendered <item> elements by episode IDs with their dates, they are reused by custom feeds
+    items: Dict[int, Tuple[datetime, str]] = field(default_factory=dict)
+
+    @classmethod
+    def build(
+        cls,
+        content: bytes,
+        content_type: str,
+        last_modified: str = '',
+        max_age: int = 0,
+        items: Optional[Dict[int, Tuple[datetime, str]]] = None,
+    ) -> 'RenderedFeed':
+        # weak, because the same validator is used for all encoded representations
+        etag = 'W/"{}"'.format(hashlib.md5(content, usedforsecurity=False).hexdigest())
+        return cls(content, content_type, etag, last_modified, max_age, compress(content), items or {})
+
+    def _patch(self, response: HttpResponseBase) -> None:
+        response.headers['ETag'] = self.etag
+        if self.max_age:
+            patch_cache_control(response, public=True, max_age=self.max_age)
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+    def select(self, accept_encoding: str) -> Tuple[str, bytes]:
+        """Returns the preferred encoding accepted by a client and the related body."""
+        if self.variants and accept_encoding:
+            accepted = accepted_encodings(accept_encoding)
+            for encoding in ENCODINGS:
+                if encoding in self.variants and (encoding in accepted or '*' in accepted):
+                    return encoding, self.variants[encoding]
+        return '', self.content
+
+    def response(self, request) -> HttpResponseBase:
+        """Returns a response for the request, 304 if the client already has this feed version."""
+        last_modified = parse_http_date_safe(self.last_modified) if self.last_modified else None
+        if not_modified := get_conditional_response(request, etag=self.etag, last_modified=last_modified):
+            self._patch(not_modified)
+            return not_modified
+
+        encoding, body = self.select(request.headers.get('Accept-Encoding', ''))
+        response = HttpResponse(body, content_type=self.content_type)
+        self._patch(response)
+        if self.last_modified:
+            response.headers['Last-Modified'] = self.last_modified
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+            metrics.incr('daf_feed_compressed_bytes_saved_total', len(self.content) - len(body), encoding=encoding)
+        return response
+
+
+def cache_key(*parts: str) -> str:
+    """Returns a cache key for the feed identified by parts."""
+    digest = hashlib.md5(':'.join(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'daf:feed:{digest}'
+
+
+def get(key: str) -> Optional[RenderedFeed]:
+    return cache.get(key)
+
+
+def put(key: str, rendered: RenderedFeed) -> None:
+    cache.set(key, rendered, settings.PODCAST_FEED_CACHE_TIMEOUT)
+
+
+async def aget(key: str) -> Optional[RenderedFeed]:
+    return await cache.aget(key)
+
+
+async def aput(key: str, rendered: RenderedFeed) -> None:
+    await cache.aset(key, rendered, settings.PODCAST_FEED_CACHE_TIMEOUT)
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.utils import timezone
 
 from .models import Episode, Podcast
@@ -33,3 +34,34 @@ class EpisodeForm(forms.ModelForm):
         if commit:
             instance.save()
         return instance
+
+
+class BaseEpisodeFormSet(forms.BaseFormSet):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.max_num = settings.PODCAST_BATCH_MAX_ITEMS
+
+    def clean(self) -> None:
+        """Checks that titles of the batch are unique."""
+        titles = set()
+        for form in self.forms:
+            title = form.cleaned_data.get('title')
+            if title in titles:
+                form.add_error('title', forms.ValidationError('duplicate title in the batch', code='duplicate'))
+            elif title:
+                titles.add(title)
+
+
+EpisodeFormSet = forms.formset_factory(
+    EpisodeForm,
+    formset=BaseEpisodeFormSet,
+    extra=0,
+    min_num=1,
+    validate_min=True,
+    validate_max=True,
+)
+
+
+class MoveEpisodesForm(forms.Form):
+    podcast = forms.ModelChoiceField(Podcast.objects.all(), label='podcast')
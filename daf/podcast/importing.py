@@ -0,0 +1,181 @@
+"""
+Bulk import of existing episodes from a local directory or RSS file.
+
+Functions of this module are run in worker processes, so they use only
+the standard library and do not touch the database.
+"""
+import hashlib
+import json
+import os
+import shutil
+import xml.etree.ElementTree as ElementTree
+from dataclasses import dataclass
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+ITUNES_NS = 'http://www.itunes.com/dtds/podcast-1.0.dtd'
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class Item:
+    """Episode to be imported, audio and image are local file paths."""
+    audio: str
+    title: str
+    author: str = ''
+    description: str = ''
+    public_image: str = ''
+    image: str = ''
+    published: Optional[datetime] = None
+    # reason to skip the item, its metadata is invalid
+    error: str = ''
+
+
+@dataclass
+class Probe:
+    """Size and SHA-256 hash of a source file, or the error of its reading."""
+    size: int = 0
+    digest: str = ''
+    error: str = ''
+
+
+@dataclass
+class Transfer:
+    """Result of a file transfer, created is False if an existing file is reused."""
+    size: int = 0
+    created: bool = False
+    error: str = ''
+
+
+def _published(value: str) -> Optional[datetime]:
+    """Parses ISO 8601 or RFC 2822 date, ValueError is raised for invalid values."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid date "{value}"')
+
+
+def directory_items(path: str, extensions: set[str]) -> Iterator[Item]:
+    """
+    Yields audio files of the directory with known extensions ordered by name.
+    Optional sidecar "<name>.json" file contains title, author, description,
+    public_image, image (a path relative to the directory) and published fields.
+    """
+    for name in sorted(os.listdir(path)):
+        stem, _, extension = name.rpartition('.')
+        audio = os.path.join(path, name)
+        if not stem or extension.lower() not in extensions or not os.path.isfile(audio):
+            continue
+
+        meta = {}
+        sidecar = os.path.join(path, f'{stem}.json')
+        try:
+            if os.path.isfile(sidecar):
+                with open(sidecar, encoding='utf-8') as f:
+                    meta = json.load(f)
+                if not isinstance(meta, dict):
+                    raise ValueError('JSON object is expected')
+            published = _published(meta.get('published', ''))
+        except (OSError, ValueError) as e:
+            yield Item(audio=audio, title=stem, error=f'invalid metadata {sidecar}: {e}')
+            continue
+
+        image = meta.get('image', '')
+        yield Item(
+            audio=audio,
+            title=meta.get('title') or stem,
+            author=meta.get('author', ''),
+            description=meta.get('description', ''),
+            public_image=meta.get('public_image', ''),
+            image=os.path.join(path, image) if image else '',
+            published=published,
+        )
+
+
+def rss_items(path: str, audio_dir: str = '') -> Iterator[Item]:
+    """
+    Yields items of the RSS file, audio files are looked up by enclosure URLs file names
+    in audio_dir (the RSS file directory by default).
+    """
+    audio_dir = audio_dir or os.path.dirname(os.path.abspath(path))
+    for node in ElementTree.parse(path).iterfind('./channel/item'):
+        enclosure = node.find('enclosure')
+        if enclosure is None or not enclosure.get('url'):
+            continue
+
+        name = os.path.basename(unquote(urlparse(enclosure.get('url')).path))
+        title = node.findtext('title', '').strip() or name
+        try:
+            published = _published(node.findtext('pubDate', '').strip())
+        except ValueError as e:
+            yield Item(audio=os.path.join(audio_dir, name), title=title, error=f'invalid pubDate: {e}')
+            continue
+
+        image = node.find(f'{{{ITUNES_NS}}}image')
+        yield Item(
+            audio=os.path.join(audio_dir, name),
+            title=title,
+            author=node.findtext(f'{{{ITUNES_NS}}}author', '').strip(),
+            description=node.findtext('description', '').strip(),
+            public_image=image.get('href', '') if image is not None else '',
+            published=published,
+        )
+
+
+def probe(path: str) -> Tuple[int, str]:
+    """Returns size and SHA-256 hash of a file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return os.path.getsize(path), h.hexdigest()
+
+
+def checked_probe(path: str) -> Probe:
+    """Probes a source file, errors are returned, so one unreadable file does not stop other probes."""
+    try:
+        return Probe(*probe(path))
+    except OSError as e:
+        return Probe(error=f'{path} cannot be read: {e}')
+
+
+def transfer(source: str, destination: str, digest: str, link: bool = False) -> Transfer:
+    """
+    Copies or hard-links a file. An existing destination file with the same content
+    is reused, so an interrupted import can be repeated. Errors are returned,
+    not raised, so one bad file does not stop other transfers.
+    """
+    try:
+        if os.path.exists(destination):
+            if probe(destination)[1] == digest:
+                return Transfer(os.path.getsize(destination))
+            return Transfer(error=f'file {destination} already exists with other content')
+
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if link:
+            try:
+                os.link(source, destination)
+                return Transfer(os.path.getsize(destination), created=True)
+            except OSError:
+                pass  # other filesystem, the file is copied
+
+        tmp = f'{destination}.part'
+        try:
+            with open(source, 'rb') as src, open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.replace(tmp, destination)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return Transfer(os.path.getsize(destination), created=True)
+    except OSError as e:
+        return Transfer(error=f'{source} transfer failed: {e}')
@@ -0,0 +1,166 @@
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from podcast import bulk, media
+from podcast.models import Episode, Podcast, archive_directory_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Applies retention policies of podcasts: published episodes beyond the newest "keep episodes" '
+        'or older than "keep days" are archived or unpublished by batches. Run it periodically.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--podcast', default='', help='podcast slug, all podcasts by default')
+        parser.add_argument('--batch-size', type=int, default=500, help='number of episodes per transaction')
+        parser.add_argument(
+            '--move', action='store_true',
+            help='move audio files of archived episodes to PODCAST_ARCHIVE_DIRECTORY, see PODCAST_ARCHIVE_BITRATE',
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of parallel file moves')
+        parser.add_argument('--dry-run', action='store_true', help='only print the number of expired episodes')
+
+    @staticmethod
+    def expired(podcast: Podcast, now: datetime) -> QuerySet[Episode]:
+        """Episodes of the podcast feed which are out of its retention limits."""
+        episodes = podcast.episode_set.filter(published__isnull=False, archived__isnull=True)
+        conditions = []
+        if podcast.keep_days:
+            conditions.append(Q(published__lt=now - timedelta(days=podcast.keep_days)))
+        if podcast.keep_episodes:
+            # the feed order, IDs are loaded as a LIMIT subquery is not supported by all databases
+            kept = episodes.order_by('-published', 'id').values_list('pk', flat=True)[:podcast.keep_episodes]
+            conditions.append(~Q(pk__in=list(kept)))
+        if not conditions:
+            return episodes.none()
+        condition = conditions[0]
+        for other in conditions[1:]:
+            condition |= other
+        return episodes.filter(condition)
+
+    def _retain(self, podcast: Podcast, batch_size: int, dry_run: bool) -> int:
+        ids = list(self.expired(podcast, timezone.now()).order_by('published', 'id').values_list('pk', flat=True))
+        if dry_run:
+            if ids:
+                self.stdout.write(f'{podcast.slug}: {len(ids)} expired episodes, action: {podcast.retention_action}')
+            return len(ids)
+
+        action = bulk.archive if podcast.retention_action == 'archive' else bulk.unpublish
+        count = 0
+        for i in range(0, len(ids), batch_size):
+            count += action(Episode.objects.filter(pk__in=ids[i:i + batch_size]))
+        return count
+
+    def _compress(self, source: str, target: str) -> bool:
+        """Re-encodes the audio file with PODCAST_ARCHIVE_BITRATE, the result is kept if it is smaller."""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        command = [
+            settings.PODCAST_FFMPEG, '-nostdin', '-v', 'error', '-i', source,
+            '-map_metadata', '0', '-vn', '-b:a', settings.PODCAST_ARCHIVE_BITRATE, target,
+        ]
+        try:
+            result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            self.stderr.write(f'failed to run {settings.PODCAST_FFMPEG}: {e}')
+            return False
+        if result.returncode:
+            self.stderr.write(f'{source}: {result.stderr.decode(errors="replace").strip()}')
+        if result.returncode or os.path.getsize(target) >= os.path.getsize(source):
+            if os.path.exists(target):
+                os.remove(target)
+            return False
+        return True
+
+    def _place(self, episode: Episode) -> Optional[str]:
+        """Creates the archived copy of the episode audio file, returns its name, None if the file is not found."""
+        source = default_storage.path(episode.audio.name)
+        if not os.path.exists(source):
+            return None
+        name = default_storage.get_available_name(
+            archive_directory_path(episode, os.path.basename(episode.audio.name)),
+        )
+        target = default_storage.path(name)
+        if not (settings.PODCAST_ARCHIVE_BITRATE and self._compress(source, target)):
+            bulk.link_file(source, target)
+        return name
+
+    def _move(self, pool: ThreadPoolExecutor, episodes: List[Episode]) -> Tuple[int, int]:
+        """Moves audio files of the archived episodes batch, returns numbers of moved files and saved bytes."""
+        names = list(pool.map(self._place, episodes))
+        moved = [(episode, name) for episode, name in zip(episodes, names) if name]
+        if not moved:
+            return 0, 0
+
+        now, saved, old_names = timezone.now(), 0, []
+        try:
+            for episode, name in moved:
+                old_names.append(episode.audio.name)
+                size = os.path.getsize(default_storage.path(name))
+                saved += (episode.audio_size or size) - size
+                episode.audio.name, episode.audio_size, episode.updated = name, size, now
+                episode.audio_hash = media.file_digest(episode.audio)
+
+            episodes = [episode for episode, _ in moved]
+            with transaction.atomic():
+                Episode.objects.bulk_update(episodes, ['audio', 'audio_size', 'audio_hash', 'updated'])
+                # audio URLs of archive pages are changed
+                Podcast.objects.filter(pk__in={e.podcast_id for e in episodes}).touch()
+                bulk.remove_files_on_commit(bulk.unreferenced(set(old_names)))
+        except Exception:
+            for _, name in moved:
+                default_storage.delete(name)
+            raise
+        return len(moved), saved
+
+    def handle(self, *args, **options) -> None:
+        if options['move'] and not media.is_local(default_storage):
+            raise CommandError('audio files of an object storage are not moved, use its storage classes instead')
+
+        podcasts = Podcast.objects.filter(Q(keep_episodes__gt=0) | Q(keep_days__gt=0)).order_by('pk')
+        if options['podcast']:
+            podcasts = podcasts.filter(slug=options['podcast'])
+        batch_size = max(options['batch_size'], 1)
+
+        start = time.perf_counter()
+        count = sum(self._retain(podcast, batch_size, options['dry_run']) for podcast in podcasts)
+        if options['dry_run']:
+            self.stdout.write(f'{count} episodes are out of retention limits')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'applied retention to {count} episodes in {time.perf_counter() - start:.2f}s'
+            ))
+        if not options['move']:
+            return
+
+        episodes = Episode.objects.filter(archived__isnull=False).exclude(audio='').exclude(
+            audio__startswith=f'{settings.PODCAST_ARCHIVE_DIRECTORY}/',
+        )
+        if options['podcast']:
+            episodes = episodes.filter(podcast__slug=options['podcast'])
+        ids = list(episodes.order_by('pk').values_list('pk', flat=True))
+        if options['dry_run']:
+            self.stdout.write(f'{len(ids)} audio files are to be moved to the archive directory')
+            return
+
+        start, moved, saved = time.perf_counter(), 0, 0
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            for i in range(0, len(ids), batch_size):
+                batch = list(Episode.objects.select_related('podcast').filter(pk__in=ids[i:i + batch_size]))
+                batch_moved, batch_saved = self._move(pool, batch)
+                moved, saved = moved + batch_moved, saved + batch_saved
+        self.stdout.write(self.style.SUCCESS(
+            f'moved {moved} audio files, saved {filesizeformat(saved)} in {time.perf_counter() - start:.2f}s'
+        ))
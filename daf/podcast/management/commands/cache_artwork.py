@@ -0,0 +1,142 @@
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Optional, Set, Union
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+from django.utils import timezone
+
+from podcast import artwork
+from podcast.bulk import remove_files_on_commit
+from podcast.media import HASH_LENGTH
+from podcast.models import AggregateFeed, Episode, Podcast, RemoteImage, sharded_path
+
+MODELS = (Podcast, Episode, AggregateFeed)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fetches new and expired public images of podcasts and episodes, stores their optimized copies, '
+        'so feeds refer to them. Run it periodically, images are fetched again after PODCAST_ARTWORK_REFRESH.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=8, help='number of parallel downloads')
+        parser.add_argument('--all', action='store_true', help='fetch images which are not expired too')
+
+    @staticmethod
+    def _link() -> Set[int]:
+        """
+        Creates rows of new public images, removes unused ones and links podcasts and episodes
+        to their images. Returns IDs of podcasts with changed links.
+        """
+        urls = set()
+        for model in MODELS:
+            urls.update(model.objects.exclude(public_image='').values_list('public_image', flat=True).distinct())
+        RemoteImage.objects.bulk_create([RemoteImage(url=url) for url in urls], ignore_conflicts=True)
+
+        unused = RemoteImage.objects.exclude(url__in=urls)
+        remove_files_on_commit(name for name in unused.exclude(image='').values_list('image', flat=True))
+        unused.delete()
+
+        changed = set()
+        for model in MODELS:
+            stale = model.objects.filter(
+                (Q(artwork__isnull=True) & ~Q(public_image=''))
+                | (Q(artwork__isnull=False) & ~Q(artwork__url=F('public_image'))),
+            )
+            values = {'artwork': Subquery(RemoteImage.objects.filter(url=OuterRef('public_image')).values('pk')[:1])}
+            if model is Episode:
+                changed.update(stale.values_list('podcast_id', flat=True))
+            elif model is Podcast:
+                changed.update(stale.values_list('pk', flat=True))
+            else:
+                values['updated'] = timezone.now()  # aggregate feeds are rendered again
+            stale.update(**values)
+        return changed
+
+    @staticmethod
+    def _fetch(image: RemoteImage) -> Union[artwork.Fetched, artwork.ArtworkError, None]:
+        try:
+            return artwork.fetch(
+                image.url,
+                image.etag if image.image else '',
+                image.last_modified if image.image else '',
+                timeout=settings.PODCAST_ARTWORK_TIMEOUT,
+                max_size=settings.PODCAST_ARTWORK_MAX_SIZE,
+                max_dimension=settings.PODCAST_ARTWORK_MAX_DIMENSION,
+            )
+        except artwork.ArtworkError as e:
+            return e
+
+    def _save(self, image: RemoteImage, result: Union[artwork.Fetched, artwork.ArtworkError, None]) -> Optional[str]:
+        """Saves the fetch result, returns the old file name if the copy is changed."""
+        now = timezone.now()
+        if isinstance(result, artwork.ArtworkError):
+            # the previous copy is kept, retries are delayed more and more
+            image.failures += 1
+            image.error = str(result)[:255]
+            delay = min(settings.PODCAST_ARTWORK_RETRY * 2 ** (image.failures - 1), settings.PODCAST_ARTWORK_REFRESH)
+            image.expires = now + timedelta(seconds=delay)
+            image.save(update_fields=['failures', 'error', 'expires', 'updated'])
+            self.stderr.write(f'{image.url}: {result}')
+            return None
+
+        old_name = None
+        image.fetched, image.failures, image.error = now, 0, ''
+        image.expires = now + timedelta(seconds=settings.PODCAST_ARTWORK_REFRESH)
+        if result is not None:
+            image.etag, image.last_modified = result.etag, result.last_modified
+            digest = hashlib.sha256(result.content).hexdigest()[:HASH_LENGTH]
+            if digest != image.image_hash or not image.image.name.endswith(f'.{result.extension}'):
+                old_name = image.image.name
+                filename = hashlib.sha256(image.url.encode()).hexdigest()[:HASH_LENGTH]
+                image.image.name = default_storage.save(
+                    sharded_path('artwork', f'{filename}.{result.extension}'), ContentFile(result.content),
+                )
+                image.image_hash, image.size = digest, len(result.content)
+        image.save()
+        return old_name
+
+    def handle(self, *args, **options) -> None:
+        if not settings.PODCAST_ARTWORK_CACHE:
+            raise CommandError('PODCAST_ARTWORK_CACHE is disabled')
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            podcasts = self._link()
+
+        images = RemoteImage.objects.order_by('pk')
+        if not options['all']:
+            images = images.filter(Q(expires__isnull=True) | Q(expires__lte=timezone.now()))
+        images = list(images)
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            results = list(pool.map(self._fetch, images))
+
+        changed, failed = [], 0
+        with transaction.atomic():
+            for image, result in zip(images, results):
+                old_name = self._save(image, result)
+                failed += isinstance(result, artwork.ArtworkError)
+                if old_name is not None:
+                    changed.append(image.pk)
+                    if old_name:
+                        remove_files_on_commit([old_name])
+
+            # feeds with new copies are rendered again
+            podcasts.update(Podcast.objects.filter(
+                Q(artwork__in=changed) | Q(episode__artwork__in=changed),
+            ).values_list('pk', flat=True))
+            Podcast.objects.filter(pk__in=podcasts).touch()
+            AggregateFeed.objects.filter(artwork__in=changed).update(updated=timezone.now())
+
+        self.stdout.write(self.style.SUCCESS(
+            f'fetched {len(images) - failed} images, {len(changed)} changed, {failed} failed '
+            f'in {time.perf_counter() - start:.2f}s'
+        ))
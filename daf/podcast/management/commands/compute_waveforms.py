@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from podcast import media, waveform
+from podcast.models import Episode
+
+
+class Command(BaseCommand):
+    help = 'Decodes audio files of new episodes once and saves their waveform peaks for the admin preview'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--podcast', default='', help='podcast slug, all podcasts by default')
+        parser.add_argument('--all', action='store_true', help='decode episodes with saved peaks again')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of ffmpeg worker processes')
+        parser.add_argument('--batch-size', type=int, default=50, help='number of episodes per update')
+
+    def _compute(self, pool: ProcessPoolExecutor, episodes: list[Episode]) -> int:
+        """Saves peaks of the episodes, failed ones get an empty value, so they are not decoded again."""
+        futures = [
+            pool.submit(
+                waveform.from_file,
+                # ffmpeg reads files of an object storage by their URLs
+                episode.audio.path if media.is_local(episode.audio.storage) else episode.audio.url,
+                settings.PODCAST_FFMPEG,
+                settings.PODCAST_WAVEFORM_PEAKS,
+                settings.PODCAST_MEDIA_CHUNK_SIZE,
+            )
+            for episode in episodes
+        ]
+        failed = 0
+        for episode, future in zip(episodes, futures):
+            try:
+                episode.waveform = future.result()
+            except waveform.WaveformError as e:
+                self.stderr.write(f'episode {episode.pk}: {e}')
+                episode.waveform, failed = b'', failed + 1
+        # update() does not change "updated" time, so feeds are not rendered again
+        Episode.objects.bulk_update(episodes, ['waveform'])
+        return failed
+
+    def handle(self, *args, **options) -> None:
+        if waveform.np is None:
+            raise CommandError('numpy is not installed')
+
+        episodes = Episode.objects.exclude(audio='').order_by('pk')
+        if options['podcast']:
+            episodes = episodes.filter(podcast__slug=options['podcast'])
+        if not options['all']:
+            episodes = episodes.filter(waveform__isnull=True)
+
+        start = time.perf_counter()
+        # rows are updated by batches, so they are not read by an open cursor
+        ids = list(episodes.values_list('pk', flat=True))
+        batch_size = max(options['batch_size'], 1)
+        failed = 0
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            for i in range(0, len(ids), batch_size):
+                batch = list(Episode.objects.filter(pk__in=ids[i:i + batch_size]).only('id', 'audio'))
+                failed += self._compute(pool, batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'decoded {len(ids) - failed} episodes, {failed} failed in {time.perf_counter() - start:.2f}s'
+        ))
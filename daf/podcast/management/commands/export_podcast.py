@@ -0,0 +1,33 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from podcast.backup import export
+from podcast.models import Podcast
+
+
+class Command(BaseCommand):
+    help = 'Exports a podcast with its episodes and media files to a tar archive'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('podcast', help='podcast slug')
+        parser.add_argument('output', help='archive file path, "-" is stdout')
+
+    def handle(self, *args, **options) -> None:
+        try:
+            podcast = Podcast.objects.get(slug=options['podcast'])
+        except Podcast.DoesNotExist:
+            raise CommandError(f'podcast "{options["podcast"]}" does not exist')
+
+        start = time.perf_counter()
+        if options['output'] == '-':
+            export(podcast, sys.stdout.buffer)
+            return
+
+        with open(options['output'], 'wb') as f:
+            size = export(podcast, f)
+        self.stdout.write(self.style.SUCCESS(
+            f'exported "{podcast.slug}", {filesizeformat(size)} in {time.perf_counter() - start:.2f}s'
+        ))
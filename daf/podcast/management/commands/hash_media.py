@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Type
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from podcast.media import file_digest
+from podcast.models import AggregateFeed, Episode, Podcast, PodcastBaseModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Saves content hashes of stored files which do not have them, so their URLs are versioned '
+        'and cached forever. Files uploaded before the hashes were added are served by the usual URLs until then.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=8, help='number of files read in parallel')
+        parser.add_argument('--batch-size', type=int, default=500, help='number of rows per transaction')
+
+    @staticmethod
+    def _digest(file: models.fields.files.FieldFile) -> Optional[str]:
+        try:
+            return file_digest(file)
+        except FileNotFoundError:
+            return None
+
+    def _hash(self, pool: ThreadPoolExecutor, objects: List[PodcastBaseModel]) -> Tuple[int, int]:
+        """Saves hashes of the objects files, returns numbers of hashed and missing files."""
+        files = [
+            (obj, hash_field, getattr(obj, field))
+            for obj in objects
+            for field, hash_field in obj.HASHED_FILES
+            if getattr(obj, field) and not getattr(obj, hash_field)
+        ]
+        digests = pool.map(self._digest, [file for _, _, file in files])
+        hashed, missing = 0, 0
+        for (obj, hash_field, _), digest in zip(files, digests):
+            if digest:
+                setattr(obj, hash_field, digest)
+                hashed += 1
+            else:
+                missing += 1
+        if not hashed:
+            return 0, missing
+
+        model = type(objects[0])
+        with transaction.atomic():
+            model.objects.bulk_update(objects, [hash_field for _, hash_field in model.HASHED_FILES])
+            # file URLs of feeds are changed
+            if model is Episode:
+                Podcast.objects.filter(pk__in={obj.podcast_id for obj in objects}).touch()
+            elif model is Podcast:
+                Podcast.objects.filter(pk__in=[obj.pk for obj in objects]).touch()
+            else:
+                model.objects.filter(pk__in=[obj.pk for obj in objects]).update(updated=timezone.now())
+        return hashed, missing
+
+    def _queryset(self, model: Type[PodcastBaseModel]) -> models.QuerySet:
+        condition = models.Q()
+        for field, hash_field in model.HASHED_FILES:
+            condition |= ~models.Q(**{field: ''}) & models.Q(**{hash_field: ''})
+        fields = [name for pair in model.HASHED_FILES for name in pair]
+        if model is Episode:
+            fields.append('podcast_id')
+        return model.objects.filter(condition).only('id', *fields).order_by('pk')
+
+    def handle(self, *args, **options) -> None:
+        batch_size = max(options['batch_size'], 1)
+        start = time.perf_counter()
+        hashed, missing = 0, 0
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            for model in (Podcast, AggregateFeed, Episode):
+                queryset = self._queryset(model)
+                last_pk = 0
+                # missing files keep empty hashes, so rows are read by the primary key
+                while batch := list(queryset.filter(pk__gt=last_pk)[:batch_size]):
+                    last_pk = batch[-1].pk
+                    batch_hashed, batch_missing = self._hash(pool, batch)
+                    hashed, missing = hashed + batch_hashed, missing + batch_missing
+
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} files are not found'))
+        self.stdout.write(self.style.SUCCESS(f'hashed {hashed} files in {time.perf_counter() - start:.2f}s'))
@@ -0,0 +1,179 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+
+from podcast import media, selection
+from podcast.importing import Item, checked_probe, directory_items, rss_items, transfer
+from podcast.media import HASH_LENGTH
+from podcast.models import Episode, Podcast, image_directory_path, podcast_directory_path
+
+
+class Command(BaseCommand):
+    help = 'Imports episodes from a local directory with audio files or a local RSS file'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('podcast', help='podcast slug')
+        parser.add_argument('source', help='directory with audio files and sidecar JSON metadata, or RSS file')
+        parser.add_argument('--audio-dir', default='', help='audio files directory of RSS file items')
+        parser.add_argument('--link', action='store_true', help='hard-link files instead of copying')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=100, help='number of episodes per insert')
+
+    def _items(self, source: str, audio_dir: str) -> List[Item]:
+        if os.path.isdir(source):
+            return list(directory_items(source, set(settings.MIME_TYPES)))
+        if os.path.isfile(source):
+            return list(rss_items(source, audio_dir))
+        raise CommandError(f'source {source} does not exist')
+
+    def _select(self, items: Iterable[Item]) -> List[Item]:
+        """Skips items without audio files and with already known titles."""
+        items = list(items)
+        titles = set(Episode.objects.filter(title__in=[i.title for i in items]).values_list('title', flat=True))
+        selected = []
+
+        for item in items:
+            if item.error:
+                self.stdout.write(f'skipped "{item.title}": {item.error}')
+            elif item.title in titles:
+                self.stdout.write(f'skipped "{item.title}": episode already exists')
+            elif not Episode.get_mime_type(item.audio):
+                self.stdout.write(f'skipped "{item.title}": invalid audio file type')
+            elif not os.path.isfile(item.audio):
+                self.stdout.write(f'skipped "{item.title}": audio file {item.audio} not found')
+            elif item.image and not os.path.isfile(item.image):
+                self.stdout.write(f'skipped "{item.title}": image file {item.image} not found')
+            else:
+                titles.add(item.title)
+                selected.append(item)
+        return selected
+
+    @staticmethod
+    def _files(item: Item, episode: Episode) -> List[Tuple[str, str]]:
+        """Source paths and storage names of the item files."""
+        files = [(item.audio, episode.audio.name)]
+        if item.image:
+            files.append((item.image, episode.image.name))
+        return files
+
+    @staticmethod
+    def _episode(podcast: Podcast, item: Item) -> Episode:
+        published = item.published
+        if published and timezone.is_naive(published):
+            published = timezone.make_aware(published)
+
+        episode = Episode(
+            podcast=podcast,
+            title=item.title,
+            author=item.author,
+            description=item.description,
+            public_image=item.public_image,
+            published=published,
+        )
+        # files are already placed in the storage, only their names are saved
+        episode.audio.name = podcast_directory_path(episode, os.path.basename(item.audio))
+        if item.image:
+            episode.image.name = image_directory_path(episode, os.path.basename(item.image))
+        return episode
+
+    def handle(self, *args, **options) -> None:
+        if not media.is_local(default_storage):
+            raise CommandError(
+                'episodes are imported to the local storage, then files are copied by "move_media" command',
+            )
+        try:
+            podcast = Podcast.objects.get(slug=options['podcast'])
+        except Podcast.DoesNotExist:
+            raise CommandError(f'podcast "{options["podcast"]}" does not exist')
+
+        start = time.perf_counter()
+        items, episodes, names = [], [], set()
+        for item in self._select(self._items(options['source'], options['audio_dir'])):
+            episode = self._episode(podcast, item)
+            item_names = [episode.audio.name] + ([episode.image.name] if episode.image else [])
+            if names.intersection(item_names) or len(set(item_names)) != len(item_names):
+                self.stdout.write(f'skipped "{item.title}": other item has the same file name')
+                continue
+            names.update(item_names)
+            items.append(item)
+            episodes.append(episode)
+
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            files = [f for item, episode in zip(items, episodes) for f in self._files(item, episode)]
+            probes = dict(zip(
+                [name for _, name in files],
+                pool.map(checked_probe, [source for source, _ in files], chunksize=8),
+            ))
+
+            # items with unreadable files are skipped before any file is copied
+            readable = []
+            for item, episode in zip(items, episodes):
+                if errors := [probes[name].error for _, name in self._files(item, episode) if probes[name].error]:
+                    self.stderr.write(f'skipped "{item.title}": {"; ".join(errors)}')
+                else:
+                    readable.append((item, episode))
+            items, episodes = [item for item, _ in readable], [episode for _, episode in readable]
+
+            files = [f for item, episode in readable for f in self._files(item, episode)]
+            digests = {}
+            for source, name in files:
+                if other := digests.get(probes[name].digest):
+                    self.stdout.write(f'warning: {source} has the same content as {other}')
+                digests.setdefault(probes[name].digest, source)
+
+            transfers = dict(zip([name for _, name in files], pool.map(
+                transfer,
+                [source for source, _ in files],
+                [default_storage.path(name) for _, name in files],
+                [probes[name].digest for _, name in files],
+                [options['link']] * len(files),
+                chunksize=8,
+            )))
+        hashes = {name: probes[name].digest[:HASH_LENGTH] for name in transfers}
+        created = [name for name, result in transfers.items() if result.created]
+
+        imported = []
+        for item, episode in zip(items, episodes):
+            results = [transfers[episode.audio.name]] + ([transfers[episode.image.name]] if episode.image else [])
+            if errors := [result.error for result in results if result.error]:
+                self.stderr.write(f'skipped "{item.title}": {"; ".join(errors)}')
+                # files of the item which are copied are removed
+                for name in (episode.audio.name, episode.image.name):
+                    if name in created:
+                        default_storage.delete(name)
+                        created.remove(name)
+                continue
+
+            episode.audio_size = results[0].size
+            episode.audio_hash = hashes[episode.audio.name]
+            if episode.image:
+                episode.image_hash = hashes[episode.image.name]
+            imported.append(episode)
+
+        batch_size = max(options['batch_size'], 1)
+        try:
+            with transaction.atomic():
+                for i in range(0, len(imported), batch_size):
+                    Episode.objects.bulk_create(imported[i:i + batch_size])
+                # post_save signals are not sent by bulk_create
+                selection.update_episodes(imported)
+                Podcast.objects.filter(pk=podcast.pk).touch()
+        except Exception:
+            for name in created:
+                default_storage.delete(name)
+            raise
+
+        duration = time.perf_counter() - start
+        total = sum(e.audio_size for e in imported)
+        self.stdout.write(self.style.SUCCESS(
+            f'imported {len(imported)} episodes, {filesizeformat(total)} in {duration:.2f}s: '
+            f'{len(imported) / duration:.1f} episodes/s, {filesizeformat(total / duration)}/s'
+        ))
@@ -0,0 +1,28 @@
+import os
+import tarfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from podcast.backup import ArchiveError, restore
+
+
+class Command(BaseCommand):
+    help = 'Restores a podcast from a tar archive created by export_podcast command'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('archive', help='archive file path')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of parallel file writers')
+
+    def handle(self, *args, **options) -> None:
+        start = time.perf_counter()
+        try:
+            podcast, size = restore(options['archive'], max(options['workers'], 1))
+        except (ArchiveError, OSError, tarfile.TarError) as e:
+            raise CommandError(f'failed to restore the archive: {e}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'restored "{podcast.slug}" with {podcast.episode_set.count()} episodes, '
+            f'{filesizeformat(size)} in {time.perf_counter() - start:.2f}s'
+        ))
@@ -0,0 +1,82 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from podcast import media
+from podcast.models import AggregateFeed, Episode, Podcast
+
+
+class Command(BaseCommand):
+    help = (
+        'Copies local media files of podcasts and episodes to the object storage of STORAGES setting, '
+        'files keep their names, so rows are not changed. It can be interrupted and run again, '
+        'copied files are skipped.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=8, help='number of parallel uploads')
+        parser.add_argument('--delete', action='store_true', help='remove local files after their upload')
+        parser.add_argument('--dry-run', action='store_true', help='only print the number of files to copy')
+
+    @staticmethod
+    def _names() -> List[str]:
+        names: Set[str] = set()
+        for model in (Podcast, AggregateFeed):
+            names.update(model.objects.exclude(image='').values_list('image', flat=True))
+        for audio, image in Episode.objects.values_list('audio', 'image'):
+            names.update(name for name in (audio, image) if name)
+        return sorted(names)
+
+    def _copy(self, source: FileSystemStorage, name: str, delete: bool) -> Optional[int]:
+        """Uploads the local file, returns the number of uploaded bytes, None if it is not found."""
+        try:
+            size = source.size(name)
+        except FileNotFoundError:
+            return None
+
+        try:
+            stored = default_storage.size(name)
+        except FileNotFoundError:
+            stored = None
+
+        uploaded = -1
+        # a file of a previous interrupted run has the same size
+        if stored != size:
+            if stored is not None:
+                default_storage.delete(name)  # an object is replaced, its name is kept
+            with source.open(name) as f:
+                if default_storage.save(name, f) != name:
+                    raise CommandError(f'{name} is renamed by the storage')
+            uploaded = size
+        if delete:
+            source.delete(name)
+        return uploaded
+
+    def handle(self, *args, **options) -> None:
+        if media.is_local(default_storage):
+            raise CommandError('the default storage is local, set an object storage backend of STORAGES first')
+
+        source = FileSystemStorage()
+        names = [name for name in self._names() if os.path.isfile(source.path(name))]
+        if options['dry_run']:
+            self.stdout.write(f'{len(names)} local files are to be copied')
+            return
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            sizes = list(pool.map(lambda name: self._copy(source, name, options['delete']), names))
+
+        # -1 is a file copied by a previous run
+        uploaded = [size for size in sizes if size is not None and size >= 0]
+        skipped = sizes.count(-1)
+        if missing := sizes.count(None):
+            self.stdout.write(self.style.WARNING(f'{missing} files are removed during the copy'))
+        self.stdout.write(self.style.SUCCESS(
+            f'copied {len(uploaded)} files, {filesizeformat(sum(uploaded))} in {time.perf_counter() - start:.2f}s, '
+            f'{skipped} were copied before'
+        ))
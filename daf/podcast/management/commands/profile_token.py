@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from podcast.middleware import PROFILE_HEADER, profile_token
+
+
+class Command(BaseCommand):
+    help = 'Prints a signed header value to profile requests'
+
+    def handle(self, *args, **options) -> None:
+        self.stdout.write(f'{PROFILE_HEADER}: {profile_token()}')
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from podcast import search
+
+
+class Command(BaseCommand):
+    help = 'Indexes all podcasts and episodes for the full-text search again'
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--database', default='default', help='database alias')
+
+    def handle(self, *args, **options) -> None:
+        if not search.available(options['database']):
+            raise CommandError('full-text index is available only for SQLite databases')
+
+        start = time.perf_counter()
+        search.rebuild(options['database'])
+        self.stdout.write(self.style.SUCCESS(f'search index is rebuilt in {time.perf_counter() - start:.2f}s'))
@@ -0,0 +1,113 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from podcast import media
+from podcast.bulk import link_file, unreferenced
+from podcast.models import Episode, Podcast, archive_directory_path, image_directory_path, podcast_directory_path
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves audio files and images of episodes to the directory layout of PODCAST_MEDIA_SHARD_DEPTH setting. '
+        'It can be interrupted and run again, moved files are skipped.'
+    )
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument('--workers', type=int, default=8, help='number of parallel file operations')
+        parser.add_argument('--batch-size', type=int, default=500, help='number of episodes per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='only print the number of files to move')
+
+    @staticmethod
+    def _targets(episode: Episode) -> Dict[str, str]:
+        """Returns new names of the episode files which are not in place."""
+        targets = {}
+        for field, layout in (('audio', podcast_directory_path), ('image', image_directory_path)):
+            if name := getattr(episode, field).name:
+                if field == 'audio' and name.startswith(f'{settings.PODCAST_ARCHIVE_DIRECTORY}/'):
+                    layout = archive_directory_path  # moved by "apply_retention --move"
+                target = layout(episode, os.path.basename(name))
+                if target != name:
+                    targets[name] = target
+        return targets
+
+    @staticmethod
+    def _place(source: str, target: str) -> Optional[str]:
+        """
+        Links the file to the target name and returns it. A target file of a previous
+        interrupted run is reused, None is returned if it is another file.
+        """
+        source_path, target_path = default_storage.path(source), default_storage.path(target)
+        if not os.path.exists(source_path):
+            return None
+        if os.path.exists(target_path):
+            return target if os.path.samefile(source_path, target_path) else None
+        link_file(source_path, target_path)
+        return target
+
+    def _move(self, pool: ThreadPoolExecutor, episodes: List[Episode]) -> Tuple[int, int]:
+        """Moves files of the episodes batch, returns numbers of moved and skipped files."""
+        targets: Dict[str, str] = {}
+        for episode in episodes:
+            targets.update(self._targets(episode))
+        results = zip(targets, pool.map(lambda name: self._place(name, targets[name]), targets))
+        placed = {source: target for source, target in results if target}
+        skipped = len(targets) - len(placed)
+        if not placed:
+            return 0, skipped
+
+        changed = {}
+        now = timezone.now()
+        for episode in episodes:
+            for field in ('audio', 'image'):
+                file = getattr(episode, field)
+                if file.name in placed:
+                    file.name = placed[file.name]
+                    episode.updated = now
+                    changed[episode.pk] = episode
+
+        with transaction.atomic():
+            Episode.objects.bulk_update(changed.values(), ['audio', 'image', 'updated'])
+            # audio URLs of feeds are changed
+            Podcast.objects.filter(pk__in={e.podcast_id for e in changed.values()}).touch()
+            unused = unreferenced(set(placed))
+
+        # old names are removed after the commit, a repeated run does not need them
+        list(pool.map(default_storage.delete, unused))
+        return len(placed), skipped
+
+    def handle(self, *args, **options) -> None:
+        if not media.is_local(default_storage):
+            raise CommandError('keys of an object storage are not sharded')
+        depth = settings.PODCAST_MEDIA_SHARD_DEPTH
+        batch_size = max(options['batch_size'], 1)
+        episodes = Episode.objects.select_related('podcast').only(
+            'id', 'audio', 'image', 'podcast__slug',
+        ).order_by('pk')
+
+        start = time.perf_counter()
+        last_pk, moved, skipped = 0, 0, 0
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            while batch := list(episodes.filter(pk__gt=last_pk)[:batch_size]):
+                last_pk = batch[-1].pk
+                if options['dry_run']:
+                    moved += sum(len(self._targets(e)) for e in batch)
+                    continue
+                batch_moved, batch_skipped = self._move(pool, batch)
+                moved, skipped = moved + batch_moved, skipped + batch_skipped
+
+        if options['dry_run']:
+            self.stdout.write(f'{moved} files are to be moved to the layout of depth {depth}')
+            return
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'{skipped} files are skipped: not found or new names are taken'))
+        self.stdout.write(self.style.SUCCESS(
+            f'moved {moved} files to the layout of depth {depth} in {time.perf_counter() - start:.2f}s'
+        ))
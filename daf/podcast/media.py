@@ -0,0 +1,136 @@
+"""
+Episodes audio files serving with byte ranges support.
+
+Files of an object storage are redirected to their storage URLs.
+"""
+import hashlib
+import re
+from typing import Iterator, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db.models.fields.files import FieldFile
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.http.response import HttpResponseBase
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import http_date
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# content hash of versioned URLs, hex digits
+HASH_LENGTH = 16
+VERSION_PREFIX = 'h/'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns the first and the last (inclusive) positions of a single bytes range.
+    None is returned if the whole file is to be sent, multiple ranges are not supported.
+    """
+    m = RANGE_RE.match(header.strip()) if header else None
+    if not m or m.groups() == ('', ''):
+        return None
+
+    first, last = m.groups()
+    if not first:
+        # suffix range, last N bytes
+        first, last = max(size - int(last), 0), size - 1
+    else:
+        first, last = int(first), min(int(last), size - 1) if last else size - 1
+
+    if first >= size or first > last:
+        raise RangeNotSatisfiable(header)
+    return first, last
+
+
+def file_chunks(path: str, start: int, length: int) -> Iterator[bytes]:
+    chunk_size = settings.PODCAST_MEDIA_CHUNK_SIZE
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_digest(file: FieldFile) -> str:
+    """Returns the content hash of a new or stored file."""
+    h = hashlib.sha256()
+    committed = file._committed
+    try:
+        for chunk in file.chunks(settings.PODCAST_MEDIA_CHUNK_SIZE):
+            h.update(chunk)
+    finally:
+        if committed:
+            file.close()  # a new file is read again by its saving
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+def versioned_url(file: FieldFile, digest: str) -> str:
+    """
+    Returns the file URL with its content hash, the file is not changed by this URL,
+    so it is cached forever. The usual URL is returned if the hash is unknown.
+    Versioned URLs are served by Django, files of an object storage are redirected.
+    """
+    if not digest:
+        return file.url
+    return f'{settings.MEDIA_URL}{VERSION_PREFIX}{digest}/{filepath_to_uri(file.name)}'
+
+
+def is_local(storage: Storage) -> bool:
+    """Files of a local storage are sent by Django or nginx, other storages send them by their URLs."""
+    return isinstance(storage, FileSystemStorage)
+
+
+def _redirect(request, file: FieldFile, size: Optional[int]) -> Tuple[HttpResponseBase, int]:
+    """Redirects to the storage URL, the file and its ranges are sent by the storage."""
+    response = HttpResponseRedirect(file.storage.url(file.name))
+    if size is None:
+        return response, 0
+    try:
+        requested = byte_range(request.headers.get('Range', ''), size)
+    except RangeNotSatisfiable:
+        return response, 0
+    first, last = requested or (0, size - 1)
+    return response, last - first + 1 if size else 0
+
+
+def serve(request, file: FieldFile, content_type: str, size: Optional[int] = None) -> Tuple[HttpResponseBase, int]:
+    """
+    Returns a response for the file and the number of bytes to be sent.
+    The storage is not asked for the file size if it is known.
+    """
+    if not is_local(file.storage):
+        return _redirect(request, file, size)
+
+    size = file.size if size is None else size
+    try:
+        requested = byte_range(request.headers.get('Range', ''), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+        return response, 0
+
+    first, last = requested or (0, size - 1)
+    length = last - first + 1 if size else 0
+
+    if (accel_prefix := settings.PODCAST_MEDIA_ACCEL_REDIRECT) and not settings.DEBUG:
+        # the file and its ranges are sent by nginx, workers are not blocked by slow clients
+        response = HttpResponse(content_type=content_type)
+        response.headers['X-Accel-Redirect'] = accel_prefix + file.name
+    elif requested:
+        response = StreamingHttpResponse(file_chunks(file.path, first, length), status=206, content_type=content_type)
+        response.headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response.headers['Content-Length'] = str(length)
+    else:
+        response = FileResponse(open(file.path, 'rb'), content_type=content_type)
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Last-Modified'] = http_date(file.storage.get_modified_time(file.name).timestamp())
+    return response, length
@@ -0,0 +1,224 @@
+"""
+Application metrics.
+
+Every process accumulates counters in memory and periodically adds them
+to the database, so values are aggregated across all uWSGI processes.
+Histograms are stored as their cumulative bucket, sum and count counters.
+"""
+import functools
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import Http404
+
+from . import buffers
+from .models import Metric
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FILE_STAT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+THROUGHPUT_BUCKETS = (2 ** 16, 2 ** 18, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28)
+
+
+@dataclass(frozen=True)
+class Family:
+    kind: str
+    help: str
+    buckets: Tuple[float, ...] = ()
+
+
+FAMILIES: Dict[str, Family] = {
+    'daf_requests_total': Family('counter', 'Handled requests.'),
+    'daf_request_duration_seconds': Family('histogram', 'Request processing time.', DURATION_BUCKETS),
+    'daf_db_queries': Family('histogram', 'SQL queries per request.', QUERIES_BUCKETS),
+    'daf_response_bytes_total': Family('counter', 'Sent response body bytes.'),
+    'daf_feed_cache_total': Family('counter', 'Rendered feeds cache lookups.'),
+    'daf_feed_compressed_bytes_saved_total': Family('counter', 'Bytes saved by precompressed feeds.'),
+    'daf_upload_bytes_total': Family('counter', 'Received upload bytes.'),
+    'daf_upload_throughput_bytes_per_second': Family(
+        'histogram', 'Upload request processing throughput.', THROUGHPUT_BUCKETS,
+    ),
+    'daf_file_stat_seconds': Family('histogram', 'Media file stat latency.', FILE_STAT_BUCKETS),
+}
+
+_buffer = buffers.CounterBuffer(Metric, ('name', 'labels'), ('value',))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    return ','.join(f'{name}="{_escape(str(value))}"' for name, value in sorted(labels.items()))
+
+
+def _add(name: str, labels: str, value: float) -> None:
+    _buffer.add((name, labels), value)
+
+
+def incr(name: str, value: float = 1, **labels: str) -> None:
+    """Increments a counter with the given labels."""
+    _add(name, _labels(labels), value)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    """Adds a value to a histogram with the given labels."""
+    formatted = _labels(labels)
+    prefix = f'{formatted},' if formatted else ''
+    for bucket in FAMILIES[name].buckets:
+        if value <= bucket:
+            _add(f'{name}_bucket', f'{prefix}le="{bucket}"', 1)
+    _add(f'{name}_bucket', f'{prefix}le="+Inf"', 1)
+    _add(f'{name}_sum', formatted, value)
+    _add(f'{name}_count', formatted, 1)
+
+
+@contextmanager
+def timer(name: str, **labels: str) -> Iterator[None]:
+    """Observes a duration of the block."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def flush() -> None:
+    """Adds accumulated values to the shared database counters."""
+    _buffer.flush()
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _sort_key(item: Tuple[str, str, float]) -> Tuple[str, str, float]:
+    name, labels, _ = item
+    if m := re.search(r'(?:^|,)le="([^"]+)"', labels):
+        return name, labels.replace(m.group(0), ''), float(m.group(1))
+    return name, labels, 0.0
+
+
+def export() -> str:
+    """Returns all stored metrics in Prometheus text format."""
+    rows = sorted(Metric.objects.values_list('name', 'labels', 'value'), key=_sort_key)
+    lines = []
+    for family_name, family in FAMILIES.items():
+        if family.kind == 'histogram':
+            names = {f'{family_name}_{suffix}' for suffix in ('bucket', 'sum', 'count')}
+        else:
+            names = {family_name}
+        lines.append(f'# HELP {family_name} {family.help}')
+        lines.append(f'# TYPE {family_name} {family.kind}')
+        for name, labels, value in rows:
+            if name in names:
+                value = _format_value(value)
+                lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# ----------- requests instrumentation -----------
+
+_current: ContextVar[Optional['Measurement']] = ContextVar('daf_measurement', default=None)
+
+
+class Measurement:
+    """Metrics of a single request."""
+
+    def __init__(self, endpoint: str, request) -> None:
+        self.endpoint = endpoint
+        self.request_bytes = int(request.META.get('CONTENT_LENGTH') or 0)
+        self.podcast = ''
+        self.cache_hit: Optional[bool] = None
+        self.queries = 0
+        self.start = time.perf_counter()
+
+    def finish(self, status: int, response_bytes: int = 0) -> None:
+        duration = time.perf_counter() - self.start
+        labels = {'endpoint': self.endpoint, 'podcast': self.podcast}
+
+        incr('daf_requests_total', status=str(status), **labels)
+        observe('daf_request_duration_seconds', duration, **labels)
+        observe('daf_db_queries', self.queries, **labels)
+        incr('daf_response_bytes_total', response_bytes, **labels)
+        if self.cache_hit is not None:
+            incr('daf_feed_cache_total', result='hit' if self.cache_hit else 'miss', **labels)
+        if self.request_bytes:
+            incr('daf_upload_bytes_total', self.request_bytes, **labels)
+            observe('daf_upload_throughput_bytes_per_second', self.request_bytes / duration, **labels)
+
+
+def count_queries(execute, sql, params, many, context):
+    """Database execute wrapper, counts queries of the instrumented request."""
+    if m := _current.get():
+        m.queries += 1
+    return execute(sql, params, many, context)
+
+
+def install_queries_counter(sender, connection, **kwargs) -> None:
+    """Handler of connection_created signal, the current context is propagated to sync_to_async threads."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def set_podcast(slug: str) -> None:
+    if m := _current.get():
+        m.podcast = slug
+
+
+def set_cache_hit(hit: bool) -> None:
+    if m := _current.get():
+        m.cache_hit = hit
+
+
+def _response_bytes(response) -> int:
+    return 0 if response.streaming else len(response.content)
+
+
+def instrument(endpoint: str) -> Callable:
+    """Decorator for sync and async views which records requests metrics."""
+
+    def decorator(view: Callable) -> Callable:
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                m = Measurement(endpoint, request)
+                token = _current.set(m)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except Http404:
+                    m.finish(404)
+                    raise
+                finally:
+                    _current.reset(token)
+                m.finish(response.status_code, _response_bytes(response))
+                if buffers.flush_due():
+                    await sync_to_async(buffers.flush_all)()
+                return response
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            m = Measurement(endpoint, request)
+            token = _current.set(m)
+            try:
+                response = view(request, *args, **kwargs)
+            except Http404:
+                m.finish(404)
+                raise
+            finally:
+                _current.reset(token)
+            m.finish(response.status_code, _response_bytes(response))
+            if buffers.flush_due():
+                buffers.flush_all()
+            return response
+
+        return wrapper
+
+    return decorator
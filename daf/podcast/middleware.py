@@ -0,0 +1,206 @@
+import cProfile
+import io
+import marshal
+import pstats
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+
+from .models import ProfileReport
+
+PROFILE_HEADER = 'X-DAF-Profile'
+PROFILE_SESSION_KEY = 'daf_profile'
+PROFILE_SALT = 'daf.profile'
+
+
+def profile_token() -> str:
+    """Returns a new signed value of the profiling header."""
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign('profile')
+
+
+class QueriesCapture:
+    """Database execute wrapper which saves all queries with their durations."""
+
+    def __init__(self) -> None:
+        self.queries: List[tuple[float, str]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - start, sql))
+
+    @property
+    def duration(self) -> float:
+        return sum(d for d, _ in self.queries)
+
+    def report(self) -> str:
+        return '\n'.join(f'{d:.6f}s {sql}' for d, sql in self.queries)
+
+
+# queries capture of the profiled request, the context is propagated to sync_to_async threads
+_capture: ContextVar[Optional[QueriesCapture]] = ContextVar('daf_queries_capture', default=None)
+
+
+def capture_queries(execute, sql, params, many, context):
+    """Database execute wrapper, saves queries of the profiled request."""
+    if capture := _capture.get():
+        return capture(execute, sql, params, many, context)
+    return execute(sql, params, many, context)
+
+
+def install_queries_capture(sender, connection, **kwargs) -> None:
+    """Handler of connection_created signal."""
+    if capture_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_queries)
+
+
+class ProfilingMiddleware:
+    """
+    Runs opted-in requests under cProfile and saves their reports.
+    A request is profiled if it has a valid signed header, a staff session flag
+    or it is selected by PODCAST_PROFILE_SAMPLE_RATE.
+    It supports both handlers, so async views are not adapted to threads by ASGI.
+    A profile of an async request includes other tasks of the event loop which run meanwhile,
+    the number of concurrent requests is noted in its report.
+    """
+    sync_capable = True
+    async_capable = True
+    # only one profiler can be active in a process
+    _lock = threading.Lock()
+    # async requests in flight of the event loop and their max number during the profiled request
+    _in_flight = 0
+    _peak = 0
+
+    def __init__(self, get_response: Callable) -> None:
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _signed(request) -> bool:
+        if token := request.headers.get(PROFILE_HEADER):
+            try:
+                signing.TimestampSigner(salt=PROFILE_SALT).unsign(
+                    token, max_age=settings.PODCAST_PROFILE_TOKEN_MAX_AGE,
+                )
+                return True
+            except signing.BadSignature:
+                pass
+        return False
+
+    @staticmethod
+    def _sampled() -> bool:
+        rate = settings.PODCAST_PROFILE_SAMPLE_RATE
+        return bool(rate and random.random() < rate)
+
+    @classmethod
+    def reason(cls, request) -> Optional[str]:
+        if cls._signed(request):
+            return 'header'
+        session = getattr(request, 'session', None)
+        if session is not None and session.get(PROFILE_SESSION_KEY) and request.user.is_staff:
+            return 'session'
+        return 'sample' if cls._sampled() else None
+
+    @classmethod
+    async def areason(cls, request) -> Optional[str]:
+        """Async version of reason(), the session and the user are loaded without blocking the event loop."""
+        if cls._signed(request):
+            return 'header'
+        session = getattr(request, 'session', None)
+        if session is not None and await session.aget(PROFILE_SESSION_KEY) and (await request.auser()).is_staff:
+            return 'session'
+        return 'sample' if cls._sampled() else None
+
+    async def _acall(self, request):
+        cls = type(self)
+        cls._in_flight += 1
+        cls._peak = max(cls._peak, cls._in_flight)
+        try:
+            if not (reason := await self.areason(request)) or not self._lock.acquire(blocking=False):
+                return await self.get_response(request)
+            try:
+                capture = QueriesCapture()
+                token = _capture.set(capture)
+                profiler = cProfile.Profile()
+                cls._peak = cls._in_flight
+                start = time.perf_counter()
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+                    _capture.reset(token)
+                duration = time.perf_counter() - start
+                concurrent = cls._peak - 1
+            finally:
+                self._lock.release()
+        finally:
+            cls._in_flight -= 1
+
+        note = f'async request, the profile includes tasks of {concurrent} concurrent requests\n\n'
+        await sync_to_async(self.save)(request, response.status_code, reason, duration, profiler, capture, note)
+        return response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        if not (reason := self.reason(request)):
+            return self.get_response(request)
+
+        if not self._lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            capture = QueriesCapture()
+            token = _capture.set(capture)
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+                _capture.reset(token)
+            duration = time.perf_counter() - start
+        finally:
+            self._lock.release()
+
+        self.save(request, response.status_code, reason, duration, profiler, capture)
+        return response
+
+    @staticmethod
+    def save(
+            request,
+            status: int,
+            reason: str,
+            duration: float,
+            profiler: cProfile.Profile,
+            capture: QueriesCapture,
+            note: str = '',
+    ) -> ProfileReport:
+        output = io.StringIO()
+        output.write(note)
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(settings.PODCAST_PROFILE_STATS_LINES)
+        # raw stats are loaded by pstats.Stats(filename) or snakeviz
+        return ProfileReport.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:2048],
+            status=status,
+            reason=reason,
+            duration=duration,
+            queries=len(capture.queries),
+            sql_duration=capture.duration,
+            sql=capture.report(),
+            stats=output.getvalue(),
+            profile=marshal.dumps(profiler.stats),
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0003_customfeed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Metric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('labels', models.CharField(blank=True, max_length=1024, verbose_name='labels')),
+                ('value', models.FloatField(default=0, verbose_name='value')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('name', 'labels'), name='unique_metric')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0004_metric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated')),
+                ('method', models.CharField(max_length=16, verbose_name='method')),
+                ('path', models.CharField(max_length=2048, verbose_name='path')),
+                ('status', models.PositiveSmallIntegerField(default=0, verbose_name='status')),
+                ('reason', models.CharField(choices=[('header', 'signed header'), ('session', 'admin session'), ('sample', 'sampling')], max_length=16, verbose_name='reason')),
+                ('duration', models.FloatField(default=0, verbose_name='duration, s')),
+                ('queries', models.PositiveIntegerField(default=0, verbose_name='queries')),
+                ('sql_duration', models.FloatField(default=0, verbose_name='SQL duration, s')),
+                ('sql', models.TextField(blank=True, verbose_name='SQL')),
+                ('stats', models.TextField(blank=True, verbose_name='stats')),
+                ('profile', models.BinaryField(blank=True, verbose_name='profile')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:31
+
+import django.db.models.deletion
+import podcast.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0005_profilereport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='episode',
+            name='audio',
+            field=models.FileField(db_index=True, upload_to=podcast.models.podcast_directory_path, verbose_name='audio'),
+        ),
+        migrations.CreateModel(
+            name='EpisodeDownload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='day')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+                ('bytes', models.PositiveBigIntegerField(default=0, verbose_name='bytes')),
+                ('episode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='podcast.episode')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'episode'), name='unique_episode_download')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FeedPoll',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='day')),
+                ('user_agent', models.CharField(blank=True, max_length=255, verbose_name='user agent')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+                ('custom_feed', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='podcast.customfeed')),
+                ('podcast', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='podcast.podcast')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('custom_feed__isnull', True)), fields=('day', 'podcast', 'user_agent'), name='unique_feed_poll'), models.UniqueConstraint(condition=models.Q(('custom_feed__isnull', False)), fields=('day', 'custom_feed', 'user_agent'), name='unique_custom_feed_poll')],
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:33
+
+from datetime import datetime
+from statistics import median
+from typing import Sequence
+
+from django.db import migrations, models
+
+# polling hints settings and periods as of this migration, hints are recalculated by every podcast update
+TTL_MIN = 60
+TTL_MAX = 24 * 60
+CADENCE_RATIO = 0.25
+CADENCE_EPISODES = 20
+PERIODS = (
+    ('hourly', 60),
+    ('daily', 24 * 60),
+    ('weekly', 7 * 24 * 60),
+    ('monthly', 30 * 24 * 60),
+    ('yearly', 365 * 24 * 60),
+)
+
+
+def polling_hints(published: Sequence[datetime]):
+    """Returns TTL, update period and frequency, a copy of podcast.cadence.polling_hints."""
+    ttl = TTL_MIN
+    dates = sorted(published)[-CADENCE_EPISODES:]
+    if len(dates) > 1:
+        interval = median((b - a).total_seconds() for a, b in zip(dates, dates[1:])) / 60
+        ttl = int(interval * CADENCE_RATIO)
+    ttl = min(max(ttl, TTL_MIN), TTL_MAX)
+
+    period, minutes = next(((p, m) for p, m in PERIODS if ttl <= m), PERIODS[-1])
+    return ttl, period, max(minutes // ttl, 1)
+
+
+def calculate_polling_hints(apps, schema_editor):
+    Podcast = apps.get_model('podcast', 'Podcast')
+    Episode = apps.get_model('podcast', 'Episode')
+
+    for podcast in Podcast.objects.all():
+        published = Episode.objects.filter(
+            podcast_id=podcast.pk, published__isnull=False,
+        ).order_by('-published').values_list('published', flat=True)[:CADENCE_EPISODES]
+
+        ttl, update_period, update_frequency = polling_hints(published)
+        Podcast.objects.filter(pk=podcast.pk).update(
+            ttl=ttl,
+            update_period=update_period,
+            update_frequency=update_frequency,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0006_analytics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='podcast',
+            name='ttl',
+            field=models.PositiveIntegerField(default=60, verbose_name='TTL, minutes'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='update_frequency',
+            field=models.PositiveIntegerField(default=1, verbose_name='update frequency'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='update_period',
+            field=models.CharField(choices=[('hourly', 'hourly'), ('daily', 'daily'), ('weekly', 'weekly'), ('monthly', 'monthly'), ('yearly', 'yearly')], default='hourly', max_length=16, verbose_name='update period'),
+        ),
+        migrations.RunPython(calculate_polling_hints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0007_polling_hints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottledClient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='day')),
+                ('scope', models.CharField(max_length=16, verbose_name='scope')),
+                ('client', models.CharField(max_length=64, verbose_name='client')),
+                ('user_agent', models.CharField(blank=True, max_length=255, verbose_name='user agent')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='count')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'scope', 'client', 'user_agent'), name='unique_throttled_client')],
+            },
+        ),
+    ]
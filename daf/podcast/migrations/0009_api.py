@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0008_throttledclient'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EpisodeTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('episode_id', models.BigIntegerField(verbose_name='episode ID')),
+                ('deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='deleted')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['podcast', 'published', 'id'], name='episode_podcast_published'),
+        ),
+        migrations.AddIndex(
+            model_name='episode',
+            index=models.Index(fields=['podcast', 'updated', 'id'], name='episode_podcast_updated'),
+        ),
+        migrations.AddField(
+            model_name='episodetombstone',
+            name='podcast',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='podcast.podcast'),
+        ),
+        migrations.AddIndex(
+            model_name='episodetombstone',
+            index=models.Index(fields=['podcast', 'deleted', 'episode_id'], name='tombstone_podcast_deleted'),
+        ),
+        migrations.AddIndex(
+            model_name='episodetombstone',
+            index=models.Index(fields=['deleted'], name='tombstone_deleted'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:45
+
+import podcast.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0009_api'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AggregateFeed',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated')),
+                ('title', models.CharField(max_length=255, unique=True, verbose_name='title')),
+                ('image', models.ImageField(blank=True, upload_to='images', verbose_name='image')),
+                ('public_image', models.URLField(blank=True, verbose_name='public image')),
+                ('author', models.CharField(blank=True, max_length=512, verbose_name='author')),
+                ('description', models.TextField(blank=True, default='', verbose_name='description')),
+                ('slug', models.SlugField(max_length=255, unique=True, verbose_name='slug')),
+                ('subtitle', models.CharField(blank=True, default='', max_length=512, verbose_name='subtitle')),
+                ('keywords', models.CharField(blank=True, default='', max_length=512, verbose_name='keywords')),
+                ('copyright', models.CharField(blank=True, max_length=512, verbose_name='copyright')),
+                ('max_items', models.PositiveIntegerField(default=100, verbose_name='max items')),
+                ('podcasts', models.ManyToManyField(to='podcast.podcast', verbose_name='podcasts')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(podcast.models.FeedSourceMixin, models.Model),
+        ),
+    ]
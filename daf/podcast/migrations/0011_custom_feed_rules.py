@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def select_episodes(apps, schema_editor):
+    """Existing custom feeds have no rules, so all published episodes of their podcasts are selected."""
+    CustomFeed = apps.get_model('podcast', 'CustomFeed')
+    CustomFeedEpisode = apps.get_model('podcast', 'CustomFeedEpisode')
+    Episode = apps.get_model('podcast', 'Episode')
+
+    for custom_feed in CustomFeed.objects.all():
+        episodes = Episode.objects.filter(podcast_id=custom_feed.podcast_id, published__isnull=False)
+        CustomFeedEpisode.objects.bulk_create(
+            [
+                CustomFeedEpisode(custom_feed_id=custom_feed.pk, episode_id=pk, published=published)
+                for pk, published in episodes.values_list('pk', 'published')
+            ],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0010_aggregatefeed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customfeed',
+            name='exclude',
+            field=models.ManyToManyField(blank=True, related_name='+', to='podcast.episode', verbose_name='exclude'),
+        ),
+        migrations.AddField(
+            model_name='customfeed',
+            name='include',
+            field=models.ManyToManyField(blank=True, help_text='episodes selected regardless of dates and keywords', related_name='+', to='podcast.episode', verbose_name='include'),
+        ),
+        migrations.AddField(
+            model_name='customfeed',
+            name='keywords',
+            field=models.CharField(blank=True, help_text='comma separated words, one of them is to be in the title or description', max_length=512, verbose_name='keywords'),
+        ),
+        migrations.AddField(
+            model_name='customfeed',
+            name='max_items',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='max items'),
+        ),
+        migrations.AddField(
+            model_name='customfeed',
+            name='published_from',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='published from'),
+        ),
+        migrations.AddField(
+            model_name='customfeed',
+            name='published_to',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='published to'),
+        ),
+        migrations.CreateModel(
+            name='CustomFeedEpisode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published', models.DateTimeField(verbose_name='published')),
+                ('custom_feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='podcast.customfeed')),
+                ('episode', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='podcast.episode')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['custom_feed', 'published', 'episode'], name='custom_feed_episode_published')],
+                'constraints': [models.UniqueConstraint(fields=('custom_feed', 'episode'), name='unique_custom_feed_episode')],
+            },
+        ),
+        migrations.RunPython(select_episodes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# the indexed columns as of this migration, the app search module can change later
+INDEXES = (
+    ('podcast_podcast', ('title', 'subtitle', 'author', 'keywords', 'description')),
+    ('podcast_episode', ('title', 'author', 'description')),
+)
+
+
+def _statements(source, columns):
+    table = f'{source}_fts'
+    names = ', '.join(columns)
+    insert = f"INSERT INTO {table}(rowid, {names}) VALUES (new.id, {', '.join(f'new.{c}' for c in columns)});"
+    delete = (
+        f"INSERT INTO {table}({table}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {', '.join(f'old.{c}' for c in columns)});"
+    )
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({names}, content='{source}', content_rowid='id')",
+        f'CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {names} ON {source} BEGIN {delete} {insert} END',
+        f"INSERT INTO {table}({table}) VALUES ('rebuild')",
+    )
+
+
+def build_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for source, columns in INDEXES:
+        for statement in _statements(source, columns):
+            schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for source, _ in INDEXES:
+        table = f'{source}_fts'
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0011_custom_feed_rules'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_index, drop_index),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:56
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    """Saves sizes of existing audio files and episodes totals of podcasts."""
+    Episode = apps.get_model('podcast', 'Episode')
+    Podcast = apps.get_model('podcast', 'Podcast')
+
+    episodes = []
+    for episode in Episode.objects.only('id', 'audio').iterator():
+        try:
+            episode.audio_size = default_storage.size(episode.audio.name)
+        except (OSError, ValueError):
+            continue
+        episodes.append(episode)
+    Episode.objects.bulk_update(episodes, ['audio_size'], batch_size=500)
+
+    for podcast in Podcast.objects.all():
+        totals = Episode.objects.filter(podcast_id=podcast.pk).aggregate(
+            count=models.Count('pk'), size=models.Sum('audio_size'), latest=models.Max('published'),
+        )
+        Podcast.objects.filter(pk=podcast.pk).update(
+            episode_count=totals['count'], total_size=totals['size'] or 0, latest_published=totals['latest'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0012_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='audio_size',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='audio size'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='episode_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='episodes'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='latest_published',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='latest published'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='total_size',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='total size'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0013_episode_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='waveform',
+            field=models.BinaryField(blank=True, null=True, verbose_name='waveform'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:05
+
+import podcast.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0014_episode_waveform'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aggregatefeed',
+            name='image',
+            field=models.ImageField(blank=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='episode',
+            name='image',
+            field=models.ImageField(blank=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='podcast',
+            name='image',
+            field=models.ImageField(blank=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+    ]
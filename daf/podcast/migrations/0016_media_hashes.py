@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0015_image_directory_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aggregatefeed',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='image hash'),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='audio_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='audio hash'),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='image hash'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=16, verbose_name='image hash'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0016_media_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemoteImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created')),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, verbose_name='updated')),
+                ('url', models.URLField(unique=True, verbose_name='URL')),
+                ('image', models.FileField(blank=True, editable=False, upload_to='', verbose_name='image')),
+                ('image_hash', models.CharField(blank=True, editable=False, max_length=16, verbose_name='image hash')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='size')),
+                ('etag', models.CharField(blank=True, max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, max_length=64, verbose_name='last modified')),
+                ('fetched', models.DateTimeField(blank=True, null=True, verbose_name='fetched')),
+                ('expires', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='expires')),
+                ('failures', models.PositiveIntegerField(default=0, verbose_name='failures')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='error')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='aggregatefeed',
+            name='artwork',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='podcast.remoteimage', verbose_name='artwork'),
+        ),
+        migrations.AddField(
+            model_name='episode',
+            name='artwork',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='podcast.remoteimage', verbose_name='artwork'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='artwork',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='podcast.remoteimage', verbose_name='artwork'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0017_artwork'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='episode',
+            name='archived',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='archived'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='archived_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='archived episodes'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='keep_days',
+            field=models.PositiveIntegerField(default=0, verbose_name='keep episodes of days'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='keep_episodes',
+            field=models.PositiveIntegerField(default=0, verbose_name='keep newest episodes'),
+        ),
+        migrations.AddField(
+            model_name='podcast',
+            name='retention_action',
+            field=models.CharField(choices=[('archive', 'archive'), ('unpublish', 'unpublish')], default='archive', max_length=16, verbose_name='retention action'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:57
+
+import podcast.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0018_retention'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aggregatefeed',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='episode',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='podcast',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, upload_to=podcast.models.image_directory_path, verbose_name='image'),
+        ),
+        migrations.AlterField(
+            model_name='remoteimage',
+            name='image',
+            field=models.FileField(blank=True, db_index=True, editable=False, upload_to='', verbose_name='image'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('podcast', '0019_image_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PodcastTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(db_index=False, verbose_name='slug')),
+                ('deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='deleted')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['deleted'], name='podcast_tombstone_deleted'), models.Index(fields=['slug', 'deleted'], name='podcast_tombstone_slug')],
+            },
+        ),
+    ]
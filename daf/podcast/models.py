@@ -1,6 +1,7 @@
-import os
+import hashlib
 import uuid
 from dataclasses import dataclass
+from typing import List
 
 from django.conf import settings
 from django.contrib import admin
@@ -9,9 +10,15 @@ from django.contrib.syndication.views import add_domain
 from django.db import models
 from django.template.defaultfilters import filesizeformat
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.utils.html import format_html
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from .cadence import PERIODS, polling_hints
+from .media import HASH_LENGTH, file_digest, versioned_url
+from .waveform import svg
+
 
 # ----------- additional ----------------
 @dataclass(frozen=True)
@@ -24,6 +31,20 @@ class FeedRequest:
         return add_domain(self.domain, url, self.secure)
 
 
+def sharded_path(directory: str, filename: str) -> str:
+    """
+    Returns the file name in hashed sub-directories of the directory,
+    PODCAST_MEDIA_SHARD_DEPTH levels of 2 hex digits, 0 is a flat directory.
+    """
+    depth = settings.PODCAST_MEDIA_SHARD_DEPTH
+    digest = hashlib.sha256(filename.encode()).hexdigest()
+    return '/'.join([directory, *(digest[i * 2:i * 2 + 2] for i in range(depth)), filename])
+
+
+def image_directory_path(instance: models.Model, filename: str) -> str:
+    return sharded_path('images', filename)
+
+
 # ----------- abstract models -----------
 
 class CreatedUpdatedModel(models.Model):
@@ -42,24 +63,130 @@ class CreatedUpdatedModel(models.Model):
 
 class PodcastBaseModel(CreatedUpdatedModel):
     title = models.CharField(_('title'), max_length=255, unique=True)
-    image = models.ImageField(_('image'), upload_to='images', blank=True)
+    image = models.ImageField(_('image'), upload_to=image_directory_path, blank=True, db_index=True)
     public_image = models.URLField(_('public image'), blank=True)  # less priority
     author = models.CharField(_('author'), max_length=512, blank=True)
     description = models.TextField(_('description'), default='', blank=True)
+    # content hash of the versioned image URL
+    image_hash = models.CharField(_('image hash'), max_length=HASH_LENGTH, blank=True, editable=False)
+    # local copy of the public image
+    artwork = models.ForeignKey(
+        'RemoteImage', verbose_name=_('artwork'), on_delete=models.SET_NULL,
+        null=True, blank=True, editable=False, related_name='+',
+    )
+
+    # file fields and their content hash fields
+    HASHED_FILES = (('image', 'image_hash'),)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs) -> None:
+        self.set_file_hashes()
+        self.set_artwork()
+        super().save(*args, **kwargs)
+
+    def set_artwork(self) -> None:
+        """Links the local copy of the public image, new images are fetched by "cache_artwork" command."""
+        if not self.public_image:
+            self.artwork = None
+        elif settings.PODCAST_ARTWORK_CACHE:
+            self.artwork = RemoteImage.objects.filter(url=self.public_image).first()
+
+    @property
+    def artwork_url(self) -> str:
+        """Versioned URL of the public image copy, it is empty if the copy is not ready."""
+        if not settings.PODCAST_ARTWORK_CACHE or not self.artwork_id:
+            return ''
+        artwork = self.artwork
+        if artwork.url != self.public_image or not artwork.image:
+            return ''  # the public image was changed after the last fetch
+        return artwork.versioned_image_url
+
+    def set_file_hashes(self) -> None:
+        """Saves content hashes of new files, bulk_create callers have to call it explicitly."""
+        for field, hash_field in self.HASHED_FILES:
+            file = getattr(self, field)
+            if not file:
+                setattr(self, hash_field, '')
+            elif not file._committed or not getattr(self, hash_field):
+                try:
+                    setattr(self, hash_field, file_digest(file))
+                except FileNotFoundError:
+                    pass  # a missing file has the usual URL
+
+    @property
+    def versioned_image_url(self) -> str:
+        return versioned_url(self.image, self.image_hash) if self.image else ''
+
     def clean_files(self) -> None:
-        """Removes the image if it is set."""
+        """Removes the image if it is set, files of an object storage do not have local paths."""
         if self.image:
-            os.remove(self.image.path)
+            self.image.storage.delete(self.image.name)
 
 
-# ----------- real models -----------
+class FeedSourceMixin:
+    """Absolute URLs of a feed object, they depend on the current request."""
+
+    def set_request(self, request) -> FeedRequest:
+        current_site = get_current_site(request)
+        self._request = FeedRequest(current_site.domain, request.is_secure())
+        return self._request
+
+    def abs_url(self, url: str) -> str:
+        if r := getattr(self, '_request', None):
+            return r.url(url)
+        return ''
 
+    def item_image_url(self, item: PodcastBaseModel) -> str:
+        """Absolute URL of the item image, a local copy of the public image is preferred."""
+        if item.image:
+            return self.abs_url(item.versioned_image_url)
+        if url := item.artwork_url:
+            return self.abs_url(url)
+        return item.public_image
 
-class Podcast(PodcastBaseModel):
+    @property
+    def image_url(self) -> str:
+        return self.item_image_url(self)
+
+
+# ----------- real models -----------
+
+class PodcastQuerySet(models.QuerySet):
+
+    def touch(self) -> None:
+        """
+        Marks podcasts as updated, so their cached feeds are rendered again,
+        recalculates polling hints by their episodes publish cadence and episodes totals.
+        """
+        now = timezone.now()
+        for pk in self.values_list('pk', flat=True):
+            episodes = Episode.objects.filter(podcast_id=pk)
+            published = episodes.filter(
+                published__isnull=False,
+            ).order_by('-published').values_list('published', flat=True)[:settings.PODCAST_CADENCE_EPISODES]
+            totals = episodes.aggregate(
+                count=models.Count('pk'),
+                size=models.Sum('audio_size'),
+                latest=models.Max('published'),
+                archived=models.Count('pk', filter=models.Q(published__isnull=False, archived__isnull=False)),
+            )
+
+            hints = polling_hints(published)
+            Podcast.objects.filter(pk=pk).update(
+                updated=now,
+                ttl=hints.ttl,
+                update_period=hints.update_period,
+                update_frequency=hints.update_frequency,
+                episode_count=totals['count'],
+                total_size=totals['size'] or 0,
+                latest_published=totals['latest'],
+                archived_count=totals['archived'],
+            )
+
+
+class Podcast(FeedSourceMixin, PodcastBaseModel):
     """Podcast objects. Every item results to a single RSS feed."""
     slug = models.SlugField(_('slug'), max_length=255, unique=True)
     link = models.URLField(_('link'), max_length=255, default='', blank=True)
@@ -70,6 +197,29 @@ class Podcast(PodcastBaseModel):
         _('keywords'), max_length=512, default='', blank=True,
     )
     copyright = models.CharField(_('copyright'), max_length=512, blank=True)
+    # polling hints, they are calculated by episodes publish cadence
+    ttl = models.PositiveIntegerField(_('TTL, minutes'), default=60)
+    update_period = models.CharField(
+        _('update period'), max_length=16, default='hourly', choices=[(period, period) for period, _minutes in PERIODS],
+    )
+    update_frequency = models.PositiveIntegerField(_('update frequency'), default=1)
+    # episodes totals, they are updated with polling hints, so admin pages do not aggregate episodes
+    episode_count = models.PositiveIntegerField(_('episodes'), default=0)
+    total_size = models.PositiveBigIntegerField(_('total size'), default=0)
+    latest_published = models.DateTimeField(_('latest published'), null=True, blank=True)
+    archived_count = models.PositiveIntegerField(_('archived episodes'), default=0)
+    # retention policy of published episodes, it is applied by "apply_retention" command, 0 is unlimited
+    RETENTION_ACTIONS = (
+        ('archive', _('archive')),
+        ('unpublish', _('unpublish')),
+    )
+    keep_episodes = models.PositiveIntegerField(_('keep newest episodes'), default=0)
+    keep_days = models.PositiveIntegerField(_('keep episodes of days'), default=0)
+    retention_action = models.CharField(
+        _('retention action'), max_length=16, choices=RETENTION_ACTIONS, default='archive',
+    )
+
+    objects = PodcastQuerySet.as_manager()
 
     def __str__(self) -> str:
         return self.title
@@ -82,40 +232,70 @@ class Podcast(PodcastBaseModel):
         url = self.get_absolute_url()
         return format_html('<a href="{}" target="_blank">xml</a>', url)
 
-    def set_request(self, request) -> FeedRequest:
-        current_site = get_current_site(request)
-        self._request = FeedRequest(current_site.domain, request.is_secure())
-        return self._request
+    @admin.display(description=_('total size'), ordering='total_size')
+    def total_size_display(self) -> str:
+        return filesizeformat(self.total_size)
 
-    def abs_url(self, url: str) -> str:
-        if r := getattr(self, '_request', None):
-            return r.url(url)
-        return ''
 
-    @property
-    def image_url(self) -> str:
-        return self.abs_url(self.image.url) if self.image else self.public_image
+def podcast_directory_path(episode: 'Episode', filename: str) -> str:
+    return sharded_path(f'episodes/{episode.podcast.slug}', filename)
 
 
-def podcast_directory_path(episode: 'Episode', filename: str) -> str:
-    return f'episodes/{episode.podcast.slug}/{filename}'
+def archive_directory_path(episode: 'Episode', filename: str) -> str:
+    """Audio files of archived episodes are moved here by "apply_retention --move"."""
+    return sharded_path(f'{settings.PODCAST_ARCHIVE_DIRECTORY}/{episode.podcast.slug}', filename)
 
 
 class Episode(PodcastBaseModel):
     """Podcasts' episodes."""
     podcast = models.ForeignKey(Podcast, on_delete=models.CASCADE)
-    audio = models.FileField(_('audio'), upload_to=podcast_directory_path)
+    audio = models.FileField(_('audio'), upload_to=podcast_directory_path, db_index=True)
+    # it is saved to not stat files for feeds and admin pages
+    audio_size = models.PositiveBigIntegerField(_('audio size'), default=0, editable=False)
+    audio_hash = models.CharField(_('audio hash'), max_length=HASH_LENGTH, blank=True, editable=False)
+    # min/max peaks of the admin preview, it is empty if the audio file was not decoded
+    waveform = models.BinaryField(_('waveform'), null=True, blank=True, editable=False)
     published = models.DateTimeField(
         _('published'), blank=True, null=True, db_index=True,
     )
+    # archived episodes are in archive feed pages instead of the podcast feed
+    archived = models.DateTimeField(_('archived'), blank=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the API
+            models.Index(fields=['podcast', 'published', 'id'], name='episode_podcast_published'),
+            models.Index(fields=['podcast', 'updated', 'id'], name='episode_podcast_updated'),
+        ]
+
+    HASHED_FILES = (('image', 'image_hash'), ('audio', 'audio_hash'))
 
     def __str__(self) -> str:
         return f'{self.podcast.title} - {self.title}'
 
+    @property
+    def versioned_audio_url(self) -> str:
+        return versioned_url(self.audio, self.audio_hash)
+
+    def save(self, *args, **kwargs) -> None:
+        if self.audio and not self.audio._committed:
+            self.waveform = None  # a new file is to be decoded again
+        self.set_audio_size()
+        super().save(*args, **kwargs)
+
+    def set_audio_size(self) -> None:
+        """Saves the size of a new audio file, bulk_create callers have to call it explicitly."""
+        if not self.audio or (self.audio._committed and self.audio_size):
+            return
+        try:
+            self.audio_size = self.audio.size
+        except FileNotFoundError:
+            pass  # the size of a missing file is unknown
+
     def clean_files(self) -> None:
         super().clean_files()
         if self.audio:
-            os.remove(self.audio.path)
+            self.audio.storage.delete(self.audio.name)
 
     def get_absolute_url(self) -> str:
         return self.audio.url
@@ -140,26 +320,68 @@ class Episode(PodcastBaseModel):
     def mime_type(self) -> str:
         return self.get_mime_type(self.audio.name)
 
-    @admin.display(description=_('size'))
+    @admin.display(description=_('size'), ordering='audio_size')
     def size(self) -> str:
-        return filesizeformat(self.audio.size) if self.audio else '-'
+        return filesizeformat(self.audio_size) if self.audio else '-'
 
     @admin.display(description=_('play'))
     def play(self) -> str:
+        """The audio player is created on click by podcast/player.js, waveform peaks are shown instead."""
         url = self.get_absolute_url()
-        return format_html('<audio controls preload="metadata" src="{}">-</audio>', url)
+        preview = mark_safe(svg(bytes(self.waveform))) if self.waveform else ''
+        return format_html('{}<button type="button" class="button" data-audio="{}">play</button>', preview, url)
 
 
 class CustomFeed(CreatedUpdatedModel):
-    """Custom podcast feeds."""
+    """
+    Custom podcast feeds. Episodes are selected by rules, all published episodes
+    of the podcast are selected if there are no rules. The selection is stored
+    in CustomFeedEpisode table and it is updated when episodes are saved.
+    """
 
     ref = models.UUIDField(_('reference'), default=uuid.uuid4, editable=False, unique=True)
     podcast = models.ForeignKey(Podcast, on_delete=models.CASCADE)
     title = models.CharField(_('title'), max_length=255)
+    # selection rules
+    published_from = models.DateTimeField(_('published from'), null=True, blank=True)
+    published_to = models.DateTimeField(_('published to'), null=True, blank=True)
+    keywords = models.CharField(
+        _('keywords'), max_length=512, blank=True,
+        help_text=_('comma separated words, one of them is to be in the title or description'),
+    )
+    max_items = models.PositiveIntegerField(_('max items'), null=True, blank=True)
+    include = models.ManyToManyField(
+        'Episode', verbose_name=_('include'), blank=True, related_name='+',
+        help_text=_('episodes selected regardless of dates and keywords'),
+    )
+    exclude = models.ManyToManyField(
+        'Episode', verbose_name=_('exclude'), blank=True, related_name='+',
+    )
 
     def __str__(self) -> str:
         return self.title
 
+    @property
+    def keywords_list(self) -> List[str]:
+        return [word for word in (w.strip().casefold() for w in self.keywords.split(',')) if word]
+
+    def matches(self, episode: 'Episode', included: bool = False, excluded: bool = False) -> bool:
+        """Checks that the episode is selected, included and excluded flags are explicit rules for it."""
+        if excluded or episode.podcast_id != self.podcast_id or episode.published is None:
+            return False
+        if episode.archived is not None:
+            return False
+        if included:
+            return True
+        if self.published_from and episode.published < self.published_from:
+            return False
+        if self.published_to and episode.published > self.published_to:
+            return False
+        if words := self.keywords_list:
+            text = f'{episode.title}\n{episode.description}'.casefold()
+            return any(word in text for word in words)
+        return True
+
     def get_absolute_url(self) -> str:
         return reverse_lazy('custom_feed', args=[self.ref])
 
@@ -167,3 +389,197 @@ class CustomFeed(CreatedUpdatedModel):
     def feed(self) -> str:
         url = self.get_absolute_url()
         return format_html('<a href="{}" target="_blank">{}</a>', url, self.ref)
+
+
+class CustomFeedEpisode(models.Model):
+    """Selected episode of a custom feed, the publish time is copied to get the newest items by the index."""
+    custom_feed = models.ForeignKey(CustomFeed, on_delete=models.CASCADE)
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE)
+    published = models.DateTimeField(_('published'))
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['custom_feed', 'episode'], name='unique_custom_feed_episode'),
+        ]
+        indexes = [
+            models.Index(fields=['custom_feed', 'published', 'episode'], name='custom_feed_episode_published'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.custom_feed_id} {self.episode_id}'
+
+
+class AggregateFeed(FeedSourceMixin, PodcastBaseModel):
+    """Feed of the newest episodes of several podcasts."""
+    slug = models.SlugField(_('slug'), max_length=255, unique=True)
+    subtitle = models.CharField(_('subtitle'), max_length=512, default='', blank=True)
+    keywords = models.CharField(_('keywords'), max_length=512, default='', blank=True)
+    copyright = models.CharField(_('copyright'), max_length=512, blank=True)
+    podcasts = models.ManyToManyField(Podcast, verbose_name=_('podcasts'))
+    max_items = models.PositiveIntegerField(_('max items'), default=100)
+
+    def __str__(self) -> str:
+        return self.title
+
+    def get_absolute_url(self) -> str:
+        return reverse_lazy('aggregate_feed', args=[self.slug])
+
+    @admin.display(description=_('feed'))
+    def feed(self) -> str:
+        url = self.get_absolute_url()
+        return format_html('<a href="{}" target="_blank">xml</a>', url)
+
+
+class RemoteImage(CreatedUpdatedModel):
+    """Local optimized copy of a public image, it is fetched again after PODCAST_ARTWORK_REFRESH."""
+    url = models.URLField(_('URL'), unique=True)
+    image = models.FileField(_('image'), blank=True, editable=False, db_index=True)
+    image_hash = models.CharField(_('image hash'), max_length=HASH_LENGTH, blank=True, editable=False)
+    size = models.PositiveIntegerField(_('size'), default=0)
+    # validators of conditional requests
+    etag = models.CharField(_('ETag'), max_length=255, blank=True)
+    last_modified = models.CharField(_('last modified'), max_length=64, blank=True)
+    fetched = models.DateTimeField(_('fetched'), null=True, blank=True)
+    expires = models.DateTimeField(_('expires'), null=True, blank=True, db_index=True)
+    failures = models.PositiveIntegerField(_('failures'), default=0)
+    error = models.CharField(_('error'), max_length=255, blank=True)
+
+    def __str__(self) -> str:
+        return self.url
+
+    @property
+    def versioned_image_url(self) -> str:
+        return versioned_url(self.image, self.image_hash) if self.image else ''
+
+
+class EpisodeTombstone(models.Model):
+    """Deleted episode, API sync clients get it to remove the episode."""
+    podcast = models.ForeignKey(Podcast, on_delete=models.CASCADE)
+    episode_id = models.BigIntegerField(_('episode ID'))
+    deleted = models.DateTimeField(_('deleted'), default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['podcast', 'deleted', 'episode_id'], name='tombstone_podcast_deleted'),
+            models.Index(fields=['deleted'], name='tombstone_deleted'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.podcast_id} {self.episode_id}'
+
+
+class PodcastTombstone(models.Model):
+    """Deleted podcast, API sync clients get its slug to remove the podcast with its episodes."""
+    slug = models.SlugField(_('slug'), db_index=False)
+    deleted = models.DateTimeField(_('deleted'), default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted'], name='podcast_tombstone_deleted'),
+            models.Index(fields=['slug', 'deleted'], name='podcast_tombstone_slug'),
+        ]
+
+    def __str__(self) -> str:
+        return self.slug
+
+
+class FeedPoll(models.Model):
+    """Daily feed polls by a user agent."""
+    day = models.DateField(_('day'), db_index=True)
+    podcast = models.ForeignKey(Podcast, on_delete=models.CASCADE)
+    custom_feed = models.ForeignKey(CustomFeed, on_delete=models.CASCADE, null=True, blank=True)
+    user_agent = models.CharField(_('user agent'), max_length=255, blank=True)
+    count = models.PositiveIntegerField(_('count'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'podcast', 'user_agent'],
+                condition=models.Q(custom_feed__isnull=True),
+                name='unique_feed_poll',
+            ),
+            models.UniqueConstraint(
+                fields=['day', 'custom_feed', 'user_agent'],
+                condition=models.Q(custom_feed__isnull=False),
+                name='unique_custom_feed_poll',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.day} {self.podcast_id} {self.user_agent}'
+
+
+class EpisodeDownload(models.Model):
+    """Daily audio requests of an episode, including ranged ones."""
+    day = models.DateField(_('day'), db_index=True)
+    episode = models.ForeignKey(Episode, on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(_('count'), default=0)
+    bytes = models.PositiveBigIntegerField(_('bytes'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'episode'], name='unique_episode_download'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.day} {self.episode_id}'
+
+
+class ThrottledClient(models.Model):
+    """Daily rejected requests of a client."""
+    day = models.DateField(_('day'), db_index=True)
+    scope = models.CharField(_('scope'), max_length=16)
+    client = models.CharField(_('client'), max_length=64)
+    user_agent = models.CharField(_('user agent'), max_length=255, blank=True)
+    count = models.PositiveIntegerField(_('count'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'scope', 'client', 'user_agent'], name='unique_throttled_client'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.day} {self.scope} {self.client}'
+
+
+class Metric(models.Model):
+    """Application metrics counter aggregated from all processes."""
+    name = models.CharField(_('name'), max_length=255)
+    labels = models.CharField(_('labels'), max_length=1024, blank=True)
+    value = models.FloatField(_('value'), default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'labels'], name='unique_metric'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name}{{{self.labels}}}'
+
+
+class ProfileReport(CreatedUpdatedModel):
+    """Profile and SQL queries of a single request."""
+    REASONS = (
+        ('header', _('signed header')),
+        ('session', _('admin session')),
+        ('sample', _('sampling')),
+    )
+
+    method = models.CharField(_('method'), max_length=16)
+    path = models.CharField(_('path'), max_length=2048)
+    status = models.PositiveSmallIntegerField(_('status'), default=0)
+    reason = models.CharField(_('reason'), max_length=16, choices=REASONS)
+    duration = models.FloatField(_('duration, s'), default=0)
+    queries = models.PositiveIntegerField(_('queries'), default=0)
+    sql_duration = models.FloatField(_('SQL duration, s'), default=0)
+    sql = models.TextField(_('SQL'), blank=True)
+    stats = models.TextField(_('stats'), blank=True)
+    profile = models.BinaryField(_('profile'), blank=True)
+
+    def __str__(self) -> str:
+        return f'{self.method} {self.path}'
+
+    @admin.display(description=_('download'))
+    def download(self) -> str:
+        url = reverse_lazy('admin:podcast_profilereport_download', args=[self.pk])
+        return format_html('<a href="{}">{}.prof</a>', url, self.pk)
@@ -0,0 +1,59 @@
+"""
+Admin change lists of large tables without COUNT queries.
+
+Pages of the default "-pk" ordering are primary key ranges after a cursor,
+so every page is an index range scan. Other orderings use offsets,
+one extra row shows that the next page exists.
+"""
+from typing import Optional
+
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+
+CURSOR_VAR = 'after'
+
+
+class KeysetChangeList(ChangeList):
+    next_url: Optional[str] = None
+    first_url: Optional[str] = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def _cursor(self) -> Optional[int]:
+        values = self.filter_params.pop(CURSOR_VAR, None)
+        self.params.pop(CURSOR_VAR, None)
+        try:
+            return int(values[-1]) if values else None
+        except ValueError:
+            return None
+
+    def get_results(self, request):
+        cursor = self._cursor()
+        keyset = tuple(self.queryset.query.order_by) == ('-pk',)
+        queryset, offset = self.queryset, 0
+        if keyset and cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        elif not keyset:
+            offset = (max(self.page_num, 1) - 1) * self.list_per_page
+
+        rows = list(queryset[offset:offset + self.list_per_page + 1])
+        result_list = rows[:self.list_per_page]
+        if len(rows) > len(result_list):
+            if keyset:
+                self.next_url = self.get_query_string({CURSOR_VAR: result_list[-1].pk})
+            else:
+                self.next_url = self.get_query_string({PAGE_VAR: max(self.page_num, 1) + 1})
+        if cursor is not None or offset:
+            # page and cursor parameters are not kept in filter_params
+            self.first_url = self.get_query_string()
+
+        self.result_list = result_list
+        self.result_count = len(result_list)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.can_show_all = False
+        self.multi_page = bool(self.next_url or self.first_url)
+        self.paginator = None
@@ -0,0 +1,145 @@
+"""
+Full-text search of podcasts and episodes by SQLite FTS5 indexes.
+
+The indexes are external content tables of podcast_podcast and podcast_episode,
+they are updated by triggers, so bulk creates and updates are indexed too.
+Other databases use the usual case insensitive LIKE search.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Tuple, Type
+
+from django.db import connections, models
+from django.db.models.expressions import RawSQL
+
+from .models import Episode, Podcast
+
+WORD_RE = re.compile(r'\w+')
+
+
+@dataclass(frozen=True)
+class Index:
+    model: Type[models.Model]
+    columns: Tuple[str, ...]
+
+    @property
+    def source(self) -> str:
+        return self.model._meta.db_table
+
+    @property
+    def table(self) -> str:
+        return f'{self.source}_fts'
+
+    @property
+    def triggers(self) -> Tuple[str, ...]:
+        return tuple(f'{self.table}_{event}' for event in ('insert', 'delete', 'update'))
+
+    def _values(self, prefix: str) -> str:
+        return ', '.join(f'{prefix}.{column}' for column in self.columns)
+
+    def statements(self) -> Tuple[str, ...]:
+        """SQL statements to create the index and its triggers if they do not exist."""
+        columns = ', '.join(self.columns)
+        insert = f'INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {self._values("new")});'
+        delete = (
+            f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {self._values('old')});"
+        )
+        return (
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+            f"USING fts5({columns}, content='{self.source}', content_rowid='id')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.triggers[0]} AFTER INSERT ON {self.source} BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.triggers[1]} AFTER DELETE ON {self.source} BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.triggers[2]} AFTER UPDATE OF {columns} ON {self.source} '
+            f'BEGIN {delete} {insert} END',
+        )
+
+
+PODCASTS = Index(Podcast, ('title', 'subtitle', 'author', 'keywords', 'description'))
+EPISODES = Index(Episode, ('title', 'author', 'description'))
+INDEXES = (PODCASTS, EPISODES)
+
+
+def available(using: str = 'default') -> bool:
+    return connections[using].vendor == 'sqlite'
+
+
+def _rebuild(cursor, index: Index) -> None:
+    cursor.execute(f"INSERT INTO {index.table}({index.table}) VALUES ('rebuild')")
+
+
+def install(using: str = 'default', **kwargs) -> None:
+    """
+    Creates missing indexes and triggers. Triggers are dropped if a table is rebuilt by a migration,
+    rows changed without them are stale in the index, so an index with missing triggers is rebuilt.
+    """
+    if not available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {name for name, in cursor.fetchall()}
+        for index in INDEXES:
+            for statement in index.statements():
+                cursor.execute(statement)
+            if not {index.table, *index.triggers} <= existing:
+                _rebuild(cursor, index)
+
+
+def rebuild(using: str = 'default') -> None:
+    """Indexes all rows again."""
+    install(using)
+    with connections[using].cursor() as cursor:
+        for index in INDEXES:
+            _rebuild(cursor, index)
+
+
+def match_expression(text: str) -> str:
+    """FTS5 query of the user text: all words are required, the last one is a prefix."""
+    words = WORD_RE.findall(text)
+    terms = [f'"{word}"' for word in words]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _index(queryset: models.QuerySet) -> Index:
+    return next(i for i in INDEXES if i.model is queryset.model)
+
+
+def search(queryset: models.QuerySet, text: str) -> models.QuerySet:
+    """Filters the queryset by the text, all its words are to be found."""
+    index = _index(queryset)
+    if not available(queryset.db):
+        condition = models.Q()
+        for word in WORD_RE.findall(text):
+            condition &= models.Q(
+                *(models.Q(**{f'{column}__icontains': word}) for column in index.columns),
+                _connector=models.Q.OR,
+            )
+        return queryset.filter(condition)
+
+    if not (expression := match_expression(text)):
+        return queryset.none()
+    matched = f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s'
+    return queryset.filter(pk__in=RawSQL(matched, (expression,)))
+
+
+def ranked(queryset: models.QuerySet, text: str, limit: int, offset: int = 0) -> List[models.Model]:
+    """Returns a page of the queryset rows found by the text, the best matches are first."""
+    if not available(queryset.db):
+        return list(search(queryset, text).order_by('-pk')[offset:offset + limit])
+    if not (expression := match_expression(text)):
+        return []
+
+    index = _index(queryset)
+    subquery, params = queryset.values('pk').query.sql_with_params()
+    sql = (
+        f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s AND rowid IN ({subquery}) '
+        f'ORDER BY rank LIMIT %s OFFSET %s'
+    )
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, (expression, *params, limit, offset))
+        ids = [row[0] for row in cursor.fetchall()]
+
+    objects = queryset.in_bulk(ids)
+    return [objects[pk] for pk in ids if pk in objects]
@@ -0,0 +1,59 @@
+"""
+Custom feeds episodes selection.
+
+Rules are evaluated only when episodes or custom feeds are changed,
+the result is stored in CustomFeedEpisode table, so custom feeds items
+are read by one indexed join.
+"""
+from typing import Iterable
+
+from django.db import transaction
+
+from .models import CustomFeed, CustomFeedEpisode, Episode
+
+Include = CustomFeed.include.through
+Exclude = CustomFeed.exclude.through
+
+
+def update_episodes(episodes: Iterable[Episode]) -> None:
+    """Adds saved episodes to the matching custom feeds of their podcasts and removes them from other ones."""
+    episodes = list(episodes)
+    ids = [episode.pk for episode in episodes]
+    if not ids:
+        return
+
+    custom_feeds = list(CustomFeed.objects.filter(podcast_id__in={episode.podcast_id for episode in episodes}))
+    included = set(Include.objects.filter(episode_id__in=ids).values_list('customfeed_id', 'episode_id'))
+    excluded = set(Exclude.objects.filter(episode_id__in=ids).values_list('customfeed_id', 'episode_id'))
+
+    selected = [
+        CustomFeedEpisode(custom_feed=custom_feed, episode=episode, published=episode.published)
+        for episode in episodes
+        for custom_feed in custom_feeds
+        if custom_feed.matches(
+            episode,
+            included=(custom_feed.pk, episode.pk) in included,
+            excluded=(custom_feed.pk, episode.pk) in excluded,
+        )
+    ]
+    with transaction.atomic():
+        CustomFeedEpisode.objects.filter(episode_id__in=ids).delete()
+        CustomFeedEpisode.objects.bulk_create(selected)
+
+
+def rebuild(custom_feed: CustomFeed) -> None:
+    """Selects episodes of the custom feed again, it is called when its rules are changed."""
+    included = set(Include.objects.filter(customfeed=custom_feed).values_list('episode_id', flat=True))
+    excluded = set(Exclude.objects.filter(customfeed=custom_feed).values_list('episode_id', flat=True))
+    episodes = Episode.objects.filter(
+        podcast_id=custom_feed.podcast_id, published__isnull=False, archived__isnull=True,
+    ).only('id', 'podcast_id', 'title', 'description', 'published', 'archived')
+
+    selected = [
+        CustomFeedEpisode(custom_feed=custom_feed, episode=episode, published=episode.published)
+        for episode in episodes.iterator()
+        if custom_feed.matches(episode, included=episode.pk in included, excluded=episode.pk in excluded)
+    ]
+    with transaction.atomic():
+        CustomFeedEpisode.objects.filter(custom_feed=custom_feed).delete()
+        CustomFeedEpisode.objects.bulk_create(selected, batch_size=500)
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Iterator, List, Optional, Set
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import selection
+from .models import AggregateFeed, CustomFeed, Episode, EpisodeTombstone, Podcast, PodcastTombstone
+
+
+@dataclass
+class Batch:
+    """Changes of a bulk operation, they are saved once at its end."""
+    podcasts: Set[int] = field(default_factory=set)
+    tombstones: List[EpisodeTombstone] = field(default_factory=list)
+
+
+_batch: ContextVar[Optional[Batch]] = ContextVar('daf_signals_batch', default=None)
+
+
+@contextmanager
+def batch() -> Iterator[Batch]:
+    """
+    Collects podcasts to touch and tombstones of episodes saved or deleted in the block,
+    so many episodes changes invalidate every podcast feed once.
+    """
+    if _batch.get() is not None:
+        raise RuntimeError('nested signals batch')
+
+    state = Batch()
+    token = _batch.set(state)
+    try:
+        yield state
+    finally:
+        _batch.reset(token)
+
+    if state.tombstones:
+        EpisodeTombstone.objects.bulk_create(state.tombstones)
+        _remove_old_tombstones(state.tombstones[-1].deleted)
+    Podcast.objects.filter(pk__in=state.podcasts).touch()
+
+
+def _remove_old_tombstones(now, model=EpisodeTombstone) -> None:
+    model.objects.filter(deleted__lt=now - timedelta(days=settings.PODCAST_API_TOMBSTONE_DAYS)).delete()
+
+
+def _podcast_deleted(origin) -> bool:
+    """The episode is deleted by the cascade of its podcast deletion."""
+    return isinstance(origin, Podcast) or (isinstance(origin, QuerySet) and origin.model is Podcast)
+
+
+@receiver(post_save, sender=Episode)
+@receiver(post_delete, sender=Episode)
+def touch_podcast(sender, instance: Episode, origin=None, **kwargs) -> None:
+    """Marks the episode's podcast as updated, so its cached feeds are rendered again."""
+    if _podcast_deleted(origin):
+        return
+    if state := _batch.get():
+        state.podcasts.add(instance.podcast_id)
+        return
+    Podcast.objects.filter(pk=instance.podcast_id).touch()
+
+
+@receiver(post_save, sender=Episode)
+def select_episode(sender, instance: Episode, **kwargs) -> None:
+    """Updates custom feeds selections of the episode."""
+    selection.update_episodes([instance])
+
+
+@receiver(post_save, sender=CustomFeed)
+def select_custom_feed_episodes(sender, instance: CustomFeed, **kwargs) -> None:
+    """Custom feed rules can be changed, so its episodes are selected again."""
+    selection.rebuild(instance)
+
+
+@receiver(m2m_changed, sender=CustomFeed.include.through)
+@receiver(m2m_changed, sender=CustomFeed.exclude.through)
+def select_custom_feed_explicit_episodes(sender, instance, action: str, reverse: bool, **kwargs) -> None:
+    """Explicitly included or excluded episodes of a custom feed are changed."""
+    if reverse or action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    selection.rebuild(instance)
+    CustomFeed.objects.filter(pk=instance.pk).update(updated=timezone.now())
+
+
+@receiver(post_delete, sender=Episode)
+def add_tombstone(sender, instance: Episode, origin=None, **kwargs) -> None:
+    """Keeps the deleted episode ID for API sync clients, it is not needed if the whole podcast is deleted."""
+    if _podcast_deleted(origin):
+        return
+
+    tombstone = EpisodeTombstone(podcast_id=instance.podcast_id, episode_id=instance.pk, deleted=timezone.now())
+    if state := _batch.get():
+        state.tombstones.append(tombstone)
+        return
+    tombstone.save()
+    _remove_old_tombstones(tombstone.deleted)
+
+
+@receiver(post_delete, sender=Podcast)
+def add_podcast_tombstone(sender, instance: Podcast, **kwargs) -> None:
+    """Keeps the deleted podcast slug for API sync clients, tombstones of its episodes are deleted with it."""
+    tombstone = PodcastTombstone.objects.create(slug=instance.slug)
+    _remove_old_tombstones(tombstone.deleted, PodcastTombstone)
+
+
+@receiver(m2m_changed, sender=AggregateFeed.podcasts.through)
+def touch_aggregate_feed(sender, instance, action: str, reverse: bool, pk_set=None, **kwargs) -> None:
+    """Podcasts of an aggregate feed are changed, so its cached feed is rendered again."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        aggregate_feeds = AggregateFeed.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        aggregate_feeds = instance.aggregatefeed_set.all()
+    else:
+        aggregate_feeds = AggregateFeed.objects.filter(pk__in=pk_set)
+    aggregate_feeds.update(updated=timezone.now())
@@ -0,0 +1,14 @@
+'use strict';
+// audio players are created on click, so change lists do not fetch every file
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('button[data-audio]');
+    if (!button) {
+        return;
+    }
+    const audio = document.createElement('audio');
+    audio.controls = true;
+    audio.preload = 'none';
+    audio.src = button.dataset.audio;
+    button.replaceWith(audio);
+    audio.play();
+});
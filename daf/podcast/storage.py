@@ -0,0 +1,160 @@
+"""
+S3 compatible object storage of media files.
+
+It is enabled by the default backend of STORAGES setting, options are taken from PODCAST_S3_* settings.
+Files are saved by multipart uploads of PODCAST_S3_CHUNK_SIZE parts, so large episodes are streamed
+from Django temporary upload files. Audio and image URLs of feeds are not changed, Django counts
+a download and redirects it to a presigned object URL which is cached for a half of its lifetime,
+so file bytes never flow through Django.
+"""
+import hashlib
+import mimetypes
+import tempfile
+from datetime import datetime
+from typing import IO, Any, Dict, Optional
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import File
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover
+    boto3 = None
+
+NOT_FOUND = ('404', 'NoSuchKey', 'NotFound')
+
+
+@deconstructible
+class S3Storage(Storage):
+
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        prefix: Optional[str] = None,
+        public_url: Optional[str] = None,
+        url_expires: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        workers: Optional[int] = None,
+    ) -> None:
+        if boto3 is None:
+            raise ImproperlyConfigured('boto3 is not installed')
+        self.bucket = bucket or settings.PODCAST_S3_BUCKET
+        if not self.bucket:
+            raise ImproperlyConfigured('PODCAST_S3_BUCKET is not set')
+        self.endpoint_url = endpoint_url or settings.PODCAST_S3_ENDPOINT_URL or None
+        self.region = region or settings.PODCAST_S3_REGION or None
+        # credentials of the environment are used if they are empty
+        self.access_key = access_key or settings.PODCAST_S3_ACCESS_KEY or None
+        self.secret_key = secret_key or settings.PODCAST_S3_SECRET_KEY or None
+        self.prefix = prefix if prefix is not None else settings.PODCAST_S3_PREFIX
+        self.public_url = public_url if public_url is not None else settings.PODCAST_S3_PUBLIC_URL
+        self.url_expires = url_expires or settings.PODCAST_S3_URL_EXPIRES
+        chunk_size = chunk_size or settings.PODCAST_S3_CHUNK_SIZE
+        self.transfer = TransferConfig(
+            multipart_threshold=chunk_size,
+            multipart_chunksize=chunk_size,
+            max_concurrency=workers or settings.PODCAST_S3_WORKERS,
+        )
+        self._client = None
+
+    @property
+    def client(self) -> Any:
+        # clients are thread safe, one is shared by parallel transfers
+        if self._client is None:
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        return self._client
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def _head(self, name: str) -> Dict[str, Any]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in NOT_FOUND:
+                raise FileNotFoundError(name) from e
+            raise
+
+    def _open(self, name: str, mode: str = 'rb') -> File:
+        if 'w' in mode or '+' in mode:
+            raise ValueError('S3 files are read only, they are written by save()')
+        f = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            self.client.download_fileobj(self.bucket, self._key(name), f, Config=self.transfer)
+        except ClientError as e:
+            f.close()
+            if e.response.get('Error', {}).get('Code') in NOT_FOUND:
+                raise FileNotFoundError(name) from e
+            raise
+        f.seek(0)
+        return File(f, name)
+
+    def _save(self, name: str, content: IO[bytes]) -> str:
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        # parts are read from the file one by one, a large file is not loaded to memory
+        self.client.upload_fileobj(
+            content, self.bucket, self._key(name),
+            ExtraArgs={'ContentType': content_type}, Config=self.transfer,
+        )
+        return name
+
+    def copy(self, source: str, destination: str) -> None:
+        """Copies the object inside the storage, large ones are copied by parts."""
+        self.client.copy(
+            {'Bucket': self.bucket, 'Key': self._key(source)}, self.bucket, self._key(destination),
+            Config=self.transfer,
+        )
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+        cache.delete(self._url_cache_key(name))
+
+    def exists(self, name: str) -> bool:
+        try:
+            self._head(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def size(self, name: str) -> int:
+        return self._head(name)['ContentLength']
+
+    def get_modified_time(self, name: str) -> datetime:
+        return self._head(name)['LastModified']
+
+    def _url_cache_key(self, name: str) -> str:
+        digest = hashlib.md5(f'{self.bucket}:{self._key(name)}'.encode(), usedforsecurity=False).hexdigest()
+        return f'daf:s3:url:{digest}'
+
+    def url(self, name: str) -> str:
+        if self.public_url:
+            return self.public_url.rstrip('/') + '/' + quote(self._key(name))
+
+        key = self._url_cache_key(name)
+        if url := cache.get(key):
+            return url
+        url = self.client.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': self._key(name)}, ExpiresIn=self.url_expires,
+        )
+        # a cached URL is valid for a half of its lifetime at least
+        cache.set(key, url, self.url_expires // 2)
+        return url
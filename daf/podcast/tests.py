@@ -1,13 +1,51 @@
+import gzip
+import hashlib
+import http.server
+import io
+import json
 import os
+import tarfile
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
 from datetime import timedelta
 from typing import Any, Dict, Optional
+from unittest import mock, skipIf, skipUnless
 
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from django.test import TestCase
-from django.test.utils import override_settings
+from django.core.files.storage import default_storage
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.http import Http404, HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve
 from django.utils import timezone
+from django.utils.http import http_date, urlencode
+from PIL import Image
 
-from .models import CustomFeed, Episode, Podcast
+from . import admission, analytics, artwork, backup, importing, metrics, search, storage, throttling, waveform
+from .admin import EpisodeAdmin
+from .cadence import PollingHints, polling_hints
+from .middleware import PROFILE_HEADER, ProfilingMiddleware, profile_token
+from .models import (
+    AggregateFeed, CustomFeed, CustomFeedEpisode, Episode, EpisodeDownload, EpisodeTombstone, FeedPoll, Metric,
+    Podcast, PodcastQuerySet, PodcastTombstone, ProfileReport, RemoteImage, ThrottledClient, sharded_path,
+)
+from .storage import S3Storage
+from .views import FEED_HISTORY_NS, CustomEpisodesFeed, EpisodesFeed, aupload
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:  # pragma: no cover
+    mock_aws = None
 
 
 class PodcastBaseTestCase(TestCase):
@@ -15,6 +53,20 @@ class PodcastBaseTestCase(TestCase):
 
     def setUp(self) -> None:
         super().setUp()
+        cache.clear()
+
+        # shared throttling buckets and upload slots of every test
+        tmp_dir = tempfile.TemporaryDirectory(prefix='daf-')
+        self.addCleanup(tmp_dir.cleanup)
+        shared_settings = override_settings(
+            PODCAST_THROTTLE_FILE=os.path.join(tmp_dir.name, 'throttle'),
+            PODCAST_THROTTLE_SLOTS=64,
+            PODCAST_UPLOAD_SLOTS_DIR=tmp_dir.name,
+            # files are streamed by the application to check their content
+            PODCAST_MEDIA_ACCEL_REDIRECT='',
+        )
+        shared_settings.enable()
+        self.addCleanup(shared_settings.disable)
 
         self.podcasts = [
             Podcast.objects.create(
@@ -189,6 +241,316 @@ class EpisodeUploadTestCase(PodcastBaseTestCase):
         self._fail_upload(expected, data={'audio': ContentFile(b'audio', name='episode_audio.txt')})
 
 
+class BatchUploadTestCase(PodcastBaseTestCase):
+    URL = '/podcast/{}/upload/batch'
+
+    @staticmethod
+    def _data(titles: list[str], audio_name: str = 'batch_audio.mp3') -> Dict[str, Any]:
+        data = {'items-TOTAL_FORMS': str(len(titles)), 'items-INITIAL_FORMS': '0'}
+        for i, title in enumerate(titles):
+            data[f'items-{i}-title'] = title
+            data[f'items-{i}-author'] = 'Episode Author'
+            data[f'items-{i}-audio'] = ContentFile(b'audio', name=audio_name)
+        return data
+
+    def test_unknown_podcast(self) -> None:
+        resp = self.client.post(self.URL.format('bad_name'), data=self._data(['Batch 0']))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_upload(self) -> None:
+        podcast = self.podcasts[0]
+        n = podcast.episode_set.count()
+        updated = podcast.updated
+
+        data = self._data(['Batch 0', 'Batch 1', 'Batch 2'])
+        data['items-1-publish'] = True
+        resp = self.client.post(self.URL.format(podcast.slug), data=data)
+        self.assertEqual(resp.status_code, 200)
+
+        episodes = list(podcast.episode_set.filter(title__startswith='Batch').order_by('title'))
+        self.addCleanup(lambda: [e.clean_files() for e in episodes])
+        self.assertEqual(podcast.episode_set.count(), n + 3)
+        self.assertEqual([e.published is not None for e in episodes], [False, True, False])
+        for episode in episodes:
+            self.assertTrue(os.path.isfile(episode.audio.path))
+
+        result = resp.json()
+        self.assertEqual(result['code'], 'success')
+        self.assertEqual(result['items'], [
+            {'index': i, 'status': 'ok', 'id': e.id, 'title': e.title} for i, e in enumerate(episodes)
+        ])
+
+        # feed cache is invalidated once for the whole batch
+        podcast.refresh_from_db()
+        self.assertGreater(podcast.updated, updated)
+
+    def test_invalid_item(self) -> None:
+        podcast = self.podcasts[0]
+        n = podcast.episode_set.count()
+
+        data = self._data(['Batch 0', 'Batch 1'])
+        data['items-1-audio'] = ContentFile(b'audio', name='batch_audio.txt')
+        resp = self.client.post(self.URL.format(podcast.slug), data=data)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(podcast.episode_set.count(), n)
+
+        result = resp.json()
+        self.assertEqual(result['code'], 'invalid_data')
+        self.assertEqual(result['items'], [
+            {'index': 0, 'status': 'valid'},
+            {
+                'index': 1,
+                'status': 'error',
+                'fields': {'audio': [{'message': 'invalid audio file type', 'code': 'invalid_type'}]},
+            },
+        ])
+
+    def test_duplicate_titles(self) -> None:
+        podcast = self.podcasts[0]
+        n = podcast.episode_set.count()
+
+        existing = f'Episode Podcast {podcast.id} 0'  # created in setUp()
+        resp = self.client.post(self.URL.format(podcast.slug), data=self._data(['Batch 0', 'Batch 0', existing]))
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(podcast.episode_set.count(), n)
+
+        codes = [
+            [e['code'] for e in item.get('fields', {}).get('title', [])]
+            for item in resp.json()['items']
+        ]
+        self.assertEqual(codes, [[], ['duplicate'], ['unique']])
+
+    def test_items_number(self) -> None:
+        podcast = self.podcasts[0]
+        n = podcast.episode_set.count()
+
+        for titles in ([], ['Batch 0', 'Batch 1', 'Batch 2']):
+            with self.settings(PODCAST_BATCH_MAX_ITEMS=2):
+                resp = self.client.post(self.URL.format(podcast.slug), data=self._data(titles))
+            self.assertEqual(resp.status_code, 400)
+            self.assertEqual(len(resp.json()['errors']), 1)
+        self.assertEqual(podcast.episode_set.count(), n)
+
+
+class ImportEpisodesTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory(prefix='daf-import-')
+        self.addCleanup(tmp_dir.cleanup)
+        self.source = tmp_dir.name
+
+        for i in range(3):
+            with open(os.path.join(self.source, f'track{i}.mp3'), 'wb') as f:
+                f.write(f'audio{i}'.encode())
+        with open(os.path.join(self.source, 'notes.txt'), 'w') as f:
+            f.write('not an episode')
+
+    def _import(self, *args: str) -> list[Episode]:
+        out = io.StringIO()
+        call_command('import_episodes', self.podcasts[0].slug, *args, '--workers', '2', stdout=out)
+        self.assertIn('imported', out.getvalue())
+
+        return list(Episode.objects.filter(audio__contains='/track').order_by('audio'))
+
+    def test_directory(self) -> None:
+        with open(os.path.join(self.source, 'track1.json'), 'w') as f:
+            json.dump({'title': 'Imported', 'author': 'Importer', 'published': '2024-01-02T03:04:05+00:00'}, f)
+
+        updated = self.podcasts[0].updated
+        episodes = self._import(self.source, '--link', '--batch-size', '2')
+        self.addCleanup(lambda: [e.clean_files() for e in episodes])
+        self.assertEqual([e.title for e in episodes], ['track0', 'Imported', 'track2'])
+        self.assertEqual(episodes[1].author, 'Importer')
+        self.assertEqual(episodes[1].published.year, 2024)
+        self.assertIsNone(episodes[0].published)
+
+        for i, episode in enumerate(episodes):
+            self.assertEqual(episode.audio.name, f'episodes/{self.podcasts[0].slug}/track{i}.mp3')
+            with episode.audio.open('rb') as f:
+                self.assertEqual(f.read(), f'audio{i}'.encode())
+
+        self.podcasts[0].refresh_from_db()
+        self.assertGreater(self.podcasts[0].updated, updated)
+
+        # repeated import skips existing episodes
+        self.assertEqual(len(self._import(self.source)), 3)
+
+    def test_rss(self) -> None:
+        rss = os.path.join(self.source, 'feed.xml')
+        with open(rss, 'w') as f:
+            f.write(
+                '<?xml version="1.0"?>'
+                '<rss xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" version="2.0"><channel>'
+                '<item><title>RSS Episode</title><itunes:author>RSS Author</itunes:author>'
+                '<pubDate>Tue, 02 Jan 2024 03:04:05 +0000</pubDate>'
+                '<enclosure url="https://example.com/media/track2.mp3" type="audio/mpeg"/></item>'
+                '<item><title>Missing</title><enclosure url="https://example.com/absent.mp3"/></item>'
+                '</channel></rss>'
+            )
+
+        episodes = self._import(rss)
+        self.addCleanup(lambda: [e.clean_files() for e in episodes])
+        self.assertEqual(len(episodes), 1)
+        self.assertEqual((episodes[0].title, episodes[0].author), ('RSS Episode', 'RSS Author'))
+        self.assertEqual(episodes[0].published.year, 2024)
+
+    def test_unreadable(self) -> None:
+        probe = importing.probe
+
+        def failing_probe(path: str):
+            if path.endswith('track1.mp3'):
+                raise PermissionError('permission denied')
+            return probe(path)
+
+        # worker processes are forked with the patched function
+        out, err = io.StringIO(), io.StringIO()
+        with mock.patch.object(importing, 'probe', failing_probe):
+            call_command('import_episodes', self.podcasts[0].slug, self.source, workers=2, stdout=out, stderr=err)
+        episodes = list(Episode.objects.filter(audio__contains='/track').order_by('audio'))
+        self.addCleanup(lambda: [e.clean_files() for e in episodes])
+
+        self.assertEqual([e.title for e in episodes], ['track0', 'track2'])
+        self.assertIn('skipped "track1": ', err.getvalue())
+        self.assertIn('cannot be read', err.getvalue())
+        self.assertFalse(default_storage.exists(f'episodes/{self.podcasts[0].slug}/track1.mp3'))
+
+    def test_errors(self) -> None:
+        with open(os.path.join(self.source, 'track0.json'), 'w') as f:
+            f.write('{"title": ')
+        with open(os.path.join(self.source, 'track1.json'), 'w') as f:
+            json.dump({'published': 'yesterday'}, f)
+        # the image is copied, but the audio file name is taken by other content
+        with open(os.path.join(self.source, 'cover.png'), 'wb') as f:
+            f.write(b'image')
+        with open(os.path.join(self.source, 'track2.json'), 'w') as f:
+            json.dump({'image': 'cover.png'}, f)
+        taken = default_storage.save(f'episodes/{self.podcasts[0].slug}/track2.mp3', ContentFile(b'other'))
+        self.addCleanup(default_storage.delete, taken)
+        with open(os.path.join(self.source, 'track3.mp3'), 'wb') as f:
+            f.write(b'audio3')
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_episodes', self.podcasts[0].slug, self.source, '--workers', '2', stdout=out, stderr=err)
+        episodes = list(Episode.objects.filter(audio__contains='/track'))
+        self.addCleanup(lambda: [e.clean_files() for e in episodes])
+
+        self.assertEqual([e.title for e in episodes], ['track3'])
+        self.assertIn('skipped "track0": invalid metadata', out.getvalue())
+        self.assertIn('skipped "track1": invalid metadata', out.getvalue())
+        self.assertIn('skipped "track2"', err.getvalue())
+        self.assertIn('imported 1 episodes', out.getvalue())
+        self.assertFalse(default_storage.exists(sharded_path('images', 'cover.png')))
+        with default_storage.open(taken) as f:
+            self.assertEqual(f.read(), b'other')
+
+
+class BackupTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory(prefix='daf-backup-')
+        self.addCleanup(tmp_dir.cleanup)
+        self.archive = os.path.join(tmp_dir.name, 'backup.tar')
+
+        self.podcast = self.podcasts[0]
+        CustomFeed.objects.create(podcast=self.podcast, title='Custom')
+
+    def test_export(self) -> None:
+        with open(self.archive, 'wb') as f:
+            size = backup.export(self.podcast, f)
+        self.assertEqual(size, os.path.getsize(self.archive))
+
+        with tarfile.open(self.archive) as archive:
+            names = archive.getnames()
+            self.assertEqual(names[:3], [backup.PODCAST_MEMBER, backup.EPISODES_MEMBER, backup.CUSTOM_FEEDS_MEMBER])
+            rows = [json.loads(line) for line in archive.extractfile(backup.EPISODES_MEMBER)]
+            audio = archive.extractfile(f'media/{self.episodes[self.podcast.id][0].audio.name}').read()
+
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[1]['title'], f'Episode Podcast {self.podcast.id} 1')
+        self.assertIsNone(rows[0]['published'])
+        self.assertEqual(audio, b'audio')
+        # podcast image, 5 episode images and 10 audio files
+        self.assertEqual(len(names), 3 + 1 + 5 + 10)
+
+    def test_export_truncated(self) -> None:
+        # the file is truncated during the export
+        with mock.patch.object(backup, 'file_chunks', return_value=iter([b'au'])):
+            with open(self.archive, 'wb') as f, self.assertRaisesMessage(backup.ArchiveError, 'changed during'):
+                backup.export(self.podcast, f)
+
+    def test_admin_export(self) -> None:
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+
+        resp = self.client.get(f'/admin/podcast/podcast/{self.podcast.pk}/export/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        with open(self.archive, 'wb') as f:
+            f.writelines(resp.streaming_content)
+        with tarfile.open(self.archive) as archive:
+            self.assertIn(backup.PODCAST_MEMBER, archive.getnames())
+
+    def test_restore(self) -> None:
+        with open(self.archive, 'wb') as f:
+            backup.export(self.podcast, f)
+
+        expected = list(self.podcast.episode_set.order_by('pk').values_list('title', 'published', 'audio'))
+        files = [e.audio.path for e in self.episodes[self.podcast.id]]
+        Podcast.objects.filter(pk=self.podcast.pk).delete()
+        self._clean_files(files)
+
+        out = io.StringIO()
+        call_command('import_podcast', self.archive, '--workers', '4', stdout=out)
+        self.assertIn('restored "podcast0" with 10 episodes', out.getvalue())
+
+        podcast = Podcast.objects.get(slug=self.podcast.slug)
+        self.assertEqual(podcast.title, self.podcast.title)
+        self.assertEqual(podcast.customfeed_set.get().title, 'Custom')
+        self.assertEqual(list(podcast.episode_set.order_by('pk').values_list('title', 'published', 'audio')), expected)
+        for path in files:
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'audio')
+
+        with self.assertRaisesMessage(backup.ArchiveError, 'already exists'):
+            backup.restore(self.archive)
+
+    def test_restore_changed_file(self) -> None:
+        with open(self.archive, 'wb') as f:
+            backup.export(self.podcast, f)
+        episode = self.episodes[self.podcast.id][0]
+        Podcast.objects.filter(pk=self.podcast.pk).delete()
+        # a file of the same name and size, but other content
+        with open(episode.audio.path, 'wb') as f:
+            f.write(b'AUDIO')
+
+        podcast, _ = backup.restore(self.archive)
+        restored = podcast.episode_set.get(title=episode.title)
+        self.addCleanup(os.remove, restored.audio.path)
+        self.assertNotEqual(restored.audio.name, episode.audio.name)
+        with restored.audio.open('rb') as f:
+            self.assertEqual(f.read(), b'audio')
+        # files with the same content are reused
+        other = self.episodes[self.podcast.id][1]
+        self.assertEqual(podcast.episode_set.get(title=other.title).audio.name, other.audio.name)
+
+    def test_restore_conflict(self) -> None:
+        with open(self.archive, 'wb') as f:
+            backup.export(self.podcast, f)
+        files = [e.audio.path for e in self.episodes[self.podcast.id]]
+        Podcast.objects.filter(pk=self.podcast.pk).delete()
+        self._clean_files(files)
+        # episode titles are unique
+        Episode.objects.filter(pk=self.episodes[self.podcasts[1].id][0].pk).update(
+            title=self.episodes[self.podcast.id][0].title,
+        )
+
+        with self.assertRaisesMessage(backup.ArchiveError, 'conflict'):
+            backup.restore(self.archive)
+        self.assertFalse(Podcast.objects.filter(slug=self.podcast.slug).exists())
+        self.assertFalse([path for path in files if os.path.exists(path)])
+
+
 class FeedTestCase(PodcastBaseTestCase):
     maxDiff = 10_000
     URL = '/podcast/{}/rss'
@@ -215,7 +577,7 @@ class FeedTestCase(PodcastBaseTestCase):
         ]
         for episode in episodes:
             if episode.image:
-                episode.image_url = f'http://testserver{episode.image.url}'
+                episode.image_url = f'http://testserver{episode.versioned_image_url}'
             else:
                 episode.image_url = episode.public_image
         episodes.sort(key=lambda e: e.published, reverse=True)
@@ -244,9 +606,9 @@ class FeedTestCase(PodcastBaseTestCase):
             <itunes:summary>{podcast.description}</itunes:summary>
             <itunes:keywords>{podcast.keywords}</itunes:keywords>
             <itunes:explicit>no</itunes:explicit>
-            <itunes:image href="http://testserver{podcast.image.url}"/>
+            <itunes:image href="http://testserver{podcast.versioned_image_url}"/>
             <image><title>{podcast.title}</title>
-            <url>http://testserver{podcast.image.url}</url>
+            <url>http://testserver{podcast.versioned_image_url}</url>
             <link>{self.link}</link>
             </image>""")
 
@@ -259,7 +621,7 @@ class FeedTestCase(PodcastBaseTestCase):
             <pubDate>{episode.pub_date}</pubDate>
             <guid>{episode.id}</guid>
             <enclosure length="5" type="{episode.mime_type}"
-            \turl="http://testserver{episode.audio.url}"/>
+            \turl="http://testserver{episode.versioned_audio_url}"/>
             <itunes:author>{episode.author}</itunes:author>
             <itunes:summary>{episode.description}</itunes:summary>
             <itunes:image href="{episode.image_full_url}"/>
@@ -275,6 +637,78 @@ class FeedTestCase(PodcastBaseTestCase):
 
         self.assertEqual(result, expected)
 
+    def test_feed_compressed(self) -> None:
+        plain = self.client.get(self.feed_url)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        resp = self.client.get(self.feed_url, headers={'accept-encoding': 'br;q=0, gzip, deflate'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertLess(len(resp.content), len(plain.content))
+        self.assertEqual(gzip.decompress(resp.content), plain.content)
+
+        resp = self.client.get(self.feed_url, headers={'accept-encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.content, plain.content)
+
+    def test_feed_polling_hints(self) -> None:
+        podcast = self.podcasts[0]
+        podcast.refresh_from_db()
+        self.assertEqual(podcast.ttl, 60)
+
+        # weekly episodes
+        start = timezone.now() - timedelta(days=70)
+        for i, episode in enumerate(self.episodes[podcast.id]):
+            episode.published = start + timedelta(days=7 * i)
+            episode.save()
+
+        podcast.refresh_from_db()
+        self.assertEqual(
+            (podcast.ttl, podcast.update_period, podcast.update_frequency),
+            (24 * 60, 'daily', 1),
+        )
+
+        resp = self.client.get(self.feed_url)
+        self.assertContains(resp, '<ttl>1440</ttl>')
+        self.assertContains(resp, '<sy:updatePeriod>daily</sy:updatePeriod>')
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=86400')
+
+    def test_feed_not_modified(self) -> None:
+        resp = self.client.get(self.feed_url)
+        etag = resp.headers['ETag']
+
+        resp = self.client.get(self.feed_url, headers={'if-none-match': etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.headers['ETag'], etag)
+
+    def test_feed_modified_by_podcast_edit(self) -> None:
+        past = timezone.now() - timedelta(hours=1)
+        Podcast.objects.update(updated=past)
+        CustomFeed.objects.update(updated=past)
+        last_modified = self.client.get(self.feed_url).headers['Last-Modified']
+        self.assertEqual(last_modified, http_date(past.timestamp()))
+
+        podcast = Podcast.objects.get(pk=self.podcasts[0].pk)
+        podcast.title = 'Edited'
+        podcast.save()
+
+        resp = self.client.get(self.feed_url, headers={'if-modified-since': last_modified})
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, 'Edited')
+
+    def test_feed_cache_invalidation(self) -> None:
+        resp = self.client.get(self.feed_url)
+        episode = next(e for e in self.episodes[self.podcasts[0].id] if e.published is None)
+        self.assertNotContains(resp, episode.title)
+
+        episode.published = timezone.now()
+        episode.save()
+
+        resp = self.client.get(self.feed_url)
+        self.assertContains(resp, episode.title)
+
 
 class CustomFeedTestCase(FeedTestCase):
     URL = '/podcast/custom/{}'
@@ -287,3 +721,1549 @@ class CustomFeedTestCase(FeedTestCase):
         )
         self.feed_url = self.URL.format(custom_feed.ref)
         self.link = f'http://testserver/podcast/custom/{custom_feed.ref}'
+
+
+class CustomFeedRulesTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.podcast = self.podcasts[0]
+        self.episodes_list = self.episodes[self.podcast.id]
+
+        # all episodes are published daily
+        start = timezone.now() - timedelta(days=30)
+        for j, episode in enumerate(self.episodes_list):
+            episode.published = start + timedelta(days=j)
+            episode.save()
+
+    def _feed_ids(self, custom_feed: CustomFeed) -> list[int]:
+        resp = self.client.get(f'/podcast/custom/{custom_feed.ref}')
+        self.assertEqual(resp.status_code, 200)
+        return [int(guid.text) for guid in ElementTree.fromstring(resp.content).findall('./channel/item/guid')]
+
+    def _ids(self, *indexes: int) -> list[int]:
+        return [self.episodes_list[i].id for i in indexes]
+
+    def test_no_rules(self) -> None:
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='All')
+        self.assertEqual(self._feed_ids(custom_feed), self._ids(*range(9, -1, -1)))
+
+    def test_rules(self) -> None:
+        custom_feed = CustomFeed.objects.create(
+            podcast=self.podcast,
+            title='Rules',
+            published_from=self.episodes_list[2].published,
+            published_to=self.episodes_list[8].published,
+            keywords='description1, DESCRIPTION3 ,podcast %s 5' % self.podcast.id,
+        )
+        self.assertEqual(self._feed_ids(custom_feed), self._ids(5, 3))
+
+        custom_feed.include.add(self.episodes_list[0])
+        custom_feed.exclude.add(self.episodes_list[3])
+        self.assertEqual(self._feed_ids(custom_feed), self._ids(5, 0))
+
+        custom_feed.max_items = 1
+        custom_feed.save()
+        self.assertEqual(self._feed_ids(custom_feed), self._ids(5))
+
+    def test_incremental_update(self) -> None:
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='Keyword', keywords='special')
+        other = CustomFeed.objects.create(podcast=self.podcast, title='All')
+        self.assertEqual(self._feed_ids(custom_feed), [])
+
+        episode = self.episodes_list[4]
+        episode.description = 'A special episode'
+        episode.save()
+        self.assertEqual(self._feed_ids(custom_feed), [episode.id])
+        self.assertEqual(
+            list(CustomFeedEpisode.objects.filter(episode=episode).values_list('custom_feed', flat=True)),
+            [custom_feed.id, other.id],
+        )
+
+        episode.published = None
+        episode.save()
+        self.assertEqual(self._feed_ids(custom_feed), [])
+        self.assertNotIn(episode.id, self._feed_ids(other))
+
+    def test_shared_items(self) -> None:
+        custom_feeds = [
+            CustomFeed.objects.create(podcast=self.podcast, title='All'),
+            CustomFeed.objects.create(podcast=self.podcast, title='Rules', keywords='description2,description7'),
+        ]
+        custom_feeds[1].include.add(self.episodes_list[0])
+
+        # the podcast feed is rendered and cached once
+        self.assertEqual(self.client.get(f'/podcast/{self.podcast.slug}/rss').status_code, 200)
+
+        feed = CustomEpisodesFeed()
+        for custom_feed in custom_feeds:
+            url = f'/podcast/custom/{custom_feed.ref}'
+            # custom feed and its selected episodes IDs
+            with self.assertNumQueries(2):
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+
+            # items are rendered from episodes without the podcast feed
+            request = RequestFactory().get(url)
+            expected = feed.render(request, feed.get_object(request, ref=custom_feed.ref))
+            self.assertEqual(resp.content, expected.content)
+            self.assertEqual(resp.headers['Last-Modified'], expected.last_modified)
+
+    def test_batch_upload(self) -> None:
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='Keyword', keywords='batch')
+        data = {
+            'items-TOTAL_FORMS': '1',
+            'items-INITIAL_FORMS': '0',
+            'items-0-title': 'Batch Episode',
+            'items-0-publish': True,
+            'items-0-audio': ContentFile(b'audio', name='rules_audio.mp3'),
+        }
+        resp = self.client.post(f'/podcast/{self.podcast.slug}/upload/batch', data=data)
+        self.assertEqual(resp.status_code, 200)
+        episode = Episode.objects.get(title='Batch Episode')
+        self.addCleanup(episode.clean_files)
+        self.assertEqual(self._feed_ids(custom_feed), [episode.id])
+
+
+class AggregateFeedTestCase(PodcastBaseTestCase):
+    URL = '/podcast/aggregate/{}/rss'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.aggregate_feed = AggregateFeed.objects.create(title='Network', slug='network', max_items=6)
+        self.aggregate_feed.podcasts.set(self.podcasts)
+        self.url = self.URL.format(self.aggregate_feed.slug)
+
+        # episodes of both podcasts are interleaved
+        start = timezone.now() - timedelta(days=30)
+        for i, episodes in enumerate(self.episodes.values()):
+            for j, episode in enumerate(episodes):
+                episode.published = start + timedelta(days=2 * j + i) if j % 3 else None
+                episode.save()
+
+    def _guids(self, content: bytes) -> list[int]:
+        return [int(guid.text) for guid in ElementTree.fromstring(content).findall('./channel/item/guid')]
+
+    def test_feed(self) -> None:
+        with self.assertNumQueries(3):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+
+        expected = Episode.objects.filter(published__isnull=False).order_by('-published')[:6]
+        self.assertEqual(self._guids(resp.content), [e.id for e in expected])
+        self.assertEqual({e.podcast_id for e in expected}, {p.id for p in self.podcasts})
+
+        root = ElementTree.fromstring(resp.content)
+        self.assertEqual(root.findtext('./channel/title'), 'Network')
+        # polls of aggregate feeds are not counted
+        analytics.flush()
+        self.assertFalse(FeedPoll.objects.exists())
+        self.assertEqual(root.findtext('./channel/ttl'), str(min(p.ttl for p in Podcast.objects.all())))
+
+    def test_not_found(self) -> None:
+        self.assertEqual(self.client.get(self.URL.format('unknown')).status_code, 404)
+
+    def test_cache_invalidation(self) -> None:
+        resp = self.client.get(self.url)
+        etag = resp.headers['ETag']
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 304)
+
+        # a new episode of a podcast
+        episode = Episode.objects.create(
+            podcast=self.podcasts[1], title='Newest', published=timezone.now(),
+            audio=ContentFile(b'audio', name='newest.mp3'),
+        )
+        self.addCleanup(episode.clean_files)
+        resp = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(self._guids(resp.content)[0], episode.id)
+
+        # podcasts of the aggregate feed
+        etag = resp.headers['ETag']
+        self.podcasts[1].aggregatefeed_set.clear()
+        resp = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            set(Episode.objects.filter(pk__in=self._guids(resp.content)).values_list('podcast', flat=True)),
+            {self.podcasts[0].id},
+        )
+
+
+class ApiTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.podcast = self.podcasts[0]
+        self.url = f'/podcast/api/{self.podcast.slug}/episodes'
+
+    def _fetch(self, url: str) -> tuple[list[Dict[str, Any]], list[int], str]:
+        """Returns episodes and deleted IDs of all pages and the next sync value."""
+        items, deleted = [], []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            data = resp.json()
+            items.extend(data['episodes'])
+            deleted.extend(data.get('deleted', []))
+            url = data['next']
+            self.assertEqual(data['since'] is None, bool(url))
+        return items, deleted, data['since']
+
+    def test_episodes(self) -> None:
+        # all published episodes have the same time, so pages are split by IDs
+        items, _, since = self._fetch(f'{self.url}?limit=2')
+        expected = self.podcast.episode_set.filter(published__isnull=False).order_by('-published', 'id')
+        self.assertEqual([e['id'] for e in items], [e.id for e in expected])
+        self.assertEqual(
+            items[0]['audio'], f'http://testserver/media/h/{expected[0].audio_hash}/{expected[0].audio.name}',
+        )
+        # sync clients compare local files by sizes and hashes
+        self.assertEqual((items[0]['size'], items[0]['hash']), (5, hashlib.sha256(b'audio').hexdigest()[:16]))
+        self.assertIsNotNone(since)
+
+    def test_since(self) -> None:
+        _, _, since = self._fetch(self.url)
+        episodes = self.episodes[self.podcast.id]
+
+        episodes[1].title = 'Changed'
+        episodes[1].save()
+        deleted = episodes.pop(3)
+        deleted_id = deleted.id
+        deleted.delete()
+        deleted.clean_files()
+        episodes[4].published = None
+        episodes[4].save()
+
+        items, deleted_ids, next_since = self._fetch(f'{self.url}?{urlencode({"since": since, "limit": 1})}')
+        self.assertEqual((items[0]['id'], items[0]['title']), (episodes[1].id, 'Changed'))
+        # drafts are not exposed
+        self.assertEqual(items[1], {'id': episodes[4].id, 'published': None})
+        self.assertEqual(deleted_ids, [deleted_id])
+
+        items, deleted_ids, _ = self._fetch(f'{self.url}?{urlencode({"since": next_since})}')
+        self.assertEqual((items, deleted_ids), ([], []))
+
+    def test_podcast_deletion(self) -> None:
+        with mock.patch.object(PodcastQuerySet, 'touch') as touch:
+            self.podcasts[1].delete()
+            Podcast.objects.filter(pk=self.podcasts[0].pk).delete()
+        # the deleted podcasts are not touched by the cascade of their episodes
+        touch.assert_not_called()
+        self.assertFalse(EpisodeTombstone.objects.exists())
+
+    def test_podcasts(self) -> None:
+        resp = self.client.get('/podcast/api/podcasts?limit=1')
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([p['slug'] for p in data['podcasts']], ['podcast0'])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([p['slug'] for p in data['podcasts']], ['podcast1'])
+        self.assertIsNone(data['next'])
+
+        self.episodes[self.podcasts[0].id][0].save()
+        data = self.client.get('/podcast/api/podcasts', {'since': data['since']}).json()
+        self.assertEqual([p['slug'] for p in data['podcasts']], ['podcast0'])
+
+    def test_podcasts_deleted(self) -> None:
+        since = self.client.get('/podcast/api/podcasts').json()['since']
+        self.podcasts[1].delete()
+
+        data = self.client.get('/podcast/api/podcasts', {'since': since}).json()
+        self.assertEqual((data['podcasts'], data['deleted']), ([], ['podcast1']))
+        resp = self.client.get('/podcast/api/podcast1/episodes', {'since': since})
+        self.assertEqual((resp.status_code, resp.json()['code']), (410, 'deleted'))
+
+        data = self.client.get('/podcast/api/podcasts', {'since': data['since']}).json()
+        self.assertEqual((data['podcasts'], data['deleted']), ([], []))
+        self.assertEqual(PodcastTombstone.objects.count(), 1)
+
+    def test_errors(self) -> None:
+        self.assertEqual(self.client.get('/podcast/api/unknown/episodes').status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'cursor': 'invalid'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'limit': 'x'}).status_code, 400)
+
+        resp = self.client.get(self.url, {'since': (timezone.now() - timedelta(days=365)).isoformat()})
+        self.assertEqual(resp.status_code, 410)
+        self.assertEqual(resp.json()['code'], 'expired')
+
+
+class SearchTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.podcast = self.podcasts[0]
+        self.episode = self.episodes[self.podcast.id][1]
+        self.episode.title = 'Interview about sqlite internals'
+        self.episode.description = 'Full-text search of sqlite, sqlite indexes and more'
+        self.episode.save()
+        self.other = self.episodes[self.podcast.id][3]
+        self.other.description = 'A short note about sqlite'
+        self.other.save()
+
+    def test_search(self) -> None:
+        episodes = Episode.objects.all()
+        self.assertEqual(search.match_expression('sqlite "in'), '"sqlite" "in"*')
+        self.assertEqual(search.ranked(episodes, 'sqlite', 10), [self.episode, self.other])
+        self.assertEqual(search.ranked(episodes, 'sqlite', 10, offset=1), [self.other])
+        self.assertEqual(list(search.search(episodes, 'interv')), [self.episode])
+        self.assertEqual(list(search.search(episodes, 'sqlite unknown')), [])
+        self.assertEqual(list(search.search(episodes, '"*')), [])
+        self.assertEqual(list(search.search(Podcast.objects.all(), 'subtitle1')), [self.podcasts[1]])
+
+    def test_index_updates(self) -> None:
+        episodes = Episode.objects.all()
+        Episode.objects.filter(pk=self.episode.pk).update(title='Changed')
+        self.assertEqual(list(search.search(episodes, 'interview')), [])
+        self.assertEqual(list(search.search(episodes, 'changed')), [self.episode])
+
+        created = Episode.objects.bulk_create([
+            Episode(podcast=self.podcast, title='Bulk created', audio='audio.mp3', published=timezone.now()),
+        ])
+        self.assertEqual(list(search.search(episodes, 'bulk')), created)
+
+        self.other.delete()
+        self.assertEqual(list(search.search(episodes, 'note')), [])
+
+        # the index is built again from the tables
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(list(search.search(episodes, 'sqlite')), [self.episode])
+
+    def test_install_after_table_rebuild(self) -> None:
+        episodes = Episode.objects.all()
+        # a migration remaking the table drops its triggers, rows are changed without them
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {search.EPISODES.triggers[2]}')
+        Episode.objects.filter(pk=self.episode.pk).update(title='Migrated')
+        self.assertEqual(list(search.search(episodes, 'migrated')), [])
+
+        search.install()
+        self.assertEqual(list(search.search(episodes, 'migrated')), [self.episode])
+        Episode.objects.filter(pk=self.other.pk).update(title='Triggered')
+        self.assertEqual(list(search.search(episodes, 'triggered')), [self.other])
+
+    def test_admin(self) -> None:
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        resp = self.client.get('/admin/podcast/episode/', {'q': 'sqli'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(set(resp.context['cl'].result_list), {self.episode, self.other})
+
+    def test_api(self) -> None:
+        unpublished = self.episodes[self.podcast.id][0]
+        unpublished.title = 'Unpublished sqlite'
+        unpublished.save()
+
+        resp = self.client.get('/podcast/api/search', {'q': 'sqlite', 'limit': 1})
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual([(e['id'], e['podcast']) for e in data['results']], [(self.episode.id, 'podcast0')])
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([e['id'] for e in data['results']], [self.other.id])
+        self.assertIsNone(data['next'])
+
+        data = self.client.get('/podcast/api/search', {'q': 'keywords1', 'type': 'podcast'}).json()
+        self.assertEqual([p['slug'] for p in data['results']], ['podcast1'])
+
+        self.assertEqual(self.client.get('/podcast/api/search').status_code, 400)
+        self.assertEqual(self.client.get('/podcast/api/search', {'q': 'x', 'type': 'user'}).status_code, 400)
+        self.assertEqual(self.client.get('/podcast/api/search', {'q': 'x', 'offset': 'x'}).status_code, 400)
+
+
+class EpisodeAdminTestCase(PodcastBaseTestCase):
+    URL = '/admin/podcast/episode/'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+
+    def _pages(self, params: Dict[str, Any]) -> list[list[int]]:
+        pages, url = [], f'{self.URL}?{urlencode(params)}'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+            pages.append([e.pk for e in resp.context['cl'].result_list])
+            url = resp.context['cl'].next_url and self.URL + resp.context['cl'].next_url
+        return pages
+
+    def test_keyset_pages(self) -> None:
+        podcast = self.podcasts[0]
+        expected = [e.pk for e in reversed(self.episodes[podcast.id])]
+        with mock.patch.object(EpisodeAdmin, 'list_per_page', 4):
+            pages = self._pages({'podcast__id__exact': podcast.pk})
+            self.assertEqual(pages, [expected[:4], expected[4:8], expected[8:]])
+
+            # other orderings are paginated by offsets
+            pages = self._pages({'podcast__id__exact': podcast.pk, 'o': '1'})
+        self.assertEqual(sum(pages, []), [e.pk for e in sorted(self.episodes[podcast.id], key=lambda e: e.title)])
+
+    def test_page(self) -> None:
+        episode = self.episodes[self.podcasts[0].id][1]
+        os.remove(episode.audio.path)  # sizes are not read from files
+
+        resp = self.client.get(self.URL)
+        content = resp.content.decode()
+        self.assertIn(f'data-audio="{episode.audio.url}"', content)
+        self.assertNotIn('<audio', content)
+        self.assertIn('podcast/player.js', content)
+        self.assertIn('5\xa0bytes', content)
+
+    def test_podcast_totals(self) -> None:
+        podcast = self.podcasts[0]
+        episodes = self.episodes[podcast.id]
+        podcast.refresh_from_db()
+        published = max(e.published for e in episodes if e.published)
+        self.assertEqual((podcast.episode_count, podcast.total_size, podcast.latest_published), (10, 50, published))
+
+        episodes[0].published = published + timedelta(hours=1)
+        episodes[0].save()
+        deleted = episodes.pop(3)
+        deleted.delete()
+        deleted.clean_files()
+        podcast.refresh_from_db()
+        self.assertEqual((podcast.episode_count, podcast.total_size), (9, 45))
+        self.assertEqual(podcast.latest_published, episodes[0].published)
+
+
+class BulkActionsTestCase(PodcastBaseTestCase):
+    URL = '/admin/podcast/episode/'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        self.podcast = self.podcasts[0]
+        self.selected = self.episodes[self.podcast.id][:3]
+
+    def _post(self, action: str, **data: Any):
+        data = {'action': action, '_selected_action': [e.pk for e in self.selected], **data}
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(self.URL, data)
+        for thread in threading.enumerate():
+            if thread.name == 'daf-remove-files':
+                thread.join()
+        touches = [q for q in queries if q['sql'].startswith('UPDATE "podcast_podcast"')]
+        return resp, len(touches)
+
+    def test_publish(self) -> None:
+        published = self.selected[1].published
+        resp, touches = self._post('publish')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(touches, 1)
+        self.assertTrue(all(e.published for e in Episode.objects.filter(pk__in=[e.pk for e in self.selected])))
+        self.selected[1].refresh_from_db()
+        self.assertEqual(self.selected[1].published, published)
+
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='Custom')
+        resp, touches = self._post('unpublish')
+        self.assertEqual(touches, 1)
+        self.assertFalse(Episode.objects.filter(pk__in=[e.pk for e in self.selected], published__isnull=False))
+        self.assertFalse(CustomFeedEpisode.objects.filter(custom_feed=custom_feed, episode__in=self.selected))
+
+    def test_delete(self) -> None:
+        paths = [e.audio.path for e in self.selected] + [e.image.path for e in self.selected]
+        resp, touches = self._post('delete_selected', post='yes')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(touches, 1)
+        self.assertFalse(Episode.objects.filter(pk__in=[e.pk for e in self.selected]).exists())
+        self.assertEqual(EpisodeTombstone.objects.filter(podcast=self.podcast).count(), 3)
+        self.assertEqual([p for p in paths if os.path.exists(p)], [])
+
+    def test_move(self) -> None:
+        resp = self.client.post(self.URL, {'action': 'move', '_selected_action': [e.pk for e in self.selected]})
+        self.assertContains(resp, 'name="apply"')
+
+        target = self.podcasts[1]
+        old_paths = [e.audio.path for e in self.selected]
+        resp, touches = self._post('move', podcast=target.pk, apply='Move')
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(touches, 2)
+
+        moved = list(Episode.objects.filter(pk__in=[e.pk for e in self.selected]))
+        self.addCleanup(self._clean_files, [e.audio.path for e in moved])
+        for episode in moved:
+            self.assertEqual(episode.podcast_id, target.pk)
+            self.assertTrue(episode.audio.name.startswith(f'episodes/{target.slug}/'))
+            self.assertEqual(episode.audio.read(), b'audio')
+            episode.audio.close()
+        self.assertEqual([p for p in old_paths if os.path.exists(p)], [])
+        self.assertEqual(EpisodeTombstone.objects.filter(podcast=self.podcast).count(), 3)
+
+
+class ShardMediaTestCase(PodcastBaseTestCase):
+
+    def _shard(self, depth: int) -> str:
+        out = io.StringIO()
+        with override_settings(PODCAST_MEDIA_SHARD_DEPTH=depth):
+            call_command('shard_media', batch_size=3, workers=2, stdout=out)
+        return out.getvalue()
+
+    def test_layout(self) -> None:
+        with override_settings(PODCAST_MEDIA_SHARD_DEPTH=2):
+            episode = Episode.objects.create(
+                podcast=self.podcasts[0], title='Sharded', audio=ContentFile(b'audio', name='sharded.mp3'),
+            )
+            expected = sharded_path('episodes/podcast0', 'sharded.mp3')
+        self.addCleanup(os.removedirs, os.path.dirname(episode.audio.path))
+        self.addCleanup(episode.clean_files)
+        self.assertRegex(expected, r'^episodes/podcast0/[0-9a-f]{2}/[0-9a-f]{2}/sharded\.mp3$')
+        self.assertEqual(episode.audio.name, expected)
+        self.assertEqual(sharded_path('images', 'image.png'), 'images/image.png')
+
+    def test_command(self) -> None:
+        episode = Episode.objects.get(pk=self.episodes[self.podcasts[0].id][0].pk)
+        old_paths = [episode.audio.path, episode.image.path]
+        updated = Podcast.objects.get(pk=self.podcasts[0].pk).updated
+
+        # the first file was linked by an interrupted run
+        with override_settings(PODCAST_MEDIA_SHARD_DEPTH=2):
+            target = sharded_path('episodes/podcast0', os.path.basename(episode.audio.name))
+        os.makedirs(os.path.dirname(default_storage.path(target)))
+        os.link(episode.audio.path, default_storage.path(target))
+
+        self.assertIn('moved 30 files', self._shard(2))
+        self.assertIn('moved 0 files', self._shard(2))
+
+        episode.refresh_from_db()
+        self.assertEqual(episode.audio.name, target)
+        self.assertTrue(os.path.isfile(episode.audio.path))
+        self.assertEqual([p for p in old_paths if os.path.exists(p)], [])
+        self.assertGreater(Podcast.objects.get(pk=self.podcasts[0].pk).updated, updated)
+        sharded_dirs = {
+            os.path.dirname(f.path) for e in Episode.objects.all() for f in (e.audio, e.image) if f
+        }
+
+        # back to flat directories, files are removed by tearDown
+        self.assertIn('moved 30 files', self._shard(0))
+        self.assertTrue(all(os.path.exists(p) for p in old_paths))
+        for path in sharded_dirs:
+            os.removedirs(path)
+
+
+class RetentionTestCase(PodcastBaseTestCase):
+    ATOM = '{http://www.w3.org/2005/Atom}link'
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.podcast = self.podcasts[0]
+        now = timezone.now()
+        # published episodes 1, 3, 5, 7, 9 are this number of days old
+        self.published = [e for e in self.episodes[self.podcast.id] if e.published]
+        for j, episode in zip(range(1, 10, 2), self.published):
+            Episode.objects.filter(pk=episode.pk).update(published=now - timedelta(days=j, hours=1))
+
+    def _apply(self, **options: Any) -> str:
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('apply_retention', batch_size=2, stdout=out, **options)
+        for thread in threading.enumerate():
+            if thread.name == 'daf-remove-files':
+                thread.join()
+        return out.getvalue()
+
+    def _feed(self, url: str) -> ElementTree.Element:
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return ElementTree.fromstring(resp.content).find('channel')
+
+    def _pages(self, channel: ElementTree.Element) -> Dict[str, str]:
+        return {
+            link.get('rel'): link.get('href').split('/podcast/', 1)[1]
+            for link in channel.iter(self.ATOM) if link.get('rel') != 'self'
+        }
+
+    def test_keep_episodes(self) -> None:
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='Custom')
+        Podcast.objects.filter(pk=self.podcast.pk).update(keep_episodes=2)
+        self.assertIn('3 episodes are out of retention limits', self._apply(dry_run=True))
+        self.assertFalse(Episode.objects.filter(archived__isnull=False).exists())
+
+        self.assertIn('applied retention to 3 episodes', self._apply())
+        archived = set(Episode.objects.filter(archived__isnull=False).values_list('pk', flat=True))
+        self.assertEqual(archived, {e.pk for e in self.published[2:]})
+        self.assertEqual(Podcast.objects.get(pk=self.podcast.pk).archived_count, 3)
+        self.assertFalse(CustomFeedEpisode.objects.filter(custom_feed=custom_feed, episode__in=archived))
+        self.assertIn('applied retention to 0 episodes', self._apply())
+
+        channel = self._feed('/podcast/podcast0/rss')
+        self.assertEqual([int(i.findtext('guid')) for i in channel.iter('item')], [e.pk for e in self.published[:2]])
+        self.assertEqual(self._pages(channel), {'prev-archive': 'podcast0/archive/1'})
+        self.assertIsNone(channel.find(f'{{{FEED_HISTORY_NS}}}archive'))
+
+        # pages are numbered from the oldest episodes, only the newest (last) page is not full
+        with override_settings(PODCAST_ARCHIVE_PAGE_SIZE=2):
+            cache.clear()
+            channel = self._feed('/podcast/podcast0/rss')
+            self.assertEqual(self._pages(channel), {'prev-archive': 'podcast0/archive/2'})
+
+            channel = self._feed('/podcast/podcast0/archive/1')
+            self.assertEqual(
+                [int(i.findtext('guid')) for i in channel.iter('item')], [e.pk for e in self.published[3:5]],
+            )
+            self.assertEqual(self._pages(channel), {
+                'current': 'podcast0/rss',
+                'next-archive': 'podcast0/archive/2',
+            })
+            self.assertIsNotNone(channel.find(f'{{{FEED_HISTORY_NS}}}archive'))
+            channel = self._feed('/podcast/podcast0/archive/2')
+            self.assertEqual([int(i.findtext('guid')) for i in channel.iter('item')], [self.published[2].pk])
+            self.assertEqual(self._pages(channel), {
+                'current': 'podcast0/rss',
+                'prev-archive': 'podcast0/archive/1',
+            })
+            self.assertEqual(self.client.get('/podcast/podcast0/archive/3').status_code, 404)
+
+            # newly archived episodes are added to the newest page, older pages are not changed
+            Podcast.objects.filter(pk=self.podcast.pk).update(keep_episodes=1)
+            self.assertIn('applied retention to 1 episodes', self._apply())
+            channel = self._feed('/podcast/podcast0/archive/1')
+            self.assertEqual(
+                [int(i.findtext('guid')) for i in channel.iter('item')], [e.pk for e in self.published[3:5]],
+            )
+            channel = self._feed('/podcast/podcast0/archive/2')
+            self.assertEqual(
+                [int(i.findtext('guid')) for i in channel.iter('item')], [e.pk for e in self.published[1:3]],
+            )
+        self.assertEqual(self.client.get('/podcast/podcast1/archive/1').status_code, 404)
+
+    def test_keep_days(self) -> None:
+        Podcast.objects.filter(pk=self.podcast.pk).update(keep_days=4, retention_action='unpublish')
+        self.assertIn('applied retention to 3 episodes', self._apply(podcast='podcast0'))
+        self.assertEqual(
+            list(Episode.objects.filter(podcast=self.podcast, published__isnull=False).order_by('pk')),
+            self.published[:2],
+        )
+        self.assertFalse(Episode.objects.filter(archived__isnull=False).exists())
+        self.assertEqual(self._pages(self._feed('/podcast/podcast0/rss')), {})
+
+    @override_settings(PODCAST_ARCHIVE_BITRATE='64k', PODCAST_FFMPEG='/nonexistent/ffmpeg')
+    def test_move(self) -> None:
+        Podcast.objects.filter(pk=self.podcast.pk).update(keep_episodes=2)
+        old_paths = [e.audio.path for e in self.published[2:]]
+        err = io.StringIO()
+        out = self._apply(move=True, stderr=err)
+        self.assertIn('moved 3 audio files', out)
+        self.assertIn('failed to run /nonexistent/ffmpeg', err.getvalue())  # files are linked
+        self.assertIn('moved 0 audio files', self._apply(move=True))
+
+        moved = list(Episode.objects.filter(archived__isnull=False).order_by('pk'))
+        self.addCleanup(os.removedirs, os.path.dirname(moved[0].audio.path))
+        self.addCleanup(self._clean_files, [e.audio.path for e in moved])
+        self.assertEqual([p for p in old_paths if os.path.exists(p)], [])
+        for episode in moved:
+            self.assertTrue(episode.audio.name.startswith('archive/podcast0/'))
+            self.assertEqual(episode.audio_hash, hashlib.sha256(b'audio').hexdigest()[:16])
+            resp = self.client.get(episode.versioned_audio_url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(b''.join(resp.streaming_content), b'audio')
+        self.assertEqual(self.client.get(f'/media/{moved[0].audio.name}').status_code, 200)
+
+
+class MediaHashTestCase(PodcastBaseTestCase):
+
+    def test_hashes(self) -> None:
+        episode = Episode.objects.get(pk=self.episodes[self.podcasts[0].id][0].pk)
+        self.assertEqual(episode.audio_hash, hashlib.sha256(b'audio').hexdigest()[:16])
+        self.assertEqual(episode.versioned_audio_url, f'/media/h/{episode.audio_hash}/{episode.audio.name}')
+        self.assertEqual(episode.image_hash, hashlib.sha256(b'file').hexdigest()[:16])
+
+        old_path = episode.audio.path
+        episode.audio = ContentFile(b'new audio', name='new.mp3')
+        episode.save()
+        self.addCleanup(os.remove, episode.audio.path)
+        self.assertEqual(episode.audio_hash, hashlib.sha256(b'new audio').hexdigest()[:16])
+
+        # a file name without a hash is served as usual
+        episode.audio_hash = ''
+        self.assertEqual(episode.versioned_audio_url, episode.audio.url)
+        self.assertTrue(os.path.isfile(old_path))
+
+    def test_versioned_media(self) -> None:
+        episode = self.episodes[self.podcasts[0].id][0]
+        resp = self.client.get(episode.versioned_audio_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'audio')
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        resp = self.client.get(f'/media/h/0000000000000000/{episode.audio.name}')
+        self.assertRedirects(resp, episode.versioned_audio_url, fetch_redirect_response=False)
+
+        podcast = self.podcasts[0]
+        resp = self.client.get(podcast.versioned_image_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'file')
+        self.assertEqual(resp.headers['Content-Type'], 'image/png')
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        resp = self.client.get(f'/media/h/{podcast.image_hash}/images/not-found.png')
+        self.assertEqual(resp.status_code, 404)
+
+        analytics.flush()
+        self.assertEqual(EpisodeDownload.objects.get(episode=episode).count, 1)
+
+    @override_settings(PODCAST_MEDIA_ACCEL_REDIRECT='/protected-media/')
+    def test_versioned_media_accel_redirect(self) -> None:
+        episode, podcast = self.episodes[self.podcasts[0].id][0], self.podcasts[0]
+        files = ((episode.versioned_audio_url, episode.audio.name), (podcast.versioned_image_url, podcast.image.name))
+        for url, name in files:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.headers['X-Accel-Redirect'], f'/protected-media/{name}')
+            self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(resp.content, b'')
+
+    def test_command(self) -> None:
+        Episode.objects.update(audio_hash='', image_hash='')
+        Podcast.objects.update(image_hash='')
+        updated = Podcast.objects.get(pk=self.podcasts[0].pk).updated
+
+        out = io.StringIO()
+        call_command('hash_media', batch_size=7, workers=2, stdout=out)
+        # 2 podcasts images, 20 audio files and 10 episodes images
+        self.assertIn('hashed 32 files', out.getvalue())
+        self.assertFalse(Episode.objects.filter(audio_hash='').exists())
+        self.assertEqual(Episode.objects.filter(image_hash='').count(), 10)
+        self.assertGreater(Podcast.objects.get(pk=self.podcasts[0].pk).updated, updated)
+
+        out = io.StringIO()
+        call_command('hash_media', stdout=out)
+        self.assertIn('hashed 0 files', out.getvalue())
+
+
+S3_STORAGES = {
+    'default': {'BACKEND': 'podcast.storage.S3Storage', 'OPTIONS': {'bucket': 'daf', 'region': 'us-east-1'}},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+
+@skipUnless(storage.boto3 and mock_aws, 'boto3 and moto are not installed')
+class S3StorageTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.client_s3 = boto3.client('s3', region_name='us-east-1')
+        self.client_s3.create_bucket(Bucket='daf')
+        # files of the base test case are local
+        self.s3_settings = override_settings(STORAGES=S3_STORAGES)
+        self.s3_settings.enable()
+
+    def tearDown(self) -> None:
+        self.s3_settings.disable()
+        super().tearDown()
+
+    def _object(self, name: str) -> bytes:
+        return self.client_s3.get_object(Bucket='daf', Key=name)['Body'].read()
+
+    def test_upload(self) -> None:
+        podcast = self.podcasts[0]
+        data = {'title': 'S3 episode', 'audio': ContentFile(b's3 audio', name='s3.mp3')}
+        resp = self.client.post(f'/podcast/{podcast.slug}/upload', data=data)
+        self.assertEqual(resp.status_code, 200)
+
+        episode = podcast.episode_set.get(title='S3 episode')
+        self.assertEqual(self._object(episode.audio.name), b's3 audio')
+        self.assertEqual(episode.audio_size, 8)
+        self.assertEqual(episode.audio_hash, hashlib.sha256(b's3 audio').hexdigest()[:16])
+
+        # bytes are sent by the storage, the download is counted
+        resp = self.client.get(episode.versioned_audio_url, headers={'range': 'bytes=0-1'})
+        self.assertEqual(resp.status_code, 302)
+        self.assertIn(f'/{episode.audio.name}?', resp.headers['Location'])
+        self.assertNotIn('Cache-Control', resp.headers)
+        analytics.flush()
+        self.assertEqual(EpisodeDownload.objects.get(episode=episode).bytes, 2)
+
+        episode.clean_files()
+        self.assertFalse(episode.audio.storage.exists(episode.audio.name))
+
+    def test_multipart(self) -> None:
+        s3 = S3Storage(bucket='daf', region='us-east-1', chunk_size=5 * 1024 * 1024)
+        content = os.urandom(6 * 1024 * 1024)
+        name = s3.save('episodes/podcast0/large.mp3', ContentFile(content))
+        self.assertEqual(name, 'episodes/podcast0/large.mp3')
+        # the ETag of a multipart upload has the number of parts
+        self.assertTrue(self.client_s3.head_object(Bucket='daf', Key=name)['ETag'].endswith('-2"'))
+        self.assertEqual(s3.size(name), len(content))
+        with s3.open(name) as f:
+            self.assertEqual(f.read(), content)
+
+        s3.copy(name, 'episodes/podcast1/large.mp3')
+        self.assertEqual(self._object('episodes/podcast1/large.mp3'), content)
+        s3.delete(name)
+        self.assertFalse(s3.exists(name))
+        with self.assertRaises(FileNotFoundError):
+            s3.open(name)
+
+    def test_url_cache(self) -> None:
+        s3 = S3Storage(bucket='daf', region='us-east-1')
+        with mock.patch.object(s3.client, 'generate_presigned_url', wraps=s3.client.generate_presigned_url) as m:
+            url = s3.url('images/image.png')
+            self.assertEqual(s3.url('images/image.png'), url)
+            self.assertEqual(m.call_count, 1)
+            s3.delete('images/image.png')
+            s3.url('images/image.png')
+            self.assertEqual(m.call_count, 2)
+
+        s3 = S3Storage(bucket='daf', region='us-east-1', public_url='https://cdn.example.com/')
+        self.assertEqual(s3.url('images/a b.png'), 'https://cdn.example.com/images/a%20b.png')
+
+    def test_move_media(self) -> None:
+        out = io.StringIO()
+        call_command('move_media', workers=4, stdout=out)
+        # 2 podcasts images, 20 audio files and 10 episodes images
+        self.assertIn('copied 32 files', out.getvalue())
+        episode = self.episodes[self.podcasts[0].id][0]
+        self.assertEqual(self._object(episode.audio.name), b'audio')
+
+        out = io.StringIO()
+        call_command('move_media', workers=4, stdout=out)
+        self.assertIn('copied 0 files', out.getvalue())
+        self.assertIn('32 were copied before', out.getvalue())
+
+        resp = self.client.get(self.podcasts[0].versioned_image_url)
+        self.assertEqual(resp.status_code, 302)
+        with self.assertRaises(CommandError):
+            call_command('shard_media', stdout=io.StringIO())
+
+
+class ArtworkHandler(http.server.BaseHTTPRequestHandler):
+    """Origin of public images, it supports conditional requests by ETag."""
+
+    def do_GET(self) -> None:
+        self.server.requests.append((self.path, self.headers.get('If-None-Match', '')))
+        content = self.server.images.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _image(size: tuple[int, int], image_format: str, color: str = 'red') -> bytes:
+    out = io.BytesIO()
+    Image.new('RGB', size, color).save(out, image_format)
+    return out.getvalue()
+
+
+@override_settings(PODCAST_ARTWORK_CACHE=True, PODCAST_ARTWORK_MAX_DIMENSION=16)
+class ArtworkTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.origin = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ArtworkHandler)
+        self.origin.images = {'/podcast.png': _image((64, 32), 'PNG'), '/episode.gif': _image((8, 8), 'GIF')}
+        self.origin.requests = []
+        threading.Thread(target=self.origin.serve_forever, daemon=True).start()
+        self.addCleanup(self.origin.server_close)
+        self.addCleanup(self.origin.shutdown)
+        self.addCleanup(self._remove_copies)
+
+        # the uploaded image has priority, files are removed by tearDown
+        Podcast.objects.filter(pk=self.podcasts[0].pk).update(image='', public_image=self._url('/podcast.png'))
+        Podcast.objects.filter(pk=self.podcasts[1].pk).update(image='', public_image=self._url('/missing.png'))
+        Episode.objects.exclude(public_image='').update(public_image=self._url('/episode.gif'))
+
+    def _url(self, path: str) -> str:
+        return f'http://127.0.0.1:{self.origin.server_address[1]}{path}'
+
+    @staticmethod
+    def _remove_copies() -> None:
+        for name in RemoteImage.objects.exclude(image='').values_list('image', flat=True):
+            default_storage.delete(name)
+
+    def _cache(self, **options: Any) -> str:
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('cache_artwork', workers=2, stdout=out, stderr=io.StringIO(), **options)
+        for thread in threading.enumerate():
+            if thread.name == 'daf-remove-files':
+                thread.join()
+        return out.getvalue()
+
+    def test_repeated(self) -> None:
+        aggregate_feed = AggregateFeed.objects.create(title='Network', slug='network')
+        self._cache()
+        updated = dict(Podcast.objects.values_list('pk', 'updated'))
+        aggregate_updated = AggregateFeed.objects.get(pk=aggregate_feed.pk).updated
+
+        # linked rows and rows without public images are not touched again
+        self.assertIn('fetched 0 images, 0 changed', self._cache())
+        self.assertEqual(dict(Podcast.objects.values_list('pk', 'updated')), updated)
+        self.assertEqual(AggregateFeed.objects.get(pk=aggregate_feed.pk).updated, aggregate_updated)
+
+    def test_optimize(self) -> None:
+        content, extension = artwork.optimize(_image((64, 32), 'PNG'), 16)
+        self.assertEqual(extension, 'png')
+        with Image.open(io.BytesIO(content)) as image:
+            self.assertEqual(image.size, (16, 8))
+
+        original = _image((8, 8), 'JPEG')
+        self.assertEqual(artwork.optimize(original, 16)[1], 'jpg')
+        self.assertEqual(artwork.optimize(_image((8, 8), 'GIF'), 16)[1], 'jpg')
+        with self.assertRaises(artwork.ArtworkError):
+            artwork.optimize(b'not an image', 16)
+
+    def test_feed(self) -> None:
+        self.assertIn('fetched 2 images, 2 changed, 1 failed', self._cache())
+        podcast_copy = RemoteImage.objects.get(url=self._url('/podcast.png'))
+        self.assertTrue(podcast_copy.image.name.endswith('.png'))
+        self.assertEqual(podcast_copy.image.read(), artwork.optimize(self.origin.images['/podcast.png'], 16)[0])
+        failed = RemoteImage.objects.get(url=self._url('/missing.png'))
+        self.assertEqual((failed.failures, failed.error), (1, 'HTTP status 404'))
+        self.assertGreater(failed.expires, timezone.now())
+
+        resp = self.client.get('/podcast/podcast0/rss')
+        root = ElementTree.fromstring(resp.content)
+        channel_image = root.find('channel/image/url').text
+        self.assertEqual(channel_image, f'http://testserver{podcast_copy.versioned_image_url}')
+        episode_copy = RemoteImage.objects.get(url=self._url('/episode.gif'))
+        self.assertIn(f'http://testserver{episode_copy.versioned_image_url}', resp.content.decode())
+        # the failed image is not changed
+        resp = self.client.get('/podcast/podcast1/rss')
+        self.assertIn(self._url('/missing.png'), resp.content.decode())
+
+        resp = self.client.get(podcast_copy.versioned_image_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        cache.clear()
+        with override_settings(PODCAST_ARTWORK_CACHE=False):
+            resp = self.client.get('/podcast/podcast0/rss')
+            self.assertIn(self._url('/podcast.png'), resp.content.decode())
+
+    def test_refresh(self) -> None:
+        self._cache()
+        self.assertIn('fetched 0 images', self._cache())
+
+        # the origin is not changed
+        self.origin.requests.clear()
+        self.assertIn('fetched 2 images, 0 changed, 1 failed', self._cache(all=True))
+        self.assertTrue(all(etag for path, etag in self.origin.requests if path != '/missing.png'))
+
+        copy = RemoteImage.objects.get(url=self._url('/podcast.png'))
+        self.origin.images['/podcast.png'] = _image((16, 16), 'PNG', 'blue')
+        updated = Podcast.objects.get(pk=self.podcasts[0].pk).updated
+        self.assertIn('1 changed', self._cache(all=True))
+        new_copy = RemoteImage.objects.get(pk=copy.pk)
+        self.assertNotEqual(new_copy.image_hash, copy.image_hash)
+        self.assertFalse(default_storage.exists(copy.image.name))
+        self.assertGreater(Podcast.objects.get(pk=self.podcasts[0].pk).updated, updated)
+
+        # a changed public image is not replaced by the old copy
+        podcast = Podcast.objects.get(pk=self.podcasts[0].pk)
+        podcast.public_image = self._url('/new.png')
+        podcast.save()
+        self.assertIsNone(podcast.artwork)
+        self.assertEqual(podcast.artwork_url, '')
+        self._cache()
+        self.assertFalse(RemoteImage.objects.filter(url=self._url('/podcast.png')).exists())
+
+    @override_settings(PODCAST_ARTWORK_MAX_SIZE=64)
+    def test_size_limit(self) -> None:
+        self._cache()
+        image = RemoteImage.objects.get(url=self._url('/podcast.png'))
+        self.assertEqual(image.error, 'image is larger than 64 bytes')
+        self.assertFalse(image.image)
+
+    def test_disabled(self) -> None:
+        with override_settings(PODCAST_ARTWORK_CACHE=False), self.assertRaises(CommandError):
+            call_command('cache_artwork')
+
+
+class WaveformTestCase(PodcastBaseTestCase):
+
+    def test_preview(self) -> None:
+        episode = self.episodes[self.podcasts[0].id][1]
+        self.assertNotIn('<svg', episode.play())
+
+        Episode.objects.filter(pk=episode.pk).update(waveform=bytes([0x80 + 1, 127, 0xff, 1]))
+        episode.refresh_from_db()
+        preview = episode.play()
+        self.assertIn('viewBox="0 0 2 256"', preview)
+        self.assertIn('d="M0 0V255M1 126V129"', preview)
+
+        # a new audio file is decoded again
+        os.remove(episode.audio.path)
+        episode.audio = ContentFile(b'new audio', name='new.mp3')
+        episode.save()
+        self.assertIsNone(episode.waveform)
+        self.episodes[self.podcasts[0].id].append(episode)
+
+    def test_decode_errors(self) -> None:
+        with self.assertRaises(waveform.WaveformError):
+            list(waveform.decode('audio.mp3', ffmpeg='/nonexistent/ffmpeg'))
+        with self.assertRaises(waveform.WaveformError):
+            list(waveform.decode('audio.mp3', ffmpeg='false'))
+
+    @skipUnless(waveform.np, 'numpy is not installed')
+    def test_peaks(self) -> None:
+        samples = waveform.np.concatenate([
+            waveform.np.full(waveform.BLOCK_SIZE * 3, 1000, dtype='<i2'),
+            waveform.np.array([-32767, 32767] * waveform.BLOCK_SIZE, dtype='<i2'),
+        ]).tobytes()
+        # odd chunk sizes split samples and blocks
+        chunks = [samples[i:i + 999] for i in range(0, len(samples), 999)]
+        self.assertEqual(waveform.peaks(chunks, 100), bytes([3, 3] * 3 + [0x81, 127] * 2))
+        self.assertEqual(waveform.peaks(chunks, 2), bytes([3, 3, 0x81, 127]))
+        self.assertEqual(waveform.peaks([], 2), b'')
+
+    @skipUnless(waveform.np, 'numpy is not installed')
+    def test_command(self) -> None:
+        # raw files are sent as decoded samples
+        tmp_dir = tempfile.TemporaryDirectory(prefix='daf-')
+        self.addCleanup(tmp_dir.cleanup)
+        ffmpeg = os.path.join(tmp_dir.name, 'ffmpeg')
+        with open(ffmpeg, 'w') as f:
+            f.write('#!/bin/sh\ncat "$5"\n')
+        os.chmod(ffmpeg, 0o755)
+
+        episodes = self.episodes[self.podcasts[0].id]
+        os.remove(episodes[1].audio.path)
+        with override_settings(PODCAST_FFMPEG=ffmpeg):
+            call_command(
+                'compute_waveforms', podcast='podcast0', workers=2, batch_size=3,
+                stdout=io.StringIO(), stderr=io.StringIO(),
+            )
+
+        result = dict(Episode.objects.filter(podcast=self.podcasts[0]).values_list('pk', 'waveform'))
+        # "audio" bytes are 2 samples: 0x7561 and 0x6964, min and max of one block
+        self.assertEqual(bytes(result[episodes[0].pk]), bytes([0x6964 * 127 // 32767, 0x7561 * 127 // 32767]))
+        self.assertEqual(bytes(result[episodes[1].pk]), b'')
+        self.assertFalse(Episode.objects.filter(podcast=self.podcasts[1], waveform__isnull=False).exists())
+
+    @skipIf(waveform.np, 'numpy is installed')
+    def test_command_without_numpy(self) -> None:
+        with self.assertRaisesMessage(CommandError, 'numpy is not installed'):
+            call_command('compute_waveforms')
+
+
+class AsyncViewsTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+
+    async def test_feed(self) -> None:
+        podcast = self.podcasts[0]
+        url = f'/podcast/{podcast.slug}/rss'
+        expected = await self.async_client.get(url)
+
+        # sync and async views render the same feed, cache is not used
+        await cache.aclear()
+        resp = await EpisodesFeed().acall(self.factory.get(url), podcast=podcast.slug)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, expected.content)
+
+        # cached
+        resp = await EpisodesFeed().acall(self.factory.get(url), podcast=podcast.slug)
+        self.assertEqual(resp.content, expected.content)
+
+        with self.assertRaises(Http404):
+            await EpisodesFeed().acall(self.factory.get(url), podcast='not-found')
+
+    async def test_custom_feed(self) -> None:
+        custom_feed = await CustomFeed.objects.acreate(podcast=self.podcasts[1], title='Custom Feed')
+        url = f'/podcast/custom/{custom_feed.ref}'
+        expected = await self.async_client.get(url)
+
+        await cache.aclear()
+        resp = await CustomEpisodesFeed().acall(self.factory.get(url), ref=custom_feed.ref)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, expected.content)
+
+    async def test_upload(self) -> None:
+        podcast = self.podcasts[0]
+        url = f'/podcast/{podcast.slug}/upload'
+        data = {
+            'title': 'Async Episode',
+            'author': 'Episode Author',
+            'description': 'Episode Description',
+            'audio': ContentFile(b'audio', name='async_audio.mp3'),
+            'publish': True,
+        }
+        resp = await aupload(self.factory.post(url, data=data), podcast=podcast.slug)
+        self.assertEqual(resp.status_code, 200)
+
+        episode = await podcast.episode_set.aget(title='Async Episode')
+        self.assertIsNotNone(episode.published)
+        episode.clean_files()
+
+        resp = await aupload(self.factory.post(url, data={'title': 'Async Episode'}), podcast=podcast.slug)
+        self.assertEqual(resp.status_code, 400)
+
+        resp = await aupload(self.factory.post(url, data=data), podcast='not-found')
+        self.assertEqual(resp.status_code, 404)
+
+
+@override_settings(PODCAST_FLUSH_INTERVAL=0)
+class MetricsTestCase(PodcastBaseTestCase):
+    URL = '/metrics'
+
+    def setUp(self) -> None:
+        super().setUp()
+        metrics.flush()
+        Metric.objects.all().delete()
+        self.user = User.objects.create_user('admin', password='password', is_staff=True)
+
+    def test_access(self) -> None:
+        resp = self.client.get(self.URL)
+        self.assertEqual(resp.status_code, 302)
+
+        self.client.force_login(User.objects.create_user('user', password='password'))
+        resp = self.client.get(self.URL)
+        self.assertEqual(resp.status_code, 302)
+
+    def test_export(self) -> None:
+        # only files of episodes without saved sizes are checked
+        Episode.objects.filter(pk=self.episodes[self.podcasts[0].id][1].pk).update(audio_size=0)
+        url = f'/podcast/{self.podcasts[0].slug}/rss'
+        sizes = [len(self.client.get(url).content) for _ in range(2)]
+        self.client.get('/podcast/not-found/rss')
+
+        self.client.force_login(self.user)
+        resp = self.client.get(self.URL)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers['Content-Type'].startswith('text/plain'))
+
+        lines = resp.content.decode().splitlines()
+        labels = 'endpoint="feed",podcast="podcast0"'
+        expected = [
+            '# TYPE daf_request_duration_seconds histogram',
+            f'daf_requests_total{{{labels},status="200"}} 2',
+            'daf_requests_total{endpoint="feed",podcast="",status="404"} 1',
+            f'daf_request_duration_seconds_count{{{labels}}} 2',
+            f'daf_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2',
+            f'daf_db_queries_bucket{{{labels},le="1"}} 1',  # cached feed
+            f'daf_db_queries_count{{{labels}}} 2',
+            f'daf_response_bytes_total{{{labels}}} {sum(sizes)}',
+            f'daf_feed_cache_total{{{labels},result="hit"}} 1',
+            f'daf_feed_cache_total{{{labels},result="miss"}} 1',
+            'daf_file_stat_seconds_count 1',
+        ]
+        for line in expected:
+            self.assertIn(line, lines)
+
+        prefix = f'daf_request_duration_seconds_bucket{{{labels},'
+        buckets = [line for line in lines if line.startswith(prefix)]
+        self.assertEqual(len(buckets), len(metrics.DURATION_BUCKETS) + 1)
+        self.assertTrue(buckets[-1].startswith(f'daf_request_duration_seconds_bucket{{{labels},le="+Inf"}}'))
+
+    async def test_async_view(self) -> None:
+        slug = self.podcasts[0].slug
+        view = metrics.instrument('feed')(EpisodesFeed().acall)
+        resp = await view(AsyncRequestFactory().get(f'/podcast/{slug}/rss'), podcast=slug)
+        self.assertEqual(resp.status_code, 200)
+
+        labels = f'endpoint="feed",podcast="{slug}"'
+        queries = await Metric.objects.aget(name='daf_db_queries_sum', labels=labels)
+        self.assertEqual(queries.value, 2)  # podcast and its episodes
+
+    def test_upload(self) -> None:
+        data = {
+            'title': 'Episode Title',
+            'author': 'Episode Author',
+            'description': 'Episode Description',
+            'audio': ContentFile(b'audio', name='metrics_audio.mp3'),
+        }
+        resp = self.client.post(f'/podcast/{self.podcasts[1].slug}/upload', data=data)
+        self.assertEqual(resp.status_code, 200)
+        self.podcasts[1].episode_set.get(title='Episode Title').clean_files()
+
+        value = Metric.objects.get(
+            name='daf_upload_bytes_total',
+            labels='endpoint="upload",podcast="podcast1"',
+        ).value
+        self.assertGreater(value, len(b'audio'))
+        self.assertTrue(Metric.objects.filter(name='daf_upload_throughput_bytes_per_second_count').exists())
+
+
+class ProfilingTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.feed_url = f'/podcast/{self.podcasts[0].slug}/rss'
+        self.user = User.objects.create_user('admin', password='password', is_staff=True, is_superuser=True)
+
+    def test_not_profiled(self) -> None:
+        self.client.get(self.feed_url)
+        self.client.get(self.feed_url, headers={PROFILE_HEADER: 'bad-token'})
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_header(self) -> None:
+        resp = self.client.get(self.feed_url, headers={PROFILE_HEADER: profile_token()})
+        self.assertEqual(resp.status_code, 200)
+
+        report = ProfileReport.objects.get()
+        self.assertEqual(report.reason, 'header')
+        self.assertEqual(report.path, self.feed_url)
+        self.assertEqual(report.status, 200)
+        self.assertEqual(report.queries, 2)
+        self.assertIn('podcast_episode', report.sql)
+        self.assertIn('cumulative', report.stats)
+
+        self.client.force_login(self.user)
+        resp = self.client.get(f'/admin/podcast/profilereport/{report.pk}/download/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, bytes(report.profile))
+
+    def test_session(self) -> None:
+        self.client.force_login(self.user)
+        # session state is not changed by GET requests
+        self.assertEqual(self.client.get('/admin/podcast/profilereport/toggle/').status_code, 405)
+        resp = self.client.post('/admin/podcast/profilereport/toggle/')
+        self.assertEqual(resp.status_code, 302)
+
+        self.client.get(self.feed_url)
+        self.assertEqual(ProfileReport.objects.filter(reason='session', path=self.feed_url).count(), 1)
+        self.assertContains(self.client.get('/admin/podcast/profilereport/'), 'Disable session profiling')
+
+        self.client.post('/admin/podcast/profilereport/toggle/')
+        n = ProfileReport.objects.count()
+        self.client.get(self.feed_url)
+        self.assertEqual(ProfileReport.objects.count(), n)
+
+    @override_settings(PODCAST_PROFILE_SAMPLE_RATE=1.0)
+    def test_sample(self) -> None:
+        self.client.get(self.feed_url)
+        self.assertEqual(ProfileReport.objects.get().reason, 'sample')
+
+    def test_async(self) -> None:
+        async def view(request) -> HttpResponse:
+            # queries of worker threads are captured
+            await sync_to_async(Podcast.objects.count)()
+            return HttpResponse(b'ok')
+
+        # an async chain is not adapted to a thread
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        factory = AsyncRequestFactory()
+        resp = async_to_sync(middleware)(factory.get(self.feed_url))
+        self.assertEqual(resp.content, b'ok')
+        self.assertFalse(ProfileReport.objects.exists())
+
+        async_to_sync(middleware)(factory.get(self.feed_url, headers={PROFILE_HEADER: profile_token()}))
+        report = ProfileReport.objects.get()
+        self.assertEqual((report.reason, report.path, report.status), ('header', self.feed_url, 200))
+        self.assertEqual(report.queries, 1)
+        self.assertIn('podcast_podcast', report.sql)
+        self.assertTrue(report.stats.startswith('async request, the profile includes tasks of 0 concurrent requests'))
+
+
+class AnalyticsTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        analytics.flush()
+        self.podcast = self.podcasts[0]
+        self.episode = self.episodes[self.podcast.id][1]
+        self.audio_url = self.episode.audio.url
+
+    @override_settings(PODCAST_FLUSH_INTERVAL=3600)
+    def test_feed_polls(self) -> None:
+        custom_feed = CustomFeed.objects.create(podcast=self.podcast, title='Custom Feed')
+        url = f'/podcast/{self.podcast.slug}/rss'
+
+        for _ in range(3):
+            self.client.get(url, headers={'user-agent': 'Client/1.0'})
+        self.client.get(url, headers={'user-agent': 'Client/2.0'})
+        self.client.get(f'/podcast/custom/{custom_feed.ref}', headers={'user-agent': 'Client/1.0'})
+        self.assertFalse(FeedPoll.objects.exists())  # buffered
+
+        analytics.flush()
+        self.client.get(url, headers={'user-agent': 'Client/1.0'})
+        analytics.flush()
+
+        polls = FeedPoll.objects.filter(podcast=self.podcast).values_list('custom_feed', 'user_agent', 'count')
+        expected = [(None, 'Client/1.0', 4), (None, 'Client/2.0', 1), (custom_feed.id, 'Client/1.0', 1)]
+        self.assertCountEqual(polls, expected)
+
+    def test_audio(self) -> None:
+        resp = self.client.get(self.audio_url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'audio')
+        self.assertEqual(resp.headers['Accept-Ranges'], 'bytes')
+        self.assertEqual(resp.headers['Content-Type'], 'audio/mpeg')
+
+        resp = self.client.get(self.audio_url, headers={'range': 'bytes=1-2'})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b''.join(resp.streaming_content), b'ud')
+        self.assertEqual(resp.headers['Content-Range'], 'bytes 1-2/5')
+
+        resp = self.client.get(self.audio_url, headers={'range': 'bytes=-2'})
+        self.assertEqual(b''.join(resp.streaming_content), b'io')
+
+        resp = self.client.get(self.audio_url, headers={'range': 'bytes=10-'})
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(resp.headers['Content-Range'], 'bytes */5')
+
+        resp = self.client.get('/media/episodes/podcast0/not-found.mp3')
+        self.assertEqual(resp.status_code, 404)
+
+        analytics.flush()
+        download = EpisodeDownload.objects.get(episode=self.episode)
+        self.assertEqual((download.count, download.bytes), (3, 5 + 2 + 2))
+
+    @override_settings(PODCAST_MEDIA_ACCEL_REDIRECT='/protected/')
+    def test_audio_accel_redirect(self) -> None:
+        resp = self.client.get(self.audio_url, headers={'range': 'bytes=0-3'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['X-Accel-Redirect'], f'/protected/{self.episode.audio.name}')
+        self.assertEqual(resp.content, b'')
+
+        analytics.flush()
+        self.assertEqual(EpisodeDownload.objects.get(episode=self.episode).bytes, 4)
+
+    def test_audio_accel_redirect_default(self) -> None:
+        default = override_settings(PODCAST_MEDIA_ACCEL_REDIRECT='/protected-media/')
+        with default:
+            resp = self.client.get(self.audio_url)
+            self.assertEqual(resp.headers['X-Accel-Redirect'], f'/protected-media/{self.episode.audio.name}')
+        # development server without nginx
+        with default, override_settings(DEBUG=True):
+            resp = self.client.get(self.audio_url)
+            self.assertNotIn('X-Accel-Redirect', resp.headers)
+            self.assertEqual(b''.join(resp.streaming_content), b'audio')
+
+    def test_admin(self) -> None:
+        self.client.get(self.audio_url)
+        self.client.get(f'/podcast/{self.podcast.slug}/rss', headers={'user-agent': 'Client/1.0'})
+        analytics.flush()
+
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        resp = self.client.get('/admin/podcast/feedpoll/')
+        self.assertContains(resp, 'Totals')
+        self.assertContains(resp, self.podcast.title)
+
+        resp = self.client.get('/admin/podcast/episodedownload/')
+        self.assertContains(resp, self.episode.title)
+
+
+class PollingHintsTestCase(TestCase):
+
+    def test_polling_hints(self) -> None:
+        now = timezone.now()
+        cases = [
+            ([], PollingHints(60, 'hourly', 1)),
+            ([now], PollingHints(60, 'hourly', 1)),
+            ([now - timedelta(hours=i) for i in range(10)], PollingHints(60, 'hourly', 1)),
+            ([now - timedelta(days=i) for i in range(10)], PollingHints(360, 'daily', 4)),
+            ([now - timedelta(days=30 * i) for i in range(10)], PollingHints(1440, 'daily', 1)),
+        ]
+        for published, expected in cases:
+            self.assertEqual(polling_hints(published), expected)
+
+        with self.settings(PODCAST_TTL_MAX=30 * 24 * 60):
+            hints = polling_hints([now - timedelta(days=30 * i) for i in range(10)])
+            self.assertEqual(hints, PollingHints(7 * 24 * 60 + 12 * 60, 'monthly', 4))
+            self.assertEqual(hints.max_age, hints.ttl * 60)
+
+
+@override_settings(PODCAST_THROTTLE_RATES={'feed': (2, 3600), 'audio': (1, 60)})
+class ThrottlingTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        throttling._throttled.flush()
+        self.feed_url = f'/podcast/{self.podcasts[0].slug}/rss'
+
+    def test_feed(self) -> None:
+        headers = {'user-agent': 'Aggregator/1.0'}
+        for _ in range(2):
+            self.assertEqual(self.client.get(self.feed_url, headers=headers).status_code, 200)
+
+        resp = self.client.get(self.feed_url, headers=headers)
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], '1800')
+
+        # every feed has its own budget
+        custom_feed = CustomFeed.objects.create(podcast=self.podcasts[0], title='Custom Feed')
+        self.assertEqual(self.client.get(f'/podcast/custom/{custom_feed.ref}', headers=headers).status_code, 200)
+
+        # other clients are not limited
+        self.assertEqual(self.client.get(self.feed_url, headers={'user-agent': 'Client/1.0'}).status_code, 200)
+        self.assertEqual(self.client.get(self.feed_url, REMOTE_ADDR='10.0.0.1', headers=headers).status_code, 200)
+
+        throttling._throttled.flush()
+        rejected = ThrottledClient.objects.get(scope='feed', client='127.0.0.1', user_agent='Aggregator/1.0')
+        self.assertEqual(rejected.count, 1)
+
+    def test_not_modified(self) -> None:
+        resp = self.client.get(self.feed_url)
+        headers = {'if-none-match': resp.headers['ETag']}
+
+        # tokens of not modified responses are refunded
+        for _ in range(5):
+            self.assertEqual(self.client.get(self.feed_url, headers=headers).status_code, 304)
+
+        self.assertEqual(self.client.get(self.feed_url).status_code, 200)
+        self.assertEqual(self.client.get(self.feed_url).status_code, 429)
+        # conditional requests are charged before the view too
+        self.assertEqual(self.client.get(self.feed_url, headers={'if-none-match': '"old"'}).status_code, 429)
+        self.assertEqual(self.client.get(self.feed_url, headers=headers).status_code, 429)
+
+    def test_audio(self) -> None:
+        url = self.episodes[self.podcasts[0].id][0].audio.url
+        self.assertEqual(self.client.get(url).status_code, 200)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], '60')
+
+    def test_collisions(self) -> None:
+        table = throttling.table()
+        # all keys are in the same probe sequence, the least recently updated buckets are replaced
+        keys = [table.slots * i + 1 for i in range(1, throttling.PROBES + 2)]
+        for key in keys:
+            self.assertEqual(table.take(key, 1, 0.001), (True, 0.0))
+        self.assertEqual(table.take(keys[-1], 1, 0.001)[0], False)
+        self.assertEqual(table.take(keys[0], 1, 0.001), (True, 0.0))
+
+    def test_refund(self) -> None:
+        table = throttling.table()
+        self.assertEqual(table.take(7, 2, 0.001)[0], True)
+        table.refund(7, 2)
+        table.refund(7, 2)  # tokens are not over the capacity
+        self.assertEqual(table.take(7, 2, 0.001)[0], True)
+        self.assertEqual(table.take(7, 2, 0.001)[0], True)
+        self.assertEqual(table.take(7, 2, 0.001)[0], False)
+
+
+class SlowStream:
+    """WSGI input of a slow client, the body is sent by small chunks and its end waits for the finish event."""
+    CHUNK = 1024
+
+    def __init__(self) -> None:
+        self.body = b''
+        self.sent = 0
+        self.started = threading.Event()
+        self.finish = threading.Event()
+
+    def read(self, size: int = -1) -> bytes:
+        self.started.set()
+        if self.sent + self.CHUNK >= len(self.body):
+            self.finish.wait(10)
+        else:
+            time.sleep(0.005)
+        size = self.CHUNK if size is None or size < 0 else min(size, self.CHUNK)
+        chunk = self.body[self.sent:self.sent + size]
+        self.sent += len(chunk)
+        return chunk
+
+    def readline(self, size: int = -1) -> bytes:
+        return self.read(size)
+
+
+@override_settings(PODCAST_UPLOAD_CONCURRENCY=2, PODCAST_UPLOAD_QUEUE_TIMEOUT=0.2, PODCAST_UPLOAD_RETRY_AFTER=15)
+class UploadAdmissionTestCase(PodcastBaseTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.upload_url = f'/podcast/{self.podcasts[0].slug}/upload'
+        self.feed_url = f'/podcast/{self.podcasts[0].slug}/rss'
+
+    def _upload(self, title: str):
+        data = {
+            'title': title,
+            'author': 'Episode Author',
+            'audio': ContentFile(b'audio', name='admission_audio.mp3'),
+        }
+        return self.client.post(self.upload_url, data=data)
+
+    def _feed_latency(self, n: int = 5) -> float:
+        start = time.perf_counter()
+        for _ in range(n):
+            cache.clear()
+            self.assertEqual(self.client.get(self.feed_url).status_code, 200)
+        return (time.perf_counter() - start) / n
+
+    def test_slots(self) -> None:
+        fds = [admission.try_acquire() for _ in range(2)]
+        self.assertNotIn(None, fds)
+        self.assertIsNone(admission.try_acquire())
+
+        admission.release(fds.pop())
+        fds.append(admission.try_acquire())
+        self.assertIsNotNone(fds[-1])
+
+        for fd in fds:
+            admission.release(fd)
+
+    def _slow_upload(self, db: Any, title: str, stream: 'SlowStream', results: Dict[str, Any]) -> None:
+        """Sends the upload request with a slow body in a thread which shares the test database connection."""
+        connections['default'] = db
+        body = encode_multipart(BOUNDARY, {
+            'title': title,
+            'author': 'Episode Author',
+            'audio': ContentFile(b'a' * 64 * 1024, name='admission_audio.mp3'),
+        })
+        stream.body = body
+        request = WSGIRequest(RequestFactory()._base_environ(**{
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': self.upload_url,
+            'CONTENT_TYPE': MULTIPART_CONTENT,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': stream,
+        }))
+        match = resolve(self.upload_url)
+        results[title] = match.func(request, *match.args, **match.kwargs)
+
+    def test_saturated(self) -> None:
+        baseline = self._feed_latency()
+
+        # all slots are taken by slow uploads in flight
+        db, streams, results = connections['default'], [SlowStream() for _ in range(2)], {}
+        uploads = [
+            threading.Thread(target=self._slow_upload, args=(db, f'Slow Episode {i}', stream, results))
+            for i, stream in enumerate(streams)
+        ]
+        db.inc_thread_sharing()
+        try:
+            for upload in uploads:
+                upload.start()
+            for stream in streams:
+                self.assertTrue(stream.started.wait(5))
+
+            # feed requests are not queued behind uploads
+            self.assertLess(self._feed_latency(), baseline + 0.1)
+
+            start = time.perf_counter()
+            resp = self._upload('Rejected Episode')
+            waited = time.perf_counter() - start
+
+            self.assertEqual(resp.status_code, 503)
+            self.assertEqual(resp.headers['Retry-After'], '15')
+            self.assertEqual(resp.json()['code'], 'unavailable')
+            self.assertGreaterEqual(waited, 0.2)
+            self.assertFalse(Episode.objects.filter(title='Rejected Episode').exists())
+            self.assertTrue(all(stream.sent < len(stream.body) for stream in streams))
+        finally:
+            for stream in streams:
+                stream.finish.set()
+            for upload in uploads:
+                upload.join()
+            db.dec_thread_sharing()
+
+        for i in range(2):
+            self.assertEqual(results[f'Slow Episode {i}'].status_code, 200)
+            Episode.objects.get(title=f'Slow Episode {i}').clean_files()
+
+        resp = self._upload('Accepted Episode')
+        self.assertEqual(resp.status_code, 200)
+        Episode.objects.get(title='Accepted Episode').clean_files()
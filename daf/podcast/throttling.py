@@ -0,0 +1,193 @@
+"""
+Feed and audio requests throttling.
+
+Token buckets of all clients are kept in a fixed-size hash table
+in a memory mapped file, so the limits are shared by all processes.
+The file is expected to be in tmpfs (/dev/shm), it is locked for every access.
+"""
+import fcntl
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .buffers import CounterBuffer
+from .models import ThrottledClient
+
+SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update timestamp
+PROBES = 8
+
+USER_AGENT_MAX_LENGTH = ThrottledClient._meta.get_field('user_agent').max_length
+_throttled = CounterBuffer(ThrottledClient, ('day', 'scope', 'client', 'user_agent'), ('count',))
+
+
+class BucketTable:
+    """Token buckets hash table, the least recently updated bucket is replaced on collisions."""
+
+    def __init__(self, path: str, slots: int) -> None:
+        self.path = path
+        self.slots = slots
+        self.pid = os.getpid()
+        self._lock = threading.Lock()  # flock does not lock threads of the same process
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * SLOT.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+
+    def close(self) -> None:
+        self._mm.close()
+        os.close(self._fd)
+
+    def _find(self, key: int) -> Tuple[int, float, float]:
+        """Returns a slot offset and the bucket state, tokens are negative for a new bucket."""
+        start = key % self.slots
+        oldest, oldest_last = 0, math.inf
+        for i in range(PROBES):
+            offset = ((start + i) % self.slots) * SLOT.size
+            slot_key, tokens, last = SLOT.unpack_from(self._mm, offset)
+            if slot_key == key:
+                return offset, tokens, last
+            if last < oldest_last:
+                oldest, oldest_last = offset, last
+        return oldest, -1.0, 0.0
+
+    def take(self, key: int, capacity: float, rate: float) -> Tuple[bool, float]:
+        """Refills the bucket and takes a token from it, returns success flag and the remaining tokens."""
+        now = time.time()
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, tokens, last = self._find(key)
+                if tokens < 0:
+                    tokens = capacity
+                else:
+                    tokens = min(capacity, tokens + (now - last) * rate)
+                if allowed := tokens >= 1:
+                    tokens -= 1
+                SLOT.pack_into(self._mm, offset, key, tokens, now)
+                return allowed, tokens
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def refund(self, key: int, capacity: float) -> None:
+        """Returns a taken token to the bucket, it is lost if the bucket was replaced meanwhile."""
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset, tokens, last = self._find(key)
+                if tokens >= 0:
+                    SLOT.pack_into(self._mm, offset, key, min(capacity, tokens + 1), last)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_table: Optional[BucketTable] = None
+_table_lock = threading.Lock()
+
+
+def table() -> BucketTable:
+    """Returns the buckets table of the current process, it is opened again after fork."""
+    global _table
+
+    path, slots = settings.PODCAST_THROTTLE_FILE, settings.PODCAST_THROTTLE_SLOTS
+    with _table_lock:
+        if _table is None or (_table.pid, _table.path, _table.slots) != (os.getpid(), path, slots):
+            if _table is not None and _table.pid == os.getpid():
+                _table.close()
+            _table = BucketTable(path, slots)
+        return _table
+
+
+def client_ip(request) -> str:
+    if header := settings.PODCAST_THROTTLE_IP_HEADER:
+        if value := request.headers.get(header):
+            return value.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+# scopes which are limited per request path, so a client polls many feeds
+PATH_SCOPES = {'feed'}
+
+
+def _key(scope: str, ip: str, user_agent: str, path: str = '') -> int:
+    digest = hashlib.blake2b(f'{scope}\0{ip}\0{user_agent}\0{path}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class Check:
+    """
+    Throttling of one request. All requests are charged before the view,
+    the token of a conditional request is refunded if its response is 304.
+    """
+
+    def __init__(self, scope: str, request) -> None:
+        self.scope = scope
+        self.ip = client_ip(request)
+        self.user_agent = request.headers.get('User-Agent', '')[:USER_AGENT_MAX_LENGTH]
+        self.key = _key(scope, self.ip, self.user_agent, request.path if scope in PATH_SCOPES else '')
+
+        requests, seconds = settings.PODCAST_THROTTLE_RATES[scope]
+        self.capacity, self.rate = float(requests), requests / seconds
+
+    def _take(self) -> Optional[HttpResponse]:
+        allowed, tokens = table().take(self.key, self.capacity, self.rate)
+        if allowed:
+            return None
+
+        _throttled.add((timezone.localdate(), self.scope, self.ip, self.user_agent), 1)
+        response = HttpResponse('too many requests', status=429, content_type='text/plain')
+        response.headers['Retry-After'] = str(max(math.ceil((1 - tokens) / self.rate), 1))
+        return response
+
+    def before(self) -> Optional[HttpResponse]:
+        """Returns 429 response if the request is over the budget."""
+        return self._take()
+
+    def after(self, response: HttpResponse) -> HttpResponse:
+        if response.status_code == 304:
+            table().refund(self.key, self.capacity)
+        return response
+
+
+def throttle(scope: str) -> Callable:
+    """Decorator for sync and async views which limits requests rate of every client."""
+
+    def decorator(view: Callable) -> Callable:
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if scope not in settings.PODCAST_THROTTLE_RATES:
+                    return await view(request, *args, **kwargs)
+
+                check = Check(scope, request)
+                if rejected := check.before():
+                    return rejected
+                return check.after(await view(request, *args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if scope not in settings.PODCAST_THROTTLE_RATES:
+                return view(request, *args, **kwargs)
+
+            check = Check(scope, request)
+            if rejected := check.before():
+                return rejected
+            return check.after(view(request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
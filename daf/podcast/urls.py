@@ -1,9 +1,36 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import CustomEpisodesFeed, EpisodesFeed, upload
+from . import api
+from .admission import admit
+from .metrics import instrument
+from .throttling import throttle
+from .views import (
+    AggregateEpisodesFeed, ArchiveEpisodesFeed, CustomEpisodesFeed, EpisodesFeed, abatch_upload, aupload,
+    batch_upload, upload,
+)
+
+if settings.PODCAST_ASYNC_VIEWS:
+    feed, custom_feed, aggregate_feed = EpisodesFeed().acall, CustomEpisodesFeed().acall, AggregateEpisodesFeed().acall
+    archive_feed = ArchiveEpisodesFeed().acall
+    upload_view, batch_upload_view = aupload, abatch_upload
+else:
+    feed, custom_feed, aggregate_feed = EpisodesFeed(), CustomEpisodesFeed(), AggregateEpisodesFeed()
+    archive_feed = ArchiveEpisodesFeed()
+    upload_view, batch_upload_view = upload, batch_upload
 
 urlpatterns = [
-    path('<str:podcast>/rss', EpisodesFeed(), name='feed'),
-    path('<str:podcast>/upload', upload, name='upload'),
-    path('custom/<uuid:ref>', CustomEpisodesFeed(), name='custom_feed'),
+    path('<str:podcast>/rss', instrument('feed')(throttle('feed')(feed)), name='feed'),
+    path('<str:podcast>/archive/<int:page>', instrument('feed')(throttle('feed')(archive_feed)), name='archive_feed'),
+    path('<str:podcast>/upload', instrument('upload')(admit(upload_view)), name='upload'),
+    path('<str:podcast>/upload/batch', instrument('batch_upload')(admit(batch_upload_view)), name='batch_upload'),
+    path('api/podcasts', instrument('api_podcasts')(throttle('api')(api.podcasts)), name='api_podcasts'),
+    path('api/<str:podcast>/episodes', instrument('api_episodes')(throttle('api')(api.episodes)), name='api_episodes'),
+    path('api/search', instrument('api_search')(throttle('api')(api.search)), name='api_search'),
+    path('custom/<uuid:ref>', instrument('custom_feed')(throttle('feed')(custom_feed)), name='custom_feed'),
+    path(
+        'aggregate/<slug:slug>/rss',
+        instrument('aggregate_feed')(throttle('feed')(aggregate_feed)),
+        name='aggregate_feed',
+    ),
 ]
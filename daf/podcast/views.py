@@ -1,19 +1,67 @@
+import math
+import mimetypes
 from datetime import datetime
-from typing import Any, Dict, Iterable, List
+from io import StringIO
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.syndication.views import Feed
-from django.http import HttpResponse, JsonResponse
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import QuerySet
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.urls import reverse
 from django.utils.feedgenerator import Enclosure, Rss201rev2Feed
+from django.utils.http import http_date
+from django.utils.xmlutils import SimplerXMLGenerator
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_safe
 
-from .forms import EpisodeForm
-from .models import CustomFeed, Episode, Podcast
+from . import analytics, feedcache, media, metrics, selection
+from .forms import EpisodeForm, EpisodeFormSet
+from .models import AggregateFeed, CustomFeed, CustomFeedEpisode, Episode, Podcast, RemoteImage
+
+FEED_HISTORY_NS = 'http://purl.org/syndication/history/1.0'
 
 
 class ITunesFeed(Rss201rev2Feed):
-    """Extension to the RSS v2 feed class to add iTunes specific elements."""
+    """
+    Extension to the RSS v2 feed class to add iTunes specific elements.
+    Items are rendered separately, so they can be reused by other feeds as fragments.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # already rendered items to be written instead of self.items
+        self.fragments: Optional[List[str]] = None
+        self.last_build_date: Optional[datetime] = None
+
+    def latest_post_date(self) -> datetime:
+        return self.last_build_date or super().latest_post_date()
+
+    def item_fragment(self, item: Dict[str, Any]) -> str:
+        out = StringIO()
+        handler = SimplerXMLGenerator(out, 'utf-8', short_empty_elements=True)
+        handler.startElement('item', self.item_attributes(item))
+        self.add_item_elements(handler, item)
+        handler.endElement('item')
+        return out.getvalue()
+
+    def write_items(self, handler) -> None:
+        if self.fragments is None:
+            self.fragments = [self.item_fragment(item) for item in self.items]
+        for fragment in self.fragments:
+            # raw XML, it is already escaped
+            handler.ignorableWhitespace(fragment)
+
+    def rendered_items(self) -> Dict[int, Tuple[datetime, str]]:
+        """Rendered items by their GUIDs (episode IDs) with their dates, it is called after write()."""
+        return {
+            int(item['unique_id']): (max(d for d in (item['pubdate'], item['updateddate']) if d), fragment)
+            for item, fragment in zip(self.items, self.fragments or [])
+        }
 
     def rss_attributes(self):
         attrs = super().rss_attributes()
@@ -21,6 +69,8 @@ class ITunesFeed(Rss201rev2Feed):
             'xmlns:itunes': 'http://www.itunes.com/dtds/podcast-1.0.dtd',
             'xmlns:sy': 'http://purl.org/rss/1.0/modules/syndication/',
         })
+        if self.feed.get('archive'):
+            attrs['xmlns:fh'] = FEED_HISTORY_NS
         return attrs
 
     def _image(self, handler):
@@ -33,8 +83,8 @@ class ITunesFeed(Rss201rev2Feed):
     def add_root_elements(self, handler):
         super().add_root_elements(handler)
 
-        handler.addQuickElement('sy:updatePeriod', 'hourly')
-        handler.addQuickElement('sy:updateFrequency', '1')
+        handler.addQuickElement('sy:updatePeriod', self.feed['update_period'])
+        handler.addQuickElement('sy:updateFrequency', str(self.feed['update_frequency']))
 
         handler.addQuickElement('itunes:author', self.feed['author_name'])
         handler.addQuickElement('itunes:subtitle', self.feed['subtitle'])
@@ -46,6 +96,11 @@ class ITunesFeed(Rss201rev2Feed):
             attrs={'href': self.feed['image']},
         )
         self._image(handler)
+        # archived feed (RFC 5005) links of archived episodes
+        for rel, href in self.feed.get('pages', ()):
+            handler.addQuickElement('atom:link', None, {'rel': rel, 'href': href})
+        if self.feed.get('archive'):
+            handler.addQuickElement('fh:archive', '')
 
     def add_item_elements(self, handler, item):
         super().add_item_elements(handler, item)
@@ -58,11 +113,95 @@ class EpisodesFeed(Feed):
     """Main feed generator class."""
     feed_type = ITunesFeed
     language = settings.LANGUAGE_CODE
-    ttl = settings.PODCAST_TTL
+    # rendered items are cached with the feed to be reused by custom feeds
+    keep_items = True
+
+    def __call__(self, request, *args, **kwargs) -> HttpResponse:
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+
+        self.count_poll(request, obj)
+        key = self.cache_key(request, obj)
+        rendered = feedcache.get(key)
+        metrics.set_cache_hit(rendered is not None)
+
+        if rendered is None:
+            self.prefetch(request, obj)
+            rendered = self.render(request, obj)
+            feedcache.put(key, rendered)
+        return rendered.response(request)
+
+    async def acall(self, request, *args, **kwargs) -> HttpResponse:
+        """Native async version of the feed view, all queries and cache calls are awaited."""
+        try:
+            obj = await self.aget_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+
+        self.count_poll(request, obj)
+        key = self.cache_key(request, obj)
+        rendered = await feedcache.aget(key)
+        metrics.set_cache_hit(rendered is not None)
+
+        if rendered is None:
+            await self.aprefetch(request, obj)
+            rendered = self.render(request, obj)
+            await feedcache.aput(key, rendered)
+        return rendered.response(request)
+
+    def prefetch(self, request, obj: Podcast) -> None:
+        """Loads data of the feed before rendering, episodes are queried by items() by default."""
+
+    async def aprefetch(self, request, obj: Podcast) -> None:
+        """Loads data of the feed, so it is rendered without queries."""
+        obj._episodes = [item async for item in self.episodes(obj)]
+
+    def count_poll(self, request, obj: Podcast) -> None:
+        analytics.feed_poll(request, obj)
+
+    def version(self, obj: Podcast) -> datetime:
+        """
+        Time of the last change of the feed content, it is the cache key part and the Last-Modified value.
+        Podcast edits and changes of its episodes update it.
+        """
+        return obj.updated
+
+    def cache_key(self, request, obj: Podcast) -> str:
+        """Cache key of the rendered feed, podcast updates change it."""
+        return feedcache.cache_key(
+            'podcast', obj.slug, self.version(obj).isoformat(), request.scheme, request.get_host(),
+        )
+
+    def render(self, request, obj: Podcast) -> feedcache.RenderedFeed:
+        """Generates the feed XML and its compressed variants."""
+        feedgen = self.get_feed(obj, request)
+        fragments = getattr(obj, '_fragments', None)
+        if fragments is not None:
+            # already rendered items of other feed
+            feedgen.fragments = [fragment for _, fragment in fragments]
+            feedgen.last_build_date = max((date for date, _ in fragments), default=None)
+
+        content = feedgen.writeString('utf-8').encode('utf-8')
+        return feedcache.RenderedFeed.build(
+            content,
+            content_type=feedgen.content_type,
+            last_modified=http_date(self.version(obj).timestamp()),
+            max_age=obj.ttl * 60,
+            items=feedgen.rendered_items() if self.keep_items and fragments is None else None,
+        )
 
     def get_object(self, request, *args, **kwargs) -> Podcast:
-        obj = Podcast.objects.get(slug=kwargs.get('podcast'))
+        obj = Podcast.objects.select_related('artwork').get(slug=kwargs.get('podcast'))
+        obj.set_request(request)
+        metrics.set_podcast(obj.slug)
+        return obj
+
+    async def aget_object(self, request, *args, **kwargs) -> Podcast:
+        obj = await Podcast.objects.select_related('artwork').aget(slug=kwargs.get('podcast'))
         obj.set_request(request)
+        metrics.set_podcast(obj.slug)
         return obj
 
     def title(self, obj: Podcast) -> str:
@@ -83,6 +222,9 @@ class EpisodesFeed(Feed):
     def feed_guid(self, obj: Podcast) -> str:
         return obj.slug
 
+    def ttl(self, obj: Podcast) -> str:
+        return str(obj.ttl)
+
     def author_name(self, obj: Podcast) -> str:
         return obj.author
 
@@ -93,15 +235,31 @@ class EpisodesFeed(Feed):
         return {
             'image': obj.image_url,
             'keywords': obj.keywords,
+            'update_period': obj.update_period,
+            'update_frequency': obj.update_frequency,
+            'pages': self.pages(obj),
         }
 
+    def pages(self, obj: Podcast) -> List[Tuple[str, str]]:
+        """Relations and URLs of other pages of the feed, the podcast feed links its newest archive page."""
+        if not obj.archived_count:
+            return []
+        last = math.ceil(obj.archived_count / settings.PODCAST_ARCHIVE_PAGE_SIZE)
+        return [('prev-archive', obj.abs_url(reverse('archive_feed', args=[obj.slug, last])))]
+
+    def episodes(self, obj: Podcast) -> QuerySet[Episode]:
+        return obj.episode_set.filter(
+            published__isnull=False, archived__isnull=True,
+        ).select_related('podcast', 'artwork').order_by('-published', 'id')
+
     def items(self, obj: Podcast) -> Iterable[Episode]:
-        items = obj.episode_set.filter(
-            published__isnull=False,
-        ).select_related('podcast').order_by('-published')
+        # episodes can be already loaded by the async view
+        items = getattr(obj, '_episodes', None)
+        if items is None:
+            items = self.episodes(obj)
         for item in items:
-            item.audio_url = obj.abs_url(item.audio.url)
-            item.image_url = obj.abs_url(item.image.url) if item.image else item.public_image
+            item.audio_url = obj.abs_url(item.versioned_audio_url)
+            item.image_url = obj.item_image_url(item)
         return items
 
     def item_author_name(self, item: Episode) -> str:
@@ -117,9 +275,13 @@ class EpisodesFeed(Feed):
         return item.get_absolute_url()
 
     def item_enclosures(self, item: Episode) -> List[Enclosure]:
+        size = item.audio_size
+        if not size:
+            with metrics.timer('daf_file_stat_seconds'):
+                size = item.audio.size
         return [Enclosure(
             url=getattr(item, 'audio_url', ''),
-            length=str(item.audio.file.size),
+            length=str(size),
             mime_type=item.mime_type,
         )]
 
@@ -134,20 +296,238 @@ class EpisodesFeed(Feed):
 
 
 class CustomEpisodesFeed(EpisodesFeed):
-    """Custom feed generator class."""
+    """
+    Custom feed generator class. Items of the custom feed are taken from
+    the rendered podcast feed, only the channel elements are rendered.
+    """
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.custom_feed: CustomFeed | None = None
+    keep_items = False
+
+    # the feed instance is shared by concurrent requests,
+    # so the custom feed is kept in the podcast object
+
+    @staticmethod
+    def _podcast(custom_feed: CustomFeed, request) -> Podcast:
+        obj = custom_feed.podcast
+        obj.custom_feed = custom_feed
+        obj.set_request(request)
+        metrics.set_podcast(obj.slug)
+        return obj
+
+    def get_object(self, request, *args, **kwargs) -> Podcast:
+        custom_feed = CustomFeed.objects.select_related('podcast__artwork').get(ref=kwargs.get('ref'))
+        return self._podcast(custom_feed, request)
+
+    async def aget_object(self, request, *args, **kwargs) -> Podcast:
+        custom_feed = await CustomFeed.objects.select_related('podcast__artwork').aget(ref=kwargs.get('ref'))
+        return self._podcast(custom_feed, request)
+
+    def version(self, obj: Podcast) -> datetime:
+        return max(obj.updated, obj.custom_feed.updated)
+
+    def cache_key(self, request, obj: Podcast) -> str:
+        return feedcache.cache_key(
+            'custom', str(obj.custom_feed.ref), self.version(obj).isoformat(), request.scheme, request.get_host(),
+        )
+
+    def link(self, obj: Podcast) -> str:
+        return obj.custom_feed.get_absolute_url()
+
+    def pages(self, obj: Podcast) -> List[Tuple[str, str]]:
+        return []
+
+    def episodes(self, obj: Podcast) -> QuerySet[Episode]:
+        # episodes are already selected by the custom feed rules
+        custom_feed: CustomFeed = obj.custom_feed
+        episodes = Episode.objects.filter(
+            customfeedepisode__custom_feed=custom_feed,
+        ).select_related('podcast', 'artwork').order_by('-customfeedepisode__published', 'id')
+        return episodes[:custom_feed.max_items] if custom_feed.max_items else episodes
+
+    @staticmethod
+    def selected(obj: Podcast) -> QuerySet:
+        """IDs of the custom feed episodes in the feed order."""
+        custom_feed: CustomFeed = obj.custom_feed
+        ids = CustomFeedEpisode.objects.filter(
+            custom_feed=custom_feed,
+        ).order_by('-published', 'episode_id').values_list('episode_id', flat=True)
+        return ids[:custom_feed.max_items] if custom_feed.max_items else ids
+
+    @staticmethod
+    def _splice(obj: Podcast, podcast_feed: feedcache.RenderedFeed, selected: List[int]) -> bool:
+        """Takes rendered items of the podcast feed, False is returned if some of them are absent."""
+        if any(pk not in podcast_feed.items for pk in selected):
+            return False
+        obj._fragments = [podcast_feed.items[pk] for pk in selected]
+        obj._episodes = []
+        return True
+
+    def prefetch(self, request, obj: Podcast) -> None:
+        key = podcast_feed.cache_key(request, obj)
+        rendered = feedcache.get(key)
+        if rendered is None:
+            rendered = podcast_feed.render(request, obj)
+            feedcache.put(key, rendered)
+
+        if not self._splice(obj, rendered, list(self.selected(obj))):
+            obj._episodes = list(self.episodes(obj))
+
+    async def aprefetch(self, request, obj: Podcast) -> None:
+        key = podcast_feed.cache_key(request, obj)
+        rendered = await feedcache.aget(key)
+        if rendered is None:
+            await podcast_feed.aprefetch(request, obj)
+            rendered = podcast_feed.render(request, obj)
+            await feedcache.aput(key, rendered)
+
+        if not self._splice(obj, rendered, [pk async for pk in self.selected(obj)]):
+            await super().aprefetch(request, obj)
+
+
+# renders podcast feeds for custom feeds
+podcast_feed = EpisodesFeed()
+
+
+class ArchiveEpisodesFeed(EpisodesFeed):
+    """
+    Pages of archived episodes of a podcast. Pages are numbered from the oldest episodes,
+    so only the newest (last) page changes when episodes are archived, older pages are stable.
+    The podcast feed links the newest page, pages link each other, so clients can load the full history.
+    """
+
+    keep_items = False
+
+    @staticmethod
+    def _page(obj: Podcast, page: int) -> Podcast:
+        if not 1 <= page <= math.ceil(obj.archived_count / settings.PODCAST_ARCHIVE_PAGE_SIZE):
+            raise Podcast.DoesNotExist('Archive page does not exist.')
+        obj.page = page
+        return obj
 
     def get_object(self, request, *args, **kwargs) -> Podcast:
-        self.custom_feed = CustomFeed.objects.select_related('podcast').get(ref=kwargs.get('ref'))
-        obj = self.custom_feed.podcast
+        return self._page(super().get_object(request, *args, **kwargs), kwargs.get('page'))
+
+    async def aget_object(self, request, *args, **kwargs) -> Podcast:
+        return self._page(await super().aget_object(request, *args, **kwargs), kwargs.get('page'))
+
+    def count_poll(self, request, obj: Podcast) -> None:
+        pass  # archive pages are loaded once by clients, they are not polls
+
+    def cache_key(self, request, obj: Podcast) -> str:
+        return feedcache.cache_key(
+            'archive', obj.slug, str(obj.page), self.version(obj).isoformat(), request.scheme, request.get_host(),
+        )
+
+    def link(self, obj: Podcast) -> str:
+        return reverse('archive_feed', args=[obj.slug, obj.page])
+
+    def feed_extra_kwargs(self, obj: Podcast) -> Dict[str, Any]:
+        return {**super().feed_extra_kwargs(obj), 'archive': True}
+
+    def pages(self, obj: Podcast) -> List[Tuple[str, str]]:
+        last = math.ceil(obj.archived_count / settings.PODCAST_ARCHIVE_PAGE_SIZE)
+        pages = [('current', obj.abs_url(obj.get_absolute_url()))]
+        if obj.page > 1:
+            pages.append(('prev-archive', obj.abs_url(reverse('archive_feed', args=[obj.slug, obj.page - 1]))))
+        if obj.page < last:
+            pages.append(('next-archive', obj.abs_url(reverse('archive_feed', args=[obj.slug, obj.page + 1]))))
+        return pages
+
+    def episodes(self, obj: Podcast) -> QuerySet[Episode]:
+        # offsets of the page from the oldest episode in the newest first order of the published time index
+        size = settings.PODCAST_ARCHIVE_PAGE_SIZE
+        start, end = max(obj.archived_count - obj.page * size, 0), obj.archived_count - (obj.page - 1) * size
+        return obj.episode_set.filter(
+            published__isnull=False, archived__isnull=False,
+        ).select_related('podcast', 'artwork').order_by('-published', '-id')[start:end]
+
+
+class AggregateEpisodesFeed(EpisodesFeed):
+    """
+    Feed of the newest episodes of several podcasts.
+    Its version is the latest update of the aggregate feed and its podcasts,
+    polling hints are taken from the most frequently updated podcast.
+    """
+    HINTS_FIELDS = ('id', 'updated', 'ttl', 'update_period', 'update_frequency')
+    keep_items = False
+
+    @staticmethod
+    def _prepare(obj: AggregateFeed, podcasts: List[Podcast], request) -> AggregateFeed:
+        obj.podcast_ids = [p.pk for p in podcasts]
+        obj.version = max([obj.updated, *(p.updated for p in podcasts)])
+        hints = min(podcasts, key=lambda p: p.ttl, default=Podcast())
+        obj.ttl, obj.update_period, obj.update_frequency = hints.ttl, hints.update_period, hints.update_frequency
         obj.set_request(request)
         return obj
 
-    def link(self, _: Podcast) -> str:
-        return self.custom_feed.get_absolute_url() if self.custom_feed else ''
+    def get_object(self, request, *args, **kwargs) -> AggregateFeed:
+        obj = AggregateFeed.objects.select_related('artwork').get(slug=kwargs.get('slug'))
+        return self._prepare(obj, list(obj.podcasts.only(*self.HINTS_FIELDS)), request)
+
+    async def aget_object(self, request, *args, **kwargs) -> AggregateFeed:
+        obj = await AggregateFeed.objects.select_related('artwork').aget(slug=kwargs.get('slug'))
+        return self._prepare(obj, [p async for p in obj.podcasts.only(*self.HINTS_FIELDS)], request)
+
+    def count_poll(self, request, obj: AggregateFeed) -> None:
+        # feed polls are rows of one podcast or custom feed, aggregate feeds polls are not counted
+        pass
+
+    def version(self, obj: AggregateFeed) -> datetime:
+        return obj.version
+
+    def cache_key(self, request, obj: AggregateFeed) -> str:
+        return feedcache.cache_key(
+            'aggregate', obj.slug, self.version(obj).isoformat(), request.scheme, request.get_host(),
+        )
+
+    def pages(self, obj: AggregateFeed) -> List[Tuple[str, str]]:
+        return []
+
+    def episodes(self, obj: AggregateFeed) -> QuerySet[Episode]:
+        # one query limited by the newest items, it is served by the published time index
+        return Episode.objects.filter(
+            podcast_id__in=obj.podcast_ids, published__isnull=False, archived__isnull=True,
+        ).select_related('podcast', 'artwork').order_by('-published', 'id')[:obj.max_items]
+
+
+def _not_found() -> JsonResponse:
+    return JsonResponse(
+        {
+            'status': 'error',
+            'message': 'podcast does not exist',
+            'code': 'not_found',
+        },
+        status=404,
+    )
+
+
+def _validation_failed(form: EpisodeForm) -> JsonResponse:
+    errors = form.errors.get_json_data()
+    return JsonResponse(
+        {
+            'status': 'error',
+            'message': 'validation failed',
+            'code': 'invalid_data',
+            'fields': errors,
+        },
+        status=400,
+    )
+
+
+def _uploaded(episode: Episode) -> JsonResponse:
+    return JsonResponse({
+        'status': 'ok',
+        'message': f'episode "{episode.title}" was uploaded, id={episode.id}',
+        'code': 'success',
+    })
+
+
+def _save_upload(request, podcast: Podcast) -> JsonResponse:
+    """Parses the request body, validates and saves the episode, it is blocking work."""
+    form = EpisodeForm(request.POST, request.FILES, podcast=podcast)
+    if not form.is_valid():
+        return _validation_failed(form)
+    return _uploaded(form.save())
 
 
 @require_POST
@@ -157,30 +537,167 @@ def upload(request, podcast: str) -> HttpResponse:
     try:
         podcast = Podcast.objects.get(slug=podcast)
     except Podcast.DoesNotExist:
+        return _not_found()
+
+    metrics.set_podcast(podcast.slug)
+    return _save_upload(request, podcast)
+
+
+@require_POST
+@csrf_exempt  # method is to be protected by basic auth
+async def aupload(request, podcast: str) -> HttpResponse:
+    """
+    Native async version of the upload view.
+    ASGI handler has already received the request body without blocking a thread,
+    the multipart parsing, the form validation and files saving are done in a worker thread.
+    """
+    try:
+        podcast = await Podcast.objects.aget(slug=podcast)
+    except Podcast.DoesNotExist:
+        return _not_found()
+
+    metrics.set_podcast(podcast.slug)
+    return await sync_to_async(_save_upload)(request, podcast)
+
+
+def _save_batch(request, podcast: Podcast) -> JsonResponse:
+    """Validates all items and saves them in one transaction, nothing is saved if any item is invalid."""
+    formset = EpisodeFormSet(request.POST, request.FILES, prefix='items', form_kwargs={'podcast': podcast})
+    if not formset.is_valid():
+        items = [
+            {'index': i, 'status': 'error', 'fields': form.errors.get_json_data()} if form.errors
+            else {'index': i, 'status': 'valid'}
+            for i, form in enumerate(formset.forms)
+        ]
         return JsonResponse(
             {
                 'status': 'error',
-                'message': 'podcast does not exist',
-                'code': 'not_found',
-            },
-            status=404,
-        )
-    form = EpisodeForm(request.POST, request.FILES, podcast=podcast)
-    if not form.is_valid():
-        errors = form.errors.get_json_data()
-        return JsonResponse(
-            {
-                'status': 'error',
-                'message': 'validation failed',
+                'message': 'validation failed, nothing was uploaded',
                 'code': 'invalid_data',
-                'fields': errors,
+                'errors': [e.message for e in formset.non_form_errors().as_data()],
+                'items': items,
             },
             status=400,
         )
 
-    episode = form.save()
+    episodes = [form.save(commit=False) for form in formset.forms]
+    for episode in episodes:
+        episode.set_audio_size()
+        episode.set_file_hashes()
+    try:
+        # files are saved to the storage by bulk_create too
+        with transaction.atomic():
+            episodes = Episode.objects.bulk_create(episodes)
+            selection.update_episodes(episodes)
+    except Exception:
+        for episode in episodes:
+            for f in (episode.audio, episode.image):
+                if f and f._committed and f.storage.exists(f.name):
+                    f.storage.delete(f.name)
+        raise
+
+    # post_save signals are not sent by bulk_create
+    Podcast.objects.filter(pk=podcast.pk).touch()
     return JsonResponse({
         'status': 'ok',
-        'message': f'episode "{episode.title}" was uploaded, id={episode.id}',
+        'message': f'{len(episodes)} episodes were uploaded',
         'code': 'success',
+        'items': [
+            {'index': i, 'status': 'ok', 'id': episode.id, 'title': episode.title}
+            for i, episode in enumerate(episodes)
+        ],
     })
+
+
+@require_POST
+@csrf_exempt  # method is to be protected by basic auth
+def batch_upload(request, podcast: str) -> HttpResponse:
+    """
+    Uploads multiple episodes to a podcast in one transaction.
+    Items are sent as a formset with "items" prefix: items-TOTAL_FORMS, items-INITIAL_FORMS,
+    items-0-title, items-0-audio, items-1-title, items-1-audio...
+    """
+    try:
+        podcast = Podcast.objects.get(slug=podcast)
+    except Podcast.DoesNotExist:
+        return _not_found()
+
+    metrics.set_podcast(podcast.slug)
+    return _save_batch(request, podcast)
+
+
+@require_POST
+@csrf_exempt  # method is to be protected by basic auth
+async def abatch_upload(request, podcast: str) -> HttpResponse:
+    """Native async version of the batch upload view."""
+    try:
+        podcast = await Podcast.objects.aget(slug=podcast)
+    except Podcast.DoesNotExist:
+        return _not_found()
+
+    metrics.set_podcast(podcast.slug)
+    # request.POST and request.FILES parse the multipart body and write temporary files
+    return await sync_to_async(_save_batch)(request, podcast)
+
+
+def _serve_audio(request, name: str, digest: Optional[str] = None) -> HttpResponse:
+    field = Episode._meta.get_field('audio')
+    episode = Episode.objects.select_related('podcast').only(
+        'id', 'audio', 'audio_hash', 'audio_size', 'podcast__slug',
+    ).filter(audio=name).first()
+    # an object storage answers requests of missing files itself
+    if episode is None or (media.is_local(field.storage) and not field.storage.exists(episode.audio.name)):
+        raise Http404('Episode audio does not exist.')
+    if digest is not None and digest != episode.audio_hash:
+        # the file was replaced
+        return HttpResponseRedirect(episode.versioned_audio_url)
+
+    metrics.set_podcast(episode.podcast.slug)
+    response, sent = media.serve(request, episode.audio, episode.mime_type, episode.audio_size or None)
+    if request.method == 'GET' and sent:
+        analytics.download(episode.id, sent)
+    if digest and not isinstance(response, HttpResponseRedirect):
+        response.headers['Cache-Control'] = media.IMMUTABLE
+    return response
+
+
+@require_safe
+def audio(request, name: str, directory: str = 'episodes') -> HttpResponse:
+    """Serves an episode audio file and counts the download."""
+    return _serve_audio(request, f'{directory}/{name}')
+
+
+@require_safe
+def versioned_media(request, digest: str, name: str) -> HttpResponse:
+    """
+    Serves an audio file or an image by its content-versioned URL, so it is cached forever.
+    Audio downloads are counted, a URL with an outdated hash is redirected to the current one.
+    File bytes are sent by nginx, see PODCAST_MEDIA_ACCEL_REDIRECT.
+    """
+    if name.startswith(('episodes/', f'{settings.PODCAST_ARCHIVE_DIRECTORY}/')):
+        return _serve_audio(request, name, digest)
+
+    # image fields of all models are indexed, so every lookup is an index search
+    for model in (Podcast, Episode, AggregateFeed, RemoteImage):
+        if obj := model.objects.filter(image=name).only('id', 'image', 'image_hash').first():
+            break
+    else:
+        raise Http404('Image does not exist.')
+    storage = obj.image.storage
+    if media.is_local(storage) and not storage.exists(obj.image.name):
+        raise Http404('Image does not exist.')
+    if digest != obj.image_hash:
+        return HttpResponseRedirect(obj.versioned_image_url)
+
+    content_type = mimetypes.guess_type(obj.image.name)[0] or 'application/octet-stream'
+    response, _ = media.serve(request, obj.image, content_type)
+    if not isinstance(response, HttpResponseRedirect):
+        response.headers['Cache-Control'] = media.IMMUTABLE
+    return response
+
+
+@staff_member_required
+def metrics_export(request) -> HttpResponse:
+    """Application metrics in Prometheus text format."""
+    metrics.flush()
+    return HttpResponse(metrics.export(), content_type='text/plain; version=0.0.4; charset=utf-8')